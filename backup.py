@@ -0,0 +1,322 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import stat
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+#Files are split into fixed-size chunks; each distinct chunk is stored once
+CHUNK_SIZE = 4 * 1024 * 1024
+
+#zlib level used for stored chunks
+COMPRESS_LEVEL = 6
+
+#Worker processes compressing changed files (None = one per CPU)
+BACKUP_WORKERS = None
+
+#Bump when the snapshot format changes
+SNAPSHOT_VERSION = 1
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def chunk_path(store, digest):
+    return os.path.join(store, "chunks", digest[:2], digest)
+
+
+def _pack_file(path, store, chunk_size=CHUNK_SIZE, level=COMPRESS_LEVEL):
+    """
+    Worker: hash a file chunk by chunk and store the chunks the store doesn't
+    have yet. Runs in a pool process, so only the small result travels back.
+
+    Returns:
+        (chunk digests, whole-file sha256, bytes read, compressed bytes stored)
+    """
+    chunks = []
+    file_hash = hashlib.sha256()
+    read = stored = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            read += len(data)
+            file_hash.update(data)
+            digest = hashlib.sha256(data).hexdigest()
+            chunks.append(digest)
+            target = chunk_path(store, digest)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                packed = zlib.compress(data, level)
+                _atomic_write(target, packed)
+                stored += len(packed)
+    return chunks, file_hash.hexdigest(), read, stored
+
+
+def _walk(source):
+    """Return ([(relative path, stat)] for every regular file, sorted relative directory paths)."""
+    dirs = []
+    stack = [""]
+    files = []
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(source, rel) if rel else source) as it:
+                for entry in it:
+                    entry_rel = os.path.join(rel, entry.name)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry_rel)
+                            stack.append(entry_rel)
+                        elif entry.is_file(follow_symlinks=False):
+                            files.append((entry_rel, entry.stat(follow_symlinks=False)))
+                    except FileNotFoundError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+            print(f"Skipping {rel or source}: {e}")
+    return files, sorted(dirs)
+
+
+class BackupStore:
+    """
+    Incremental, content-addressed backup store.
+
+    Layout under `store`:
+        chunks/ab/<sha256>      zlib-compressed file chunks, each stored once
+        snapshots/<id>.json     restorable snapshot index (the file manifest)
+
+    A snapshot lists every file with its size, mtime, mode, whole-file hash
+    and chunk digests. The latest snapshot is the manifest for the next
+    backup: files whose size and mtime are unchanged reuse their chunk list
+    without being read, and only changed files are hashed and compressed,
+    on a process pool. Backup time therefore follows churn, not data size.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def snapshots_dir(self):
+        return os.path.join(self.store, "snapshots")
+
+    def list_snapshots(self):
+        """Snapshot ids, oldest first."""
+        try:
+            names = os.listdir(self.snapshots_dir())
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def load_snapshot(self, snapshot_id=None):
+        """Load a snapshot index (the latest when snapshot_id is None); None if there is none."""
+        if snapshot_id is None:
+            ids = self.list_snapshots()
+            if not ids:
+                return None
+            snapshot_id = ids[-1]
+        with open(os.path.join(self.snapshots_dir(), f"{snapshot_id}.json"), "r") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {snapshot_id} has unsupported version {snapshot.get('version')}")
+        return snapshot
+
+    def backup(self, source, workers=BACKUP_WORKERS, chunk_size=CHUNK_SIZE):
+        """
+        Take a new snapshot of source.
+
+        Returns:
+            dict: snapshot id and counts of files scanned/changed, bytes read and stored.
+        """
+        started = time.time()
+        os.makedirs(self.snapshots_dir(), exist_ok=True)
+        previous = self.load_snapshot()
+        old_files = previous["files"] if previous and previous.get("source") == os.path.abspath(source) else {}
+        files, dirs = _walk(source)
+
+        entries = {}
+        changed = []
+        for rel, st in files:
+            old = old_files.get(rel)
+            if old is not None and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                entries[rel] = dict(old, mode=stat.S_IMODE(st.st_mode))
+            else:
+                changed.append((rel, st))
+
+        read = stored = 0
+        unreadable = 0
+        if changed:
+            max_workers = min(workers or os.cpu_count() or 1, len(changed))
+            #Spawned, not forked: the scheduler calling this is multithreaded (see process_tier)
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {
+                    rel: (st, pool.submit(_pack_file, os.path.join(source, rel), self.store, chunk_size))
+                    for rel, st in changed
+                }
+                for rel, (st, future) in futures.items():
+                    try:
+                        chunks, digest, file_read, file_stored = future.result()
+                    except OSError as e:
+                        #A read error is not a deletion: keep the previous snapshot's copy if there is one
+                        unreadable += 1
+                        if rel in old_files:
+                            entries[rel] = old_files[rel]
+                            print(f"Could not read {rel} ({e}); keeping its copy from the previous snapshot")
+                        else:
+                            print(f"Skipping {rel}: {e}")
+                        continue
+                    read += file_read
+                    stored += file_stored
+                    entries[rel] = {
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "mode": stat.S_IMODE(st.st_mode),
+                        "sha256": digest,
+                        "chunks": chunks,
+                    }
+
+        snapshot_id = time.strftime("%Y%m%dT%H%M%S", time.localtime(started))
+        existing = set(self.list_snapshots())
+        suffix = 1
+        base_id = snapshot_id
+        while snapshot_id in existing:
+            snapshot_id = f"{base_id}-{suffix}"
+            suffix += 1
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "id": snapshot_id,
+            "created": started,
+            "source": os.path.abspath(source),
+            "chunk_size": chunk_size,
+            "dirs": dirs,
+            "files": entries,
+        }
+        _atomic_write(os.path.join(self.snapshots_dir(), f"{snapshot_id}.json"),
+                      json.dumps(snapshot).encode("utf-8"))
+        return {
+            "snapshot": snapshot_id,
+            "files": len(entries),
+            "changed": len(changed),
+            "removed": len(set(old_files) - set(entries)),
+            "unreadable": unreadable,
+            "bytes_read": read,
+            "bytes_stored": stored,
+            "seconds": time.time() - started,
+        }
+
+    def _read_chunk(self, digest):
+        with open(chunk_path(self.store, digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    def verify(self, snapshot_id=None):
+        """
+        Check that every chunk of a snapshot is present and intact and that each
+        file reassembles to its recorded hash.
+
+        Returns:
+            list of (path, problem) tuples; empty when the snapshot is sound.
+        """
+        snapshot = self.load_snapshot(snapshot_id)
+        if snapshot is None:
+            return [("", "no snapshots in store")]
+        problems = []
+        for rel, entry in sorted(snapshot["files"].items()):
+            file_hash = hashlib.sha256()
+            try:
+                for digest in entry["chunks"]:
+                    data = self._read_chunk(digest)
+                    file_hash.update(data)
+            except (OSError, ValueError, zlib.error) as e:
+                problems.append((rel, str(e)))
+                continue
+            if file_hash.hexdigest() != entry["sha256"]:
+                problems.append((rel, "content hash mismatch"))
+        return problems
+
+    def restore(self, target, snapshot_id=None):
+        """Recreate a snapshot's files, modes and mtimes under target. Returns the file count."""
+        snapshot = self.load_snapshot(snapshot_id)
+        if snapshot is None:
+            raise FileNotFoundError(f"No snapshots in {self.store}")
+        os.makedirs(target, exist_ok=True)
+        for rel in snapshot["dirs"]:
+            os.makedirs(os.path.join(target, rel), exist_ok=True)
+        for rel, entry in snapshot["files"].items():
+            path = os.path.join(target, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_hash = hashlib.sha256()
+            with open(path, "wb") as f:
+                for digest in entry["chunks"]:
+                    data = self._read_chunk(digest)
+                    file_hash.update(data)
+                    f.write(data)
+            if file_hash.hexdigest() != entry["sha256"]:
+                raise ValueError(f"Restored {rel} does not match its recorded hash")
+            os.chmod(path, entry["mode"])
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        return len(snapshot["files"])
+
+
+def run_backup(source, store, workers=BACKUP_WORKERS):
+    """Take an incremental snapshot of source into store and return its summary."""
+    return BackupStore(store).backup(source, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental content-addressed backups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("backup", help="Take a new snapshot")
+    p.add_argument("source")
+    p.add_argument("store")
+    p.add_argument("--workers", type=int, default=BACKUP_WORKERS)
+    p = sub.add_parser("list", help="List snapshots")
+    p.add_argument("store")
+    p = sub.add_parser("verify", help="Check a snapshot's chunks and file hashes")
+    p.add_argument("store")
+    p.add_argument("--snapshot", default=None, help="Snapshot id (default: latest)")
+    p = sub.add_parser("restore", help="Restore a snapshot into a directory")
+    p.add_argument("store")
+    p.add_argument("target")
+    p.add_argument("--snapshot", default=None, help="Snapshot id (default: latest)")
+    args = parser.parse_args(argv)
+
+    store = BackupStore(args.store)
+    if args.command == "backup":
+        print(json.dumps(store.backup(args.source, workers=args.workers), indent=4))
+    elif args.command == "list":
+        for snapshot_id in store.list_snapshots():
+            print(snapshot_id)
+    elif args.command == "verify":
+        problems = store.verify(args.snapshot)
+        for rel, problem in problems:
+            print(f"{rel}: {problem}")
+        print("Snapshot OK." if not problems else f"{len(problems)} problem(s) found.")
+        return 1 if problems else 0
+    elif args.command == "restore":
+        count = store.restore(args.target, args.snapshot)
+        print(f"Restored {count} files into {args.target}.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
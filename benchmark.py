@@ -0,0 +1,326 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import psutil
+import stats
+from dir_index import DirectorySnapshotIndex
+from histogram import LatencyHistogram
+from journal import RunJournal
+
+#Default load per scenario; --scale multiplies all of them
+UPDATE_STAT_RUNS = 200000
+UPDATE_STAT_JOBS = 1000
+LOG_JOB_RUNS = 50000
+FILE_EVENT_FILES = 2000
+TREE_DIRS = 200
+TREE_FILES_PER_DIR = 100
+BENCH_THREADS = 8
+
+#Seconds to wait for a burst of file events to be handled before giving up
+EVENT_TIMEOUT = 60
+
+#Relative change against the baseline that counts as a regression
+REGRESSION_TOLERANCE = 0.25
+
+#Each scenario runs this many times and the run with the median throughput is reported
+REPEAT = 3
+
+#Metrics compared against the baseline: name -> True if higher is better
+COMPARED = {"throughput": True, "p99": False, "rss_growth_mb": False}
+
+
+class Measurement:
+    """Collects per-operation latencies, and process memory/threads, for one scenario."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._rss_start = self._process.memory_info().rss
+        self.peak_threads = threading.active_count()
+        self.extra = {}
+
+    def record_all(self, latencies):
+        with self._lock:
+            for value in latencies:
+                self.latency.record(value)
+
+    def sample_threads(self):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def result(self, ops, seconds):
+        summary = self.latency.summary()
+        return dict({
+            "ops": ops,
+            "seconds": round(seconds, 4),
+            "throughput": round(ops / seconds, 1) if seconds > 0 else 0.0,
+            "p50": summary["p50"],
+            "p99": summary["p99"],
+            "rss_growth_mb": round((self._process.memory_info().rss - self._rss_start) / 1048576, 2),
+            "peak_threads": self.peak_threads,
+        }, **self.extra)
+
+
+def _run_threads(threads, target):
+    workers = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def _wait_idle(timeout=EVENT_TIMEOUT):
+    """Wait until the event dispatcher has no queued or running tasks."""
+    from dispatch import get_dispatcher
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        metrics = get_dispatcher().metrics()
+        if metrics["queue_depth"] == 0 and metrics["busy_workers"] == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@contextlib.contextmanager
+def _fresh_stats():
+    """Point update_stat() at a new, empty aggregator in the current directory for one scenario."""
+    old = stats.aggregator
+    stats.aggregator = stats.StatsAggregator(path="stats.json", journal=RunJournal(f"stats_journal_{time.monotonic_ns()}"))
+    try:
+        yield stats.aggregator
+    finally:
+        stats.aggregator.stop()
+        stats.aggregator = old
+
+
+def bench_update_stat(scale=1.0, threads=BENCH_THREADS):
+    """Concurrent job completions recorded with update_stat()."""
+    runs = max(int(UPDATE_STAT_RUNS * scale), threads)
+    per_thread = runs // threads
+    m = Measurement("update_stat")
+    with _fresh_stats():
+        def work(index):
+            latencies = []
+            for i in range(per_thread):
+                started = time.perf_counter()
+                stats.update_stat(f"bench_job_{(index * per_thread + i) % UPDATE_STAT_JOBS}", duration=0.01)
+                latencies.append(time.perf_counter() - started)
+            m.sample_threads()
+            m.record_all(latencies)
+        seconds = _run_threads(threads, work)
+        started = time.perf_counter()
+        stats.flush_stats()
+        m.extra["flush_seconds"] = round(time.perf_counter() - started, 4)
+        return m.result(per_thread * threads, seconds)
+
+
+def bench_log_job(scale=1.0, threads=BENCH_THREADS):
+    """Concurrent runs of a no-op job through the log_job decorator (logging + stats)."""
+    from job_logger import log_job, configure_logging, get_logging_metrics, LOG_POLICY_BLOCK
+    configure_logging(path="bench_jobs.log", policy=LOG_POLICY_BLOCK)
+    runs = max(int(LOG_JOB_RUNS * scale), threads)
+    per_thread = runs // threads
+    m = Measurement("log_job")
+
+    @log_job("bench_log_job", "Benchmark no-op job")
+    def noop():
+        pass
+
+    with _fresh_stats():
+        def work(index):
+            latencies = []
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                noop()
+                latencies.append(time.perf_counter() - started)
+            m.sample_threads()
+            m.record_all(latencies)
+        seconds = _run_threads(threads, work)
+        m.extra["log_dropped"] = get_logging_metrics().get("dropped", 0)
+        return m.result(per_thread * threads, seconds)
+
+
+def bench_file_events(scale=1.0, backend="auto"):
+    """A burst of file creations in a watched directory, timed from creation until the
+    file_created job for the file has finished (watcher -> handler -> dispatcher -> job)."""
+    from jobs import event_based
+    files = max(int(FILE_EVENT_FILES * scale), 1)
+    watched = os.path.abspath("watched_directory")
+    os.makedirs(watched, exist_ok=True)
+    m = Measurement("file_events")
+    created = {}
+    handled = {}
+    done = threading.Event()
+    original = event_based.file_created_event
+
+    def timed_created_event(event):
+        original(event)
+        handled[event.src_path] = time.perf_counter()
+        if len(handled) >= files:
+            done.set()
+
+    #The handler looks the job up on the module at dispatch time
+    event_based.file_created_event = timed_created_event
+    watcher = None
+    #The event jobs print every event; keep that out of the report
+    with _fresh_stats(), contextlib.redirect_stdout(io.StringIO()):
+        try:
+            watcher = event_based.start_file_watcher(watched, backend)
+            time.sleep(0.2)
+            started = time.perf_counter()
+            for i in range(files):
+                path = os.path.join(watched, f"bench_{i}.txt")
+                created[path] = time.perf_counter()
+                with open(path, "w") as f:
+                    f.write("x")
+            m.sample_threads()
+            done.wait(EVENT_TIMEOUT)
+            seconds = time.perf_counter() - started
+            m.sample_threads()
+        finally:
+            event_based.file_created_event = original
+            if watcher is not None:
+                event_based.stop_file_watcher(watcher)
+            #Coalesced modify events run after the burst; let them finish inside the work directory
+            _wait_idle()
+    m.record_all(handled[path] - created[path] for path in handled if path in created)
+    m.extra["backend"] = watcher.name if watcher is not None else backend
+    m.extra["missed"] = files - len(handled)
+    return m.result(len(handled), seconds)
+
+
+def bench_directory_poll(scale=1.0, rescans=5):
+    """Rescans of a large tree by the poll_directory_changes index: full scan, unchanged
+    rescans and a rescan after 1% of the files changed. Throughput is entries per second."""
+    dirs = max(int(TREE_DIRS * scale), 1)
+    root = os.path.abspath("tree")
+    for d in range(dirs):
+        directory = os.path.join(root, f"d{d:04d}")
+        os.makedirs(directory, exist_ok=True)
+        for f in range(TREE_FILES_PER_DIR):
+            with open(os.path.join(directory, f"f{f}.txt"), "w") as fh:
+                fh.write("x")
+    m = Measurement("directory_poll")
+    index = DirectorySnapshotIndex(root, state_path="bench_tree.idx")
+    started = time.perf_counter()
+    index.scan()
+    m.extra["full_scan_seconds"] = round(time.perf_counter() - started, 4)
+    entries = index.entry_count
+    latencies = []
+    for _ in range(rescans):
+        started = time.perf_counter()
+        index.scan()
+        latencies.append(time.perf_counter() - started)
+    #Change one file per directory (1% of the tree)
+    for d in range(dirs):
+        with open(os.path.join(root, f"d{d:04d}", "f0.txt"), "a") as fh:
+            fh.write("y")
+    started = time.perf_counter()
+    diff = index.scan()
+    m.extra["changed_scan_seconds"] = round(time.perf_counter() - started, 4)
+    m.extra["changed_detected"] = len(diff.modified)
+    started = time.perf_counter()
+    index.save()
+    m.extra["save_seconds"] = round(time.perf_counter() - started, 4)
+    m.extra["entries"] = entries
+    m.record_all(latencies)
+    m.sample_threads()
+    return m.result(entries * rescans, sum(latencies))
+
+
+SCENARIOS = {
+    "update_stat": bench_update_stat,
+    "log_job": bench_log_job,
+    "file_events": bench_file_events,
+    "directory_poll": bench_directory_poll,
+}
+
+
+def run_benchmarks(names=None, scale=1.0, repeat=REPEAT):
+    """Run the named scenarios (default: all), each repetition in a fresh temporary directory.
+    Returns {scenario: metrics of the repetition with the median throughput}."""
+    results = {}
+    cwd = os.getcwd()
+    for name in names or SCENARIOS:
+        runs = []
+        for _ in range(max(repeat, 1)):
+            with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+                os.chdir(workdir)
+                try:
+                    runs.append(SCENARIOS[name](scale))
+                finally:
+                    os.chdir(cwd)
+        runs.sort(key=lambda r: r["throughput"])
+        results[name] = runs[len(runs) // 2]
+        print(f"{name}: {results[name]}")
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Return [(scenario, metric, baseline, current, change)] for every compared metric that
+    got worse than the baseline by more than tolerance (relative)."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == "rss_growth_mb":
+                #Memory growth is noisy near zero; only judge it past a few MB
+                old = max(old, 8.0)
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stats, logging, event and polling hot paths")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the default load (e.g. 0.1 for a quick run)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"Runs per scenario; the median is reported (default {REPEAT})")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Write the results to FILE as the new baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a saved baseline; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help=f"Relative change that counts as a regression (default {REGRESSION_TOLERANCE})")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s) {', '.join(unknown)}")
+
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    results = run_benchmarks(args.scenarios or None, args.scale, args.repeat)
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=4)
+        print(f"Baseline saved to {save_path}")
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(f"Warning: baseline was recorded with --scale {baseline.get('scale')}, this run used {args.scale}")
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name}.{metric}: {old} -> {new} ({change:+.0%})")
+        print("No regressions against the baseline." if not regressions else f"{len(regressions)} regression(s).")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
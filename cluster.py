@@ -0,0 +1,131 @@
+import bisect
+import hashlib
+import threading
+from functools import wraps
+from job_state import JobStateStore, node_id
+
+#Seconds between heartbeats; each heartbeat also renews this node's run leases
+HEARTBEAT_INTERVAL = 2.0
+
+#A node that has not sent a heartbeat for this long is considered dead and its jobs move
+NODE_TTL = 10.0
+
+#Run leases expire this long after the last renewal, so a dead node's in-flight
+#runs are free to be taken over within NODE_TTL + LEASE_TTL seconds
+LEASE_TTL = 10.0
+
+#Points per node on the hash ring; more points give a more even spread of jobs
+RING_REPLICAS = 64
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of node ids. owner(key) returns the node owning a key;
+    when a node joins or leaves, only the keys on its arcs move.
+    """
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ClusterNode:
+    """
+    One scheduler process in a cluster sharing a JobStateStore.
+
+    Every node schedules every job, but a run only goes ahead on the node
+    that owns the job id on the consistent hash ring of live nodes, so runs
+    spread out as nodes are added. A heartbeat thread keeps this node in the
+    store's node table, refreshes its view of the live nodes and renews the
+    run leases it holds. When a node stops heartbeating, it drops out of the
+    ring after node_ttl and its leases expire after lease_ttl, so its jobs
+    are picked up by the remaining nodes within node_ttl + lease_ttl. While
+    the nodes' views of the ring briefly disagree, two nodes may both fire
+    a job: the run lease (taken by JobStateTracker) stops them overlapping,
+    and the claim on the run's scheduled fire time stops the later one
+    from running that scheduled time again after the first finished.
+
+    Use wrap() as a JobRegistry run wrapper, after the JobStateTracker's.
+    """
+
+    def __init__(self, store, node=None, heartbeat_interval=HEARTBEAT_INTERVAL, node_ttl=NODE_TTL,
+                 lease_ttl=LEASE_TTL, replicas=RING_REPLICAS):
+        self.store = store
+        self.node_id = node or node_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.node_ttl = node_ttl
+        self.lease_ttl = lease_ttl
+        self.replicas = replicas
+        self.ring = HashRing([self.node_id], replicas)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def heartbeat(self):
+        """Announce this node, renew its leases and refresh the ring. Returns the live node ids."""
+        self.store.heartbeat(self.node_id)
+        self.store.renew_leases(self.node_id, self.lease_ttl)
+        nodes = self.store.live_nodes(self.node_ttl)
+        if self.node_id not in nodes:
+            nodes.append(self.node_id)
+        with self._lock:
+            if sorted(nodes) != self.ring.nodes:
+                print(f"Cluster membership changed: {len(nodes)} live node(s).")
+                self.ring = HashRing(nodes, self.replicas)
+        return nodes
+
+    def owns(self, job_id):
+        with self._lock:
+            return self.ring.owner(job_id) == self.node_id
+
+    def wrap(self, spec, func):
+        job_id = spec.job_id
+
+        @wraps(func)
+        def run_if_owner(*args, **kwargs):
+            if not self.owns(job_id):
+                return None
+            return func(*args, **kwargs)
+        return run_if_owner
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Cluster heartbeat failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.heartbeat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cluster-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Leave the cluster: stop heartbeating and drop this node's row and leases so
+        the other nodes take its jobs over at their next heartbeat."""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.store.remove_node(self.node_id)
+
+
+def join_cluster(path, journal_mode="WAL"):
+    """Return a (not yet started) ClusterNode on the shared store at path."""
+    return ClusterNode(JobStateStore(path, journal_mode))
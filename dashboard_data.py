@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from collections import namedtuple
+import psutil
+from journal import RunJournal
+from sampler import read_samples_file, SAMPLES_FILE
+from stats import read_snapshot, snapshot_generation, STATS_FILE, WINDOW_MINUTES
+
+#Seconds between checks of stats.json and the journal; viewers refreshing within
+#this interval share the previous check
+MIN_REFRESH_INTERVAL = 1.0
+
+#A resource sample older than this means the scheduler's sampler is not running
+SAMPLE_MAX_AGE = 60
+
+#Stats keys of the four file event counters shown on the dashboard
+FILE_EVENT_KEYS = ("file_created", "file_modified", "file_deleted", "file_moved")
+
+CATEGORY_TIME = "Time-Based"
+CATEGORY_EVENT = "Event-Based"
+
+JobRow = namedtuple("JobRow", ["job", "category", "runs", "errors", "avg_duration", "p50", "p95", "p99"])
+
+
+def job_category(job_type):
+    """Keys starting with "time_based" are time-based jobs; every other key is event-based."""
+    return CATEGORY_TIME if job_type.startswith("time_based") else CATEGORY_EVENT
+
+
+class DashboardData:
+    """
+    Incrementally maintained view of the scheduler stats for the dashboard.
+
+    refresh() only goes back to disk when something changed: the run
+    records appended to the journal since the last refresh are read, and
+    when stats.json is rewritten (the scheduler compacts it every
+    FLUSH_INTERVAL) only the journal generation it covers is read from its
+    end. A compaction folds segments the view has already tailed, so the
+    snapshot itself is only re-read after a metrics reset, or when segments
+    were pruned before the view read them. Per-job rows and category totals
+    are then recomputed for the jobs the new records touched, so a refresh
+    costs O(changed jobs). `version` changes whenever the data did, so
+    callers can cache anything derived from it; listeners added with
+    add_listener() are told exactly which jobs changed. One instance is safe
+    to share between any number of viewers.
+    """
+
+    def __init__(self, stats_path=STATS_FILE, journal=None, samples_path=SAMPLES_FILE,
+                 window_minutes=WINDOW_MINUTES, min_refresh_interval=MIN_REFRESH_INTERVAL):
+        self.stats_path = stats_path
+        self.journal = journal if journal is not None else RunJournal()
+        self.samples_path = samples_path
+        self.window_minutes = window_minutes
+        self.min_refresh_interval = min_refresh_interval
+        self.version = 0
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._snapshot_signature = None
+        self._generation = 0
+        self._offsets = {}
+        self._totals = None
+        self._rows = {}
+        self._categories = {}
+        self._series_cache = {}
+        self._samples_signature = None
+        self._samples = []
+        self._listeners = []
+
+    def _signature(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload_snapshot(self):
+        """Catch up with a rewritten stats.json. Returns (jobs to recompute, reloaded)."""
+        signature = self._signature(self.stats_path)
+        if signature == self._snapshot_signature and self._totals is not None:
+            return set(), False
+        self._snapshot_signature = signature
+        if self._totals is not None:
+            changed = self._fold(snapshot_generation(self.stats_path))
+            if changed is not None:
+                return changed, False
+        self._totals, self._generation = read_snapshot(self.stats_path, self.window_minutes)
+        self._offsets = {}
+        self._rows = {}
+        self._categories = {}
+        return set(self._totals.counters), True
+
+    def _fold(self, generation):
+        """
+        A compaction folded the journal segments below `generation` into stats.json.
+        Those are segments this view tails, so instead of re-reading the snapshot it
+        applies what it has not read of them yet and moves its generation past them.
+        Returns the jobs touched, or None when stats.json must be reloaded: it was
+        rewritten without a compaction (a metrics reset), or one of the segments was
+        pruned before the view could finish reading it.
+        """
+        if generation <= self._generation:
+            return None
+        folded = range(self._generation, generation)
+        if not set(folded) <= set(self.journal.generations()):
+            return None
+        changed = set()
+        for segment in folded:
+            changed |= self._read_segment(segment)
+        #A segment pruned while it was being read may have been cut short
+        if not set(folded) <= set(self.journal.generations()):
+            return None
+        self._generation = generation
+        self._offsets = {segment: offset for segment, offset in self._offsets.items() if segment >= generation}
+        return changed
+
+    def _read_segment(self, generation):
+        """Apply the records appended to one journal segment since it was last read.
+        Returns the jobs they touched."""
+        changed = set()
+        records, offset = self.journal.read_from(generation, self._offsets.get(generation, 0))
+        self._offsets[generation] = offset
+        for record in records:
+            self._totals.apply_record(record)
+            changed.add(record.job_id)
+        return changed
+
+    def _read_journal_tail(self):
+        """Apply the journal records appended since the last refresh. Returns the jobs they touched."""
+        changed = set()
+        for generation in self.journal.generations():
+            if generation >= self._generation:
+                changed |= self._read_segment(generation)
+        return changed
+
+    def _update_row(self, job_type):
+        old = self._rows.get(job_type)
+        if old is not None:
+            totals = self._categories[old.category]
+            totals["runs"] -= old.runs
+            totals["errors"] -= old.errors
+        entry = self._totals.counters.get(job_type, {})
+        runs = entry.get("runs", 0)
+        errors = entry.get("errors", 0)
+        hist = self._totals.histograms.get(job_type)
+        latency = hist.summary() if hist is not None else {}
+        row = JobRow(job_type, job_category(job_type), runs, errors,
+                     entry.get("total_duration", 0.0) / runs if runs > 0 else 0,
+                     latency.get("p50", 0.0), latency.get("p95", 0.0), latency.get("p99", 0.0))
+        self._rows[job_type] = row
+        totals = self._categories.setdefault(row.category, {"runs": 0, "errors": 0})
+        totals["runs"] += runs
+        totals["errors"] += errors
+
+    def refresh(self, force=False):
+        """Bring the view up to date with disk. Returns the (possibly unchanged) version."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._totals is not None and now - self._checked < self.min_refresh_interval:
+                return self.version
+            self._checked = now
+            changed, reloaded = self._reload_snapshot()
+            changed |= self._read_journal_tail()
+            for job_type in changed:
+                self._update_row(job_type)
+            if changed or reloaded:
+                self.version += 1
+                self._series_cache = {}
+                for listener in self._listeners:
+                    listener(changed, reloaded)
+            return self.version
+
+    def add_listener(self, listener):
+        """Call listener(changed_jobs, reloaded) from refresh() whenever jobs changed; reloaded
+        means stats.json was re-read, so every job may have changed. Runs under the view's lock,
+        where totals() may be used."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def totals(self):
+        """The underlying stats totals (counters, histograms, windows). Read-only, and only
+        consistent while no refresh() is running (e.g. from a listener)."""
+        return self._totals
+
+    def job_rows(self):
+        """Per-job rows (runs, errors, average duration, p50/p95/p99), in stats key order."""
+        with self._lock:
+            return list(self._rows.values())
+
+    def top_jobs(self, n, key="runs"):
+        """The n rows with the largest `key` (a JobRow field)."""
+        rows = self.job_rows()
+        rows.sort(key=lambda row: getattr(row, key), reverse=True)
+        return rows[:n]
+
+    def category_totals(self):
+        """{category: {"runs", "errors"}} for time-based and event-based jobs."""
+        with self._lock:
+            return {category: dict(self._categories.get(category, {"runs": 0, "errors": 0}))
+                    for category in (CATEGORY_TIME, CATEGORY_EVENT)}
+
+    def file_events(self):
+        with self._lock:
+            return {key: self._rows[key].runs if key in self._rows else 0 for key in FILE_EVENT_KEYS}
+
+    def timeseries(self, minutes=60, now=None):
+        """Per-minute runs and errors summed per category, oldest first:
+        [{"time", "category", "runs", "errors"}]. Cached until the data or the minute changes."""
+        now = time.time() if now is None else now
+        key = (int(now // 60), minutes)
+        with self._lock:
+            cached = self._series_cache.get(key)
+            if cached is not None:
+                return cached
+            sums = {}
+            windows = self._totals.windows if self._totals is not None else {}
+            for job_type, window in windows.items():
+                category = job_category(job_type)
+                for point in window.series(now, minutes):
+                    bucket = sums.setdefault((point["time"], category), [0, 0])
+                    bucket[0] += point["runs"]
+                    bucket[1] += point["errors"]
+            series = [{"time": t, "category": category, "runs": runs, "errors": errors}
+                      for (t, category), (runs, errors) in sorted(sums.items())]
+            self._series_cache = {key: series}
+            return series
+
+    def resources(self):
+        """Latest CPU/memory/disk percentages. Comes from the scheduler's sampler file (re-read
+        only when it changes); without a recent sample, a non-blocking psutil reading."""
+        signature = self._signature(self.samples_path)
+        with self._lock:
+            if signature != self._samples_signature:
+                self._samples_signature = signature
+                self._samples = read_samples_file(self.samples_path)
+            latest = self._samples[-1] if self._samples else None
+        if latest is not None and time.time() - latest["time"] < SAMPLE_MAX_AGE:
+            return {"cpu": latest["cpu"], "memory": latest["memory"], "disk": latest["disk"]}
+        return {
+            "cpu": psutil.cpu_percent(interval=None),
+            "memory": psutil.virtual_memory().percent,
+            "disk": psutil.disk_usage('/').percent,
+        }
+
+
+_data = None
+_data_lock = threading.Lock()
+
+
+def get_dashboard_data():
+    """Return the process-wide dashboard data layer, shared by every viewer session."""
+    global _data
+    with _data_lock:
+        if _data is None:
+            _data = DashboardData()
+        return _data
@@ -1,11 +1,10 @@
 import streamlit as st
 import pandas as pd
-import json
 import networkx as nx
-#import time
+import time
 import plotly.express as px
-import psutil
 from streamlit_autorefresh import st_autorefresh
+from dashboard_data import get_dashboard_data, CATEGORY_TIME, CATEGORY_EVENT
 
 #Caching, Streamlit avoids recomputing graph layout on each rerun
 @st.cache_data(ttl=60)
@@ -28,14 +27,15 @@ st.set_page_config(layout="wide")
 st_autorefresh(interval=30000, limit=100, key="dashboard_refresh")
 
 
-def load_stats():
-    """Load the statistics from the stats.json file."""
-    try:
-        with open('stats.json', 'r') as f:
-            stats = json.load(f)
-    except Exception as e:
-        stats = {}
-    return stats
+#Per-job bar charts show only the busiest jobs (one bar and colour per job); the
+#summary table at the bottom still lists every job
+TOP_JOBS = 25
+
+
+@st.cache_resource
+def dashboard_data():
+    """The stats view shared by every viewer session (see dashboard_data.DashboardData)."""
+    return get_dashboard_data()
 
 
 st.title("Live Scheduler Dashboard")
@@ -45,136 +45,177 @@ This dashboard displays key quantitative metrics and analyses for the scheduler
 **Quantitative Measurements & Analyses:**
 1. **Total Runs per Job:** Number of times each job is executed.
 2. **Success vs. Failure Rates:** Successful executions versus errors.
-3. **Execution Duration:** Average duration per job.
+3. **Execution Duration:** Average duration per job, plus p50/p95/p99 tail latency.
 4. **Error Trends:** Number of errors per job.
 5. **Job Category Totals:** Aggregated totals for Time-Based vs. Event-Based jobs.
 6. **Resource Usage:** Current CPU, Memory, and Disk usage.
 7. **Event-Specific Metrics:** Counts for file creation, modification, deletion, and moves.
 8. **Statistical Summary:** A table of key metrics for each job.
+9. **Throughput & Error Rate:** Per-minute runs and error rate over the last hour.
 """)
 
-# Load stats from the JSON file
-stats = load_stats()
-
-# Initialize aggregated variables
-time_success = 0
-time_fail = 0
-event_success = 0
-event_fail = 0
-time_total = 0
-event_total = 0
-
-# Prepare lists for per-job metrics
-job_names = []
-job_runs = []
-job_errors = []
-job_avg_duration = []
-
-# Also, aggregate file event metrics
-file_created = stats.get("file_created", {}).get("runs", 0)
-file_modified = stats.get("file_modified", {}).get("runs", 0)
-file_deleted = stats.get("file_deleted", {}).get("runs", 0)
-file_moved = stats.get("file_moved", {}).get("runs", 0)
-
-# Process each job's stats
-for key, value in stats.items():
-    runs = value.get('runs', 0)
-    errors = value.get('errors', 0)
-    total_duration = value.get('total_duration', 0.0)
-    avg_duration = total_duration / runs if runs > 0 else 0
-    job_names.append(key)
-    job_runs.append(runs)
-    job_errors.append(errors)
-    job_avg_duration.append(avg_duration)
-
-    # Classify by job type: assume keys starting with "time_based" are time-based; others are event-based.
-    if key.startswith("time_based"):
-        time_success += (runs - errors)
-        time_fail += errors
-        time_total += runs
-    else:
-        event_success += (runs - errors)
-        event_fail += errors
-        event_total += runs
-
-# Chart 1: Bar Chart for Success vs. Failure Counts (aggregated)
-df_bar = pd.DataFrame({
-    'Job Category': ['Time-Based Successful', 'Time-Based Unsuccessful',
-                     'Event-Based Successful', 'Event-Based Unsuccessful'],
-    'Count': [time_success, time_fail, event_success, event_fail]
-})
+# Bring the shared stats view up to date: only what changed since the last refresh is read
+data = dashboard_data()
+version = data.refresh()
 
-bar_fig = px.bar(
-    df_bar,
-    x='Job Category',
-    y='Count',
-    text='Count',
-    color='Job Category',
-    title="Job Success vs. Failure Counts"
-)
-bar_fig.update_layout(xaxis_title="Job Category", yaxis_title="Count")
 
-# Chart 2: Pie Chart for Job Category Distribution
-df_pie = pd.DataFrame({
-    'Job Category': ['Time-Based Jobs', 'Event-Based Jobs'],
-    'Count': [time_total, event_total]
-})
-pie_fig = px.pie(
-    df_pie,
-    values='Count',
-    names='Job Category',
-    title="Job Category Distribution (%)"
-)
+#Job figures only depend on the stats, so every viewer reuses them until the data version changes
+@st.cache_data(max_entries=2)
+def build_job_figures(version, _data):
+    categories = _data.category_totals()
+    time_totals = categories[CATEGORY_TIME]
+    event_totals = categories[CATEGORY_EVENT]
+    time_success = time_totals["runs"] - time_totals["errors"]
+    time_fail = time_totals["errors"]
+    event_success = event_totals["runs"] - event_totals["errors"]
+    event_fail = event_totals["errors"]
+    time_total = time_totals["runs"]
+    event_total = event_totals["runs"]
 
-# Chart 3: Bar Chart for Average Execution Duration per Job
-df_duration = pd.DataFrame({
-    'Job': job_names,
-    'Avg Duration (s)': job_avg_duration
-})
-duration_fig = px.bar(
-    df_duration,
-    x='Job',
-    y='Avg Duration (s)',
-    text='Avg Duration (s)',
-    color='Job',
-    title="Average Execution Duration per Job (seconds)"
-)
-duration_fig.update_layout(xaxis_title="Job", yaxis_title="Avg Duration (s)")
+    # Per-job metrics of the busiest jobs, for the per-job charts
+    top = _data.top_jobs(TOP_JOBS)
+    job_names = [row.job for row in top]
+    job_runs = [row.runs for row in top]
+    job_errors = [row.errors for row in top]
+    job_avg_duration = [row.avg_duration for row in top]
+    job_p50 = [row.p50 for row in top]
+    job_p95 = [row.p95 for row in top]
+    job_p99 = [row.p99 for row in top]
 
-# Chart 4: Bar Chart for Error Counts per Job
-df_errors = pd.DataFrame({
-    'Job': job_names,
-    'Error Count': job_errors
-})
-error_fig = px.bar(
-    df_errors,
-    x='Job',
-    y='Error Count',
-    text='Error Count',
-    color='Job',
-    title="Error Counts per Job"
-)
-error_fig.update_layout(xaxis_title="Job", yaxis_title="Error Count")
+    file_events = _data.file_events()
+    file_created = file_events["file_created"]
+    file_modified = file_events["file_modified"]
+    file_deleted = file_events["file_deleted"]
+    file_moved = file_events["file_moved"]
 
-# Chart 5: Bar Chart for Total Runs per Job
-df_runs = pd.DataFrame({
-    'Job': job_names,
-    'Total Runs': job_runs
-})
-runs_fig = px.bar(
-    df_runs,
-    x='Job',
-    y='Total Runs',
-    text='Total Runs',
-    color='Job',
-    title="Total Runs per Job"
-)
-runs_fig.update_layout(xaxis_title="Job", yaxis_title="Total Runs")
+    # Chart 1: Bar Chart for Success vs. Failure Counts (aggregated)
+    df_bar = pd.DataFrame({
+        'Job Category': ['Time-Based Successful', 'Time-Based Unsuccessful',
+                         'Event-Based Successful', 'Event-Based Unsuccessful'],
+        'Count': [time_success, time_fail, event_success, event_fail]
+    })
+
+    bar_fig = px.bar(
+        df_bar,
+        x='Job Category',
+        y='Count',
+        text='Count',
+        color='Job Category',
+        title="Job Success vs. Failure Counts"
+    )
+    bar_fig.update_layout(xaxis_title="Job Category", yaxis_title="Count")
+
+    # Chart 2: Pie Chart for Job Category Distribution
+    df_pie = pd.DataFrame({
+        'Job Category': ['Time-Based Jobs', 'Event-Based Jobs'],
+        'Count': [time_total, event_total]
+    })
+    pie_fig = px.pie(
+        df_pie,
+        values='Count',
+        names='Job Category',
+        title="Job Category Distribution (%)"
+    )
 
-# Chart 6: Live Resource Usage (using psutil)
-cpu_usage = psutil.cpu_percent(interval=0.5)
-memory_usage = psutil.virtual_memory().percent
-disk_usage = psutil.disk_usage('/').percent
+    # Chart 3: Bar Chart for Average Execution Duration per Job
+    df_duration = pd.DataFrame({
+        'Job': job_names,
+        'Avg Duration (s)': job_avg_duration
+    })
+    duration_fig = px.bar(
+        df_duration,
+        x='Job',
+        y='Avg Duration (s)',
+        text='Avg Duration (s)',
+        color='Job',
+        title="Average Execution Duration per Job (seconds)"
+    )
+    duration_fig.update_layout(xaxis_title="Job", yaxis_title="Avg Duration (s)")
+
+    # Chart 3b: Grouped Bar Chart for Tail Latency per Job
+    df_latency = pd.DataFrame({
+        'Job': job_names,
+        'p50 (s)': job_p50,
+        'p95 (s)': job_p95,
+        'p99 (s)': job_p99
+    }).melt(id_vars='Job', var_name='Percentile', value_name='Latency (s)')
+    latency_fig = px.bar(
+        df_latency,
+        x='Job',
+        y='Latency (s)',
+        color='Percentile',
+        barmode='group',
+        title="Tail Latency per Job (seconds)"
+    )
+    latency_fig.update_layout(xaxis_title="Job", yaxis_title="Latency (s)")
+
+    # Chart 4: Bar Chart for Error Counts per Job
+    df_errors = pd.DataFrame({
+        'Job': job_names,
+        'Error Count': job_errors
+    })
+    error_fig = px.bar(
+        df_errors,
+        x='Job',
+        y='Error Count',
+        text='Error Count',
+        color='Job',
+        title="Error Counts per Job"
+    )
+    error_fig.update_layout(xaxis_title="Job", yaxis_title="Error Count")
+
+    # Chart 5: Bar Chart for Total Runs per Job
+    df_runs = pd.DataFrame({
+        'Job': job_names,
+        'Total Runs': job_runs
+    })
+    runs_fig = px.bar(
+        df_runs,
+        x='Job',
+        y='Total Runs',
+        text='Total Runs',
+        color='Job',
+        title="Total Runs per Job"
+    )
+    runs_fig.update_layout(xaxis_title="Job", yaxis_title="Total Runs")
+
+    # Chart 7: Bar Chart for File Event Metrics
+    df_file_events = pd.DataFrame({
+        'Event Type': ['File Created', 'File Modified', 'File Deleted', 'File Moved'],
+        'Count': [file_created, file_modified, file_deleted, file_moved]
+    })
+    file_event_fig = px.bar(
+        df_file_events,
+        x='Event Type',
+        y='Count',
+        text='Count',
+        color='Event Type',
+        title="File Event Metrics"
+    )
+    file_event_fig.update_layout(xaxis_title="File Event Type", yaxis_title="Count")
+
+    # Chart 9: Data Table for Per-Job Metrics
+    rows = _data.job_rows()
+    df_summary = pd.DataFrame({
+        'Job': [row.job for row in rows],
+        'Total Runs': [row.runs for row in rows],
+        'Errors': [row.errors for row in rows],
+        'Avg Duration (s)': [row.avg_duration for row in rows],
+        'p50 (s)': [row.p50 for row in rows],
+        'p95 (s)': [row.p95 for row in rows],
+        'p99 (s)': [row.p99 for row in rows]
+    })
+    return bar_fig, pie_fig, duration_fig, latency_fig, error_fig, runs_fig, file_event_fig, df_summary
+
+(bar_fig, pie_fig, duration_fig, latency_fig, error_fig, runs_fig, file_event_fig,
+ df_summary) = build_job_figures(version, data)
+
+# Chart 6: Live Resource Usage (latest sample written by the scheduler's resource sampler)
+#Never blocks: falls back to a non-blocking psutil reading when the scheduler isn't running
+resources = data.resources()
+cpu_usage = resources["cpu"]
+memory_usage = resources["memory"]
+disk_usage = resources["disk"]
 df_resource = pd.DataFrame({
     'Resource': ['CPU Usage', 'Memory Usage', 'Disk Usage'],
     'Usage (%)': [cpu_usage, memory_usage, disk_usage]
@@ -189,28 +230,37 @@ resource_fig = px.bar(
 )
 resource_fig.update_layout(xaxis_title="Resource", yaxis_title="Usage (%)")
 
-# Chart 7: Bar Chart for File Event Metrics
-df_file_events = pd.DataFrame({
-    'Event Type': ['File Created', 'File Modified', 'File Deleted', 'File Moved'],
-    'Count': [file_created, file_modified, file_deleted, file_moved]
-})
-file_event_fig = px.bar(
-    df_file_events,
-    x='Event Type',
-    y='Count',
-    text='Count',
-    color='Event Type',
-    title="File Event Metrics"
-)
-file_event_fig.update_layout(xaxis_title="File Event Type", yaxis_title="Count")
-
-# Chart 8: Data Table for Per-Job Metrics
-df_summary = pd.DataFrame({
-    'Job': job_names,
-    'Total Runs': job_runs,
-    'Errors': job_errors,
-    'Avg Duration (s)': job_avg_duration
-})
+# Chart 8: Per-minute throughput and error rate from the rolling window
+#Cached per data version and minute (the series are already summed per category by the data layer)
+@st.cache_data(max_entries=2)
+def build_timeseries_figures(version, minute, _data):
+    ts_rows = [{
+        'Time': pd.to_datetime(point['time'], unit='s'),
+        'Category': point['category'],
+        'Runs': point['runs'],
+        'Errors': point['errors']
+    } for point in _data.timeseries(minutes=60)]
+    df_ts = pd.DataFrame(ts_rows, columns=['Time', 'Category', 'Runs', 'Errors'])
+    df_ts['Error Rate (%)'] = (df_ts['Errors'] / df_ts['Runs'].where(df_ts['Runs'] > 0) * 100).fillna(0)
+    throughput_fig = px.line(
+        df_ts,
+        x='Time',
+        y='Runs',
+        color='Category',
+        title="Throughput (runs per minute)"
+    )
+    throughput_fig.update_layout(xaxis_title="Time", yaxis_title="Runs / min")
+    error_rate_fig = px.line(
+        df_ts,
+        x='Time',
+        y='Error Rate (%)',
+        color='Category',
+        title="Error Rate per Minute (%)"
+    )
+    error_rate_fig.update_layout(xaxis_title="Time", yaxis_title="Error Rate (%)")
+    return throughput_fig, error_rate_fig
+
+throughput_fig, error_rate_fig = build_timeseries_figures(version, int(time.time() // 60), data)
 
 # Arrange charts in grid: two per row
 
@@ -235,6 +285,16 @@ with col5:
 with col6:
     st.plotly_chart(resource_fig, use_container_width=True)
 
+st.markdown("## Tail Latency per Job")
+st.plotly_chart(latency_fig, use_container_width=True)
+
+st.markdown("## Throughput & Error Rate (last hour)")
+col7, col8 = st.columns(2)
+with col7:
+    st.plotly_chart(throughput_fig, use_container_width=True)
+with col8:
+    st.plotly_chart(error_rate_fig, use_container_width=True)
+
 st.markdown("## File Event Metrics")
 st.plotly_chart(file_event_fig, use_container_width=True)
 
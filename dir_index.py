@@ -0,0 +1,249 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from collections import namedtuple
+
+#Directory holding saved indexes. Will be created in project root
+DIR_INDEX_DIR = ".dir_index"
+
+#Memory budget: at most this many entries (~130 bytes each) are tracked one by one.
+#Subtrees that don't fit are tracked as (entry count, digest) and reported as one
+#modified path.
+MAX_ENTRIES = 250000
+
+#Bump when the saved format changes; older files are ignored
+INDEX_VERSION = 1
+
+IndexDiff = namedtuple("IndexDiff", ["added", "removed", "modified"])
+
+
+def _fingerprint(entry):
+    """Stable per-entry fingerprint from inode, mtime and size. Directories only use
+    the inode, so adding a file doesn't also report its parent as modified.
+    (hash() of a tuple of ints is not randomized, so this survives restarts.)"""
+    st = entry.stat(follow_symlinks=False)
+    if entry.is_dir(follow_symlinks=False):
+        return hash((st.st_ino, True)), True
+    return hash((st.st_ino, st.st_mtime_ns, st.st_size)), False
+
+
+def default_state_path(root):
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DIR_INDEX_DIR, f"{digest}.idx")
+
+
+class _Budget:
+    __slots__ = ("left",)
+
+    def __init__(self, left):
+        self.left = left
+
+
+class _OverBudget(Exception):
+    pass
+
+
+class DirectorySnapshotIndex:
+    """
+    Persistent snapshot of a directory tree keyed by inode/mtime/size.
+
+    scan() walks the tree with os.scandir, updates the index in place and
+    returns the names added, removed and modified since the previous scan.
+    The index can be saved to and loaded from disk, so a restarted process
+    only reports what actually changed while it was down. Memory is bounded
+    by max_entries: subtrees past the budget keep only a count and digest.
+    """
+
+    def __init__(self, root, recursive=True, state_path=None, max_entries=MAX_ENTRIES):
+        self.root = root
+        self.recursive = recursive
+        self.state_path = state_path or default_state_path(root)
+        self.max_entries = max_entries
+        self._dirs = None
+        self._summaries = {}
+
+    @property
+    def has_baseline(self):
+        return self._dirs is not None
+
+    @property
+    def entry_count(self):
+        return sum(len(names) for names in (self._dirs or {}).values())
+
+    def load(self):
+        """Load a saved index. Returns False if there is none (or it doesn't match)."""
+        try:
+            with open(self.state_path, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            #Unreadable, truncated or written by an incompatible version: rescan instead
+            return False
+        if not isinstance(data, dict):
+            return False
+        if data.get("version") != INDEX_VERSION or data.get("root") != os.path.abspath(self.root) \
+                or data.get("recursive") != self.recursive:
+            return False
+        self._dirs = data["dirs"]
+        self._summaries = data["summaries"]
+        return True
+
+    def save(self):
+        """Write the index to state_path with an atomic rename."""
+        if self._dirs is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".index-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({
+                    "version": INDEX_VERSION,
+                    "root": os.path.abspath(self.root),
+                    "recursive": self.recursive,
+                    "dirs": self._dirs,
+                    "summaries": self._summaries,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.state_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _scan_dir(self, rel, budget):
+        """Return ({name: fingerprint}, [child dir names]) for one directory."""
+        names = {}
+        subdirs = []
+        try:
+            with os.scandir(os.path.join(self.root, rel)) as it:
+                for entry in it:
+                    try:
+                        fingerprint, is_dir = _fingerprint(entry)
+                    except FileNotFoundError:
+                        continue
+                    budget.left -= 1
+                    if budget.left < 0:
+                        raise _OverBudget()
+                    names[entry.name] = fingerprint
+                    if is_dir and self.recursive:
+                        subdirs.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            pass
+        return names, subdirs
+
+    def _summarize(self, rel):
+        """Count and digest of a whole subtree, without keeping its entries."""
+        count = 0
+        digest = 0
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.root, current)) as it:
+                    for entry in it:
+                        try:
+                            fingerprint, is_dir = _fingerprint(entry)
+                        except FileNotFoundError:
+                            continue
+                        path = os.path.join(current, entry.name)
+                        count += 1
+                        path_hash = int.from_bytes(hashlib.blake2b(path.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "little")
+                        digest = (digest + hash((path_hash, fingerprint))) & 0xFFFFFFFFFFFFFFFF
+                        if is_dir and self.recursive:
+                            stack.append(path)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                pass
+        return count, digest
+
+    def _drop_subtree(self, rel):
+        prefix = os.path.join(rel, "")
+        for key in [key for key in self._dirs if key == rel or key.startswith(prefix)]:
+            del self._dirs[key]
+
+    def update(self, rels):
+        """
+        Re-read the given directories (relative to root) into the index without
+        reporting anything, for a caller that already saw the changes (e.g. as
+        inotify events): each directory's entries are replaced, subdirectories
+        that are gone are dropped with everything below them, and new ones are
+        read in full. Summarized subtrees are left to the next scan(), and the
+        memory budget is only enforced again there.
+        """
+        if self._dirs is None:
+            return
+        summarized = tuple(os.path.join(s, "") for s in self._summaries if s)
+        stack = list(rels)
+        while stack:
+            rel = stack.pop()
+            if "" in self._summaries or rel in self._summaries or os.path.join(rel, "").startswith(summarized):
+                continue
+            if not os.path.isdir(os.path.join(self.root, rel)):
+                self._drop_subtree(rel)
+                continue
+            names, subdirs = self._scan_dir(rel, _Budget(sys.maxsize))
+            old = self._dirs.get(rel, {})
+            self._dirs[rel] = names
+            subdirs = set(subdirs)
+            for name in old:
+                child = os.path.join(rel, name)
+                if name not in subdirs and child in self._dirs:
+                    self._drop_subtree(child)
+            stack.extend(os.path.join(rel, name) for name in subdirs if os.path.join(rel, name) not in self._dirs)
+
+    def scan(self):
+        """Walk the tree, update the index and return an IndexDiff. The first scan
+        without a loaded index only builds the baseline and reports nothing."""
+        baseline = self._dirs is None
+        old_dirs = self._dirs or {}
+        old_summaries = self._summaries
+        new_dirs = {}
+        new_summaries = {}
+        added, removed, modified = [], [], []
+        budget = _Budget(self.max_entries)
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            names = subdirs = None
+            if rel not in old_summaries:
+                saved_left = budget.left
+                try:
+                    names, subdirs = self._scan_dir(rel, budget)
+                except _OverBudget:
+                    budget.left = saved_left
+                    names = None
+            if names is None:
+                #Past the memory budget: track the whole subtree as one digest
+                budget.left = 0
+                summary = self._summarize(rel)
+                new_summaries[rel] = summary
+                previous = old_summaries.get(rel)
+                if previous is not None and previous != summary:
+                    modified.append(os.path.join(rel, ""))
+                continue
+            new_dirs[rel] = names
+            old = old_dirs.get(rel, {})
+            for name, fingerprint in names.items():
+                previous = old.get(name)
+                if previous is None:
+                    added.append(os.path.join(rel, name))
+                elif previous != fingerprint:
+                    modified.append(os.path.join(rel, name))
+            for name in old:
+                if name not in names:
+                    removed.append(os.path.join(rel, name))
+            stack.extend(os.path.join(rel, name) for name in sorted(subdirs, reverse=True))
+        #Directories that disappeared: every entry they held is gone too
+        #(unless they just moved under a summarized subtree)
+        summarized = tuple(os.path.join(s, "") for s in new_summaries if s)
+        for rel, old in old_dirs.items():
+            if rel in new_dirs or rel in new_summaries or "" in new_summaries or rel.startswith(summarized):
+                continue
+            removed.extend(os.path.join(rel, name) for name in old)
+        self._dirs = new_dirs
+        self._summaries = new_summaries
+        if baseline:
+            return IndexDiff([], [], [])
+        return IndexDiff(sorted(added), sorted(removed), sorted(modified))
@@ -0,0 +1,164 @@
+import collections
+import threading
+import time
+from histogram import LatencyHistogram
+
+#Backpressure policies for a full queue
+POLICY_BLOCK = "block"              # submitter waits until there is room
+POLICY_DROP_OLDEST = "drop_oldest"  # the oldest queued task is discarded
+POLICY_REJECT = "reject"            # the new task is refused
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_REJECT)
+
+#Defaults for the shared event dispatcher
+DISPATCH_WORKERS = 4
+DISPATCH_QUEUE_SIZE = 1000
+DISPATCH_POLICY = POLICY_BLOCK
+
+
+class DispatchRejected(Exception):
+    """Raised by submit() when the reject policy refuses a task."""
+
+
+class Dispatcher:
+    """
+    Bounded queue plus a fixed pool of worker threads for event jobs.
+
+    Event sources (the manual listener, the file watcher) submit callables
+    here instead of starting a thread each or running them inline, so a
+    spike of events uses at most `workers` threads. When the queue is full
+    the backpressure policy decides whether the submitter blocks, the oldest
+    task is dropped, or the new task is rejected. Queue depth and the time
+    tasks wait in the queue are tracked for monitoring.
+    """
+
+    def __init__(self, workers=DISPATCH_WORKERS, max_queue=DISPATCH_QUEUE_SIZE,
+                 policy=DISPATCH_POLICY, name="dispatch"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}, expected one of {POLICIES}")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.name = name
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+        self._busy = 0
+        self._wait_times = LatencyHistogram()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs). Returns False if the task was not queued
+        (dispatcher shut down); raises DispatchRejected under the reject policy."""
+        with self._cond:
+            if self._shutdown:
+                return False
+            if not self._threads:
+                self._start_workers()
+            while len(self._queue) >= self.max_queue:
+                if self.policy == POLICY_REJECT:
+                    self.rejected += 1
+                    raise DispatchRejected(f"{self.name} queue is full ({self.max_queue} tasks)")
+                if self.policy == POLICY_DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    continue
+                self._cond.wait()
+                if self._shutdown:
+                    return False
+            self._queue.append((time.monotonic(), func, args, kwargs))
+            self.submitted += 1
+            if len(self._queue) > self.max_depth:
+                self.max_depth = len(self._queue)
+            self._cond.notify_all()
+        return True
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._shutdown:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                enqueued, func, args, kwargs = self._queue.popleft()
+                self._wait_times.record(time.monotonic() - enqueued)
+                self._busy += 1
+                #Wake a submitter blocked on a full queue
+                self._cond.notify_all()
+            ok = True
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                #log_job has already logged and counted the error
+                ok = False
+                print(f"Dispatched task {getattr(func, '__name__', func)} failed: {e}")
+            with self._cond:
+                self._busy -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def metrics(self):
+        """Return queue depth, worker saturation, counters and queue wait percentiles (seconds)."""
+        with self._cond:
+            wait = self._wait_times.summary()
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_depth,
+                "queue_capacity": self.max_queue,
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "wait_p50": wait["p50"],
+                "wait_p95": wait["p95"],
+                "wait_p99": wait["p99"],
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting tasks; workers finish what is already queued."""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide event dispatcher, creating it on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher()
+        return _dispatcher
+
+
+def configure_dispatcher(workers=DISPATCH_WORKERS, max_queue=DISPATCH_QUEUE_SIZE, policy=DISPATCH_POLICY):
+    """Replace the process-wide dispatcher. Call before any events are submitted."""
+    global _dispatcher
+    with _dispatcher_lock:
+        old, _dispatcher = _dispatcher, Dispatcher(workers, max_queue, policy)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _dispatcher
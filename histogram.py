@@ -0,0 +1,107 @@
+import math
+
+#Bucket layout: SUB_BUCKETS log-spaced buckets per power of two, starting at
+#MIN_VALUE seconds. 320 buckets cover 1 microsecond up to roughly 12 days with
+#a relative error of at most ~9%. Histograms can only be merged if they share
+#the same layout, which is why the layout is stored alongside the counts.
+MIN_VALUE = 1e-6
+SUB_BUCKETS = 8
+BUCKET_COUNT = 320
+
+
+def bucket_index(value):
+    """Return the bucket a duration (in seconds) falls into."""
+    if value <= MIN_VALUE:
+        return 0
+    index = int(math.log2(value / MIN_VALUE) * SUB_BUCKETS) + 1
+    return min(index, BUCKET_COUNT - 1)
+
+
+def bucket_upper_bound(index):
+    """Return the largest duration (in seconds) counted in a bucket."""
+    return MIN_VALUE * 2 ** (index / SUB_BUCKETS)
+
+
+class LatencyHistogram:
+    """
+    Fixed-memory, log-bucketed latency histogram.
+
+    Memory does not grow with the number of recorded values, and two
+    histograms (from different threads, processes or time windows) can be
+    merged by adding their bucket counts.
+    """
+    __slots__ = ("counts", "count", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Add one duration (in seconds)."""
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add all values of another histogram into this one."""
+        if not other.count:
+            return self
+        counts = self.counts
+        for index, n in enumerate(other.counts):
+            if n:
+                counts[index] += n
+        self.count += other.count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        return self
+
+    def percentile(self, q):
+        """Return the q-th percentile (0-100) in seconds, or 0.0 if empty."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                #Clamp the bucket bound to what was actually observed
+                return min(max(bucket_upper_bound(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """Return the p50/p95/p99 latencies in seconds."""
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+    def to_dict(self):
+        """Serialize to a compact JSON-friendly dict (only non-empty buckets are stored)."""
+        return {
+            "min_value": MIN_VALUE,
+            "sub_buckets": SUB_BUCKETS,
+            "counts": [[index, n] for index, n in enumerate(self.counts) if n],
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram produced by to_dict(). Raises ValueError on a layout mismatch."""
+        if data.get("min_value") != MIN_VALUE or data.get("sub_buckets") != SUB_BUCKETS:
+            raise ValueError("histogram bucket layout does not match")
+        hist = cls()
+        for index, n in data.get("counts", []):
+            hist.counts[index] += n
+            hist.count += n
+        hist.min = data.get("min")
+        hist.max = data.get("max")
+        return hist
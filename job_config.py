@@ -0,0 +1,338 @@
+import importlib
+import json
+import os
+import threading
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from job_logger import registered_job_keys
+from job_registry import JobRegistry, DEFAULT_POLICIES
+from poller import get_poller
+
+#Declarative definition of the scheduled jobs and event sources. Lives in project root
+CONFIG_FILE = "jobs_config.json"
+
+#Seconds between checks of the config file for changes (hot reload)
+CONFIG_POLL_INTERVAL = 5
+
+TRIGGERS = {"interval": IntervalTrigger, "cron": CronTrigger, "date": DateTrigger}
+
+#Allowed keys of a job entry, and of each kind of event source (required keys have no default)
+JOB_FIELDS = {"id", "func", "trigger", "trigger_args", "priority", "max_instances", "coalesce",
+              "misfire_grace_time", "jitter", "process", "kwargs", "enabled"}
+SOURCE_FIELDS = {
+    "file_watcher": {"path": None, "backend": "auto"},
+    "directory": {"path": None, "interval": 10, "recursive": True},
+    "file_attributes": {"path": None, "interval": 10},
+    "disk_space": {"mount_point": None, "threshold": 10, "interval": 30},
+    "env_variable": {"name": None, "interval": 10},
+}
+
+
+class ConfigError(ValueError):
+    """Raised when the job config is malformed; the message names the offending entry."""
+
+
+def _resolve(ref, where):
+    module_name, _, attr = ref.partition(":")
+    if not module_name or not attr:
+        raise ConfigError(f"{where}: func must look like 'module:function', got {ref!r}")
+    try:
+        obj = importlib.import_module(module_name)
+        for part in attr.split("."):
+            obj = getattr(obj, part)
+    except (ImportError, AttributeError) as e:
+        raise ConfigError(f"{where}: cannot import {ref!r}: {e}")
+    if not callable(obj):
+        raise ConfigError(f"{where}: {ref!r} is not callable")
+    return obj
+
+
+def _check_type(value, types, where, name):
+    if not isinstance(value, types):
+        raise ConfigError(f"{where}: {name} has the wrong type ({type(value).__name__})")
+
+
+def _fingerprint(entry):
+    return json.dumps(entry, sort_keys=True)
+
+
+class SourceSpec:
+    """A validated event source: its kind, options (defaults filled in) and identity."""
+
+    def __init__(self, kind, options):
+        self.kind = kind
+        self.options = options
+        self.fingerprint = _fingerprint([kind, options])
+
+    @property
+    def source_id(self):
+        key = self.options.get("path") or self.options.get("mount_point") or self.options.get("name")
+        return f"{self.kind}:{key}"
+
+
+class CompiledConfig:
+    """
+    A validated config compiled into lookups: a JobRegistry indexed by job id,
+    event sources indexed by source id, and a fingerprint per entry so two
+    compiled configs can be diffed cheaply.
+    """
+
+    def __init__(self, registry, fingerprints, sources, executor_workers):
+        self.registry = registry
+        self.fingerprints = fingerprints
+        self.sources = sources
+        self.executor_workers = executor_workers
+
+    def stats_keys(self):
+        """Stats keys for the configured jobs, then every other job key imported alongside them."""
+        keys = [spec.func.job_key for spec in self.registry.specs() if hasattr(spec.func, "job_key")]
+        return list(dict.fromkeys(keys + registered_job_keys()))
+
+
+def compile_config(data):
+    """Validate a parsed config and compile it. Raises ConfigError on the first problem."""
+    if not isinstance(data, dict):
+        raise ConfigError("config must be a JSON object")
+    unknown = set(data) - {"executors", "jobs", "event_sources"}
+    if unknown:
+        raise ConfigError(f"unknown top-level keys: {sorted(unknown)}")
+
+    executor_workers = data.get("executors", {})
+    _check_type(executor_workers, dict, "executors", "executors")
+    for name, workers in executor_workers.items():
+        if name not in DEFAULT_POLICIES:
+            raise ConfigError(f"executors: unknown priority class {name!r}")
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            raise ConfigError(f"executors: {name} needs a positive worker count")
+
+    registry = JobRegistry(executor_workers)
+    fingerprints = {}
+    job_ids = set()
+    jobs = data.get("jobs", [])
+    _check_type(jobs, list, "jobs", "jobs")
+    for position, entry in enumerate(jobs):
+        where = f"jobs[{position}]"
+        _check_type(entry, dict, where, "job")
+        unknown = set(entry) - JOB_FIELDS
+        if unknown:
+            raise ConfigError(f"{where}: unknown keys {sorted(unknown)}")
+        job_id = entry.get("id")
+        if not isinstance(job_id, str) or not job_id:
+            raise ConfigError(f"{where}: id is required")
+        where = f"job {job_id!r}"
+        #Disabled entries count too, so enabling one later can't collide
+        if job_id in job_ids:
+            raise ConfigError(f"{where}: duplicate id")
+        job_ids.add(job_id)
+        if not entry.get("enabled", True):
+            continue
+        func = _resolve(entry.get("func", ""), where)
+        trigger = entry.get("trigger")
+        if trigger not in TRIGGERS:
+            raise ConfigError(f"{where}: trigger must be one of {sorted(TRIGGERS)}")
+        trigger_args = entry.get("trigger_args", {})
+        _check_type(trigger_args, dict, where, "trigger_args")
+        try:
+            TRIGGERS[trigger](**trigger_args)
+        except (TypeError, ValueError) as e:
+            raise ConfigError(f"{where}: invalid {trigger} trigger: {e}")
+        kwargs = entry.get("kwargs", {})
+        _check_type(kwargs, dict, where, "kwargs")
+        for name in ("max_instances", "misfire_grace_time", "jitter"):
+            value = entry.get(name)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ConfigError(f"{where}: {name} must be a non-negative integer")
+        for name in ("coalesce", "process"):
+            if name in entry and not isinstance(entry[name], bool):
+                raise ConfigError(f"{where}: {name} must be true or false")
+        try:
+            registry.register(
+                job_id, func, trigger,
+                priority=entry.get("priority", "standard"),
+                max_instances=entry.get("max_instances"),
+                coalesce=entry.get("coalesce"),
+                misfire_grace_time=entry.get("misfire_grace_time"),
+                jitter=entry.get("jitter"),
+                process=entry.get("process", False),
+                job_kwargs=kwargs,
+                **trigger_args)
+        except ValueError as e:
+            raise ConfigError(f"{where}: {e}")
+        fingerprints[job_id] = _fingerprint(entry)
+
+    sources = {}
+    event_sources = data.get("event_sources", {})
+    _check_type(event_sources, dict, "event_sources", "event_sources")
+    for kind, entries in event_sources.items():
+        if kind not in SOURCE_FIELDS:
+            raise ConfigError(f"event_sources: unknown kind {kind!r}, expected one of {sorted(SOURCE_FIELDS)}")
+        _check_type(entries, list, f"event_sources.{kind}", kind)
+        fields = SOURCE_FIELDS[kind]
+        for position, entry in enumerate(entries):
+            where = f"event_sources.{kind}[{position}]"
+            _check_type(entry, dict, where, "source")
+            unknown = set(entry) - set(fields)
+            if unknown:
+                raise ConfigError(f"{where}: unknown keys {sorted(unknown)}")
+            options = {}
+            for name, default in fields.items():
+                if name not in entry and default is None:
+                    raise ConfigError(f"{where}: {name} is required")
+                options[name] = entry.get(name, default)
+            source = SourceSpec(kind, options)
+            if source.source_id in sources:
+                raise ConfigError(f"{where}: duplicate source {source.source_id}")
+            sources[source.source_id] = source
+    return CompiledConfig(registry, fingerprints, sources, executor_workers)
+
+
+def load_config(path=CONFIG_FILE):
+    """Read, validate and compile a config file."""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except ValueError as e:
+        raise ConfigError(f"{path}: not valid JSON: {e}")
+    return compile_config(data)
+
+
+def configured_stats_keys(path=CONFIG_FILE):
+    """Stats keys for every job in the config file (used to build the stats.json baseline)."""
+    return load_config(path).stats_keys()
+
+
+class JobConfigManager:
+    """
+    Owns the running scheduler and event sources built from the job config,
+    and hot-reloads the config when the file changes.
+
+    A reload compiles the new file first; if it is invalid the running setup
+    is left untouched. Otherwise jobs and sources are diffed by fingerprint:
+    only added, removed or changed entries are touched. Removing or
+    replacing a job only affects future runs, so runs already in flight
+    finish normally and the process never restarts. Run wrappers passed in
+    are applied to every job, including those added by later reloads.
+    """
+
+    def __init__(self, path=CONFIG_FILE, engine=None, run_wrappers=None):
+        self.path = path
+        self.engine = engine
+        self.run_wrappers = list(run_wrappers or [])
+        self.config = None
+        self.scheduler = None
+        self._watchers = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _engine(self):
+        return self.engine or get_poller()
+
+    def _start_source(self, source):
+        #Imported here: the event jobs module pulls in the watcher backends
+        from jobs import event_based
+        o = source.options
+        if source.kind == "file_watcher":
+            self._watchers[source.source_id] = event_based.start_file_watcher(o["path"], o["backend"])
+        elif source.kind == "directory":
+            event_based.poll_directory_changes(o["path"], o["interval"], engine=self._engine(), recursive=o["recursive"])
+        elif source.kind == "file_attributes":
+            event_based.poll_file_attribute_changes(o["path"], o["interval"], engine=self._engine())
+        elif source.kind == "disk_space":
+            event_based.poll_disk_space(o["mount_point"], o["threshold"], o["interval"], engine=self._engine())
+        elif source.kind == "env_variable":
+            event_based.poll_env_variable_change(o["name"], o["interval"], engine=self._engine())
+
+    def _stop_source(self, source):
+        from jobs import event_based
+        if source.kind == "file_watcher":
+            watcher = self._watchers.pop(source.source_id, None)
+            if watcher is not None:
+                event_based.stop_file_watcher(watcher)
+            return
+        #poll_* targets are registered on the poller under "<prefix>:<key>"
+        prefix = {"directory": "dir", "file_attributes": "file", "disk_space": "disk", "env_variable": "env"}[source.kind]
+        key = source.source_id.split(":", 1)[1]
+        self._engine().unregister(f"{prefix}:{key}")
+
+    def watcher_metrics(self):
+        """Per file-watcher source: backend metrics plus the modify-event coalescer's counters."""
+        with self._lock:
+            watchers = dict(self._watchers)
+        return {source_id: dict(watcher.metrics(), **watcher.event_handler.coalescer.counters())
+                for source_id, watcher in watchers.items()}
+
+    def start(self):
+        """Load the config, create the scheduler with its jobs and start the event sources.
+        Returns the (not yet started) scheduler."""
+        with self._lock:
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self.config = load_config(self.path)
+            self.config.registry.run_wrappers = self.run_wrappers
+            self.scheduler = self.config.registry.create_scheduler()
+            for source in self.config.sources.values():
+                self._start_source(source)
+        return self.scheduler
+
+    def reload(self):
+        """Apply the config file's current contents. Returns a summary of what changed,
+        or None if the new config is invalid (the old one stays in force)."""
+        with self._lock:
+            try:
+                new = load_config(self.path)
+            except (OSError, ConfigError) as e:
+                print(f"Job config reload rejected, keeping the running config: {e}")
+                return None
+            old = self.config
+            if new.executor_workers != old.executor_workers:
+                print("Job config: executor sizes changed; they take effect on the next restart.")
+            new.registry.executor_workers = old.registry.executor_workers
+            new.registry.run_wrappers = self.run_wrappers
+            self.config = new
+            summary = {"added": [], "removed": [], "changed": [], "sources_added": [], "sources_removed": []}
+            for job_id in old.fingerprints:
+                if job_id not in new.fingerprints:
+                    try:
+                        self.scheduler.remove_job(job_id)
+                    except Exception:
+                        pass
+                    summary["removed"].append(job_id)
+            for job_id, fingerprint in new.fingerprints.items():
+                previous = old.fingerprints.get(job_id)
+                if previous == fingerprint:
+                    continue
+                new.registry.add_to(self.scheduler, new.registry.get(job_id))
+                summary["added" if previous is None else "changed"].append(job_id)
+            for source_id, source in old.sources.items():
+                current = new.sources.get(source_id)
+                if current is None or current.fingerprint != source.fingerprint:
+                    self._stop_source(source)
+                    summary["sources_removed"].append(source_id)
+            for source_id, source in new.sources.items():
+                previous = old.sources.get(source_id)
+                if previous is None or previous.fingerprint != source.fingerprint:
+                    self._start_source(source)
+                    summary["sources_added"].append(source_id)
+            print(f"Job config reloaded: {summary}")
+            return summary
+
+    def watch(self, interval=CONFIG_POLL_INTERVAL):
+        """Reload automatically whenever the config file's mtime changes (checked on the poller)."""
+        def check():
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            if mtime == self._mtime:
+                return None
+            self._mtime = mtime
+            return mtime
+
+        return self._engine().register(f"config:{self.path}", interval, check, lambda _: self.reload())
+
+    def stop(self):
+        """Stop the event sources this manager started (the scheduler is shut down by its owner)."""
+        with self._lock:
+            if self.config is not None:
+                for source in self.config.sources.values():
+                    self._stop_source(source)
@@ -1,58 +1,312 @@
+import atexit
+import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
+import threading
 import time
+from collections import deque
 from functools import wraps
+from histogram import LatencyHistogram
+from job_profiler import get_profiler
+from journal import check_job_id
 from stats import update_stat
 
+#Log file written by the async writer; rotated at midnight, 7 days kept
+LOG_FILE = "job_logs.log"
+LOG_BACKUP_COUNT = 7
+
+#Records buffered between the job threads and the writer thread
+LOG_QUEUE_SIZE = 10000
+
+#Most records the writer formats and writes per batch (one write + flush each)
+LOG_BATCH_SIZE = 256
+
+#What a job thread does when the buffer is full
+LOG_POLICY_BLOCK = "block"  # wait for the writer to make room
+LOG_POLICY_DROP = "drop"    # discard the record and count it
+LOG_POLICIES = (LOG_POLICY_BLOCK, LOG_POLICY_DROP)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message, plus any job fields
+    (job_key, phase, duration, file_type) passed through `extra`."""
+    FIELDS = ("job_key", "phase", "duration", "file_type")
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "created": record.created,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        return json.dumps(data)
+
+
+class BatchingFileHandler(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler that writes a whole batch of records with a
+    single write and flush, still rolling over at the right record."""
+
+    def write_batch(self, records):
+        self.acquire()
+        try:
+            lines = []
+            for record in records:
+                if self.shouldRollover(record):
+                    self._write_lines(lines)
+                    lines = []
+                    self.doRollover()
+                try:
+                    lines.append(self.format(record) + self.terminator)
+                except Exception:
+                    self.handleError(record)
+            self._write_lines(lines)
+        finally:
+            self.release()
+
+    def _write_lines(self, lines):
+        if not lines:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write("".join(lines))
+        self.stream.flush()
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Queue-backed handler: emit() only appends the record to a bounded buffer,
+    and a single writer thread formats and writes records in batches through
+    the target handler. Job threads never wait on the disk; when the buffer
+    is full the policy either blocks them or drops the record. Lag (time from
+    record creation to write) and drop counts are tracked for monitoring.
+    """
+
+    def __init__(self, target, max_queue=LOG_QUEUE_SIZE, policy=LOG_POLICY_BLOCK, batch_size=LOG_BATCH_SIZE):
+        super().__init__()
+        if policy not in LOG_POLICIES:
+            raise ValueError(f"Unknown log buffer policy {policy!r}, expected one of {LOG_POLICIES}")
+        self.target = target
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = batch_size
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._lag = LatencyHistogram()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self._thread = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        #Resolve the message now, like QueueHandler, so the writer never touches job objects
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+        except Exception:
+            self.handleError(record)
+            return
+        with self._cond:
+            while len(self._queue) >= self.max_queue and not self._closed:
+                if self.policy == LOG_POLICY_DROP:
+                    self.dropped += 1
+                    return
+                self._cond.wait()
+            if self._closed:
+                self.dropped += 1
+                return
+            self._queue.append(record)
+            if len(self._queue) > self.max_depth:
+                self.max_depth = len(self._queue)
+            self._cond.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                #Wake job threads blocked on a full buffer
+                self._cond.notify_all()
+            try:
+                if isinstance(self.target, BatchingFileHandler):
+                    self.target.write_batch(batch)
+                else:
+                    for record in batch:
+                        self.target.handle(record)
+            except Exception as e:
+                print(f"Log writer failed to write {len(batch)} record(s): {e}")
+            now = time.time()
+            with self._cond:
+                for record in batch:
+                    self._lag.record(max(now - record.created, 0.0))
+                self.last_lag = now - batch[0].created
+                self.written += len(batch)
+                self.batches += 1
+
+    def metrics(self):
+        """Return buffer depth, written/dropped counts and writer lag percentiles (seconds)."""
+        with self._cond:
+            lag = self._lag.summary()
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_depth,
+                "queue_capacity": self.max_queue,
+                "policy": self.policy,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "last_lag": self.last_lag,
+                "lag_p50": lag["p50"],
+                "lag_p95": lag["p95"],
+                "lag_p99": lag["p99"],
+            }
+
+    def close(self, timeout=None):
+        """Stop accepting records, let the writer drain the buffer, then close the file."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.target.close()
+        super().close()
+
+
+def _build_handler(path=LOG_FILE, json_lines=False, max_queue=LOG_QUEUE_SIZE, policy=LOG_POLICY_BLOCK):
+    target = BatchingFileHandler(path, when="midnight", interval=1, backupCount=LOG_BACKUP_COUNT, delay=True)
+    if json_lines:
+        target.setFormatter(JsonLinesFormatter())
+    else:
+        target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s: %(message)s"))
+    return AsyncLogHandler(target, max_queue=max_queue, policy=policy)
+
+
 # Create and configure a logger for the project
 logger = logging.getLogger("cron_project")
 logger.setLevel(logging.INFO)
 
-# Set up a TimedRotatingFileHandler: rotate at midnight, keep 1 days worth of logs (change as needed).
-if not any(isinstance(h, TimedRotatingFileHandler) for h in logger.handlers):
-    handler = TimedRotatingFileHandler(
-        "job_logs.log",
-        when="midnight",
-        interval=1,
-        backupCount=7
-    )
-    formatter = logging.Formatter("%(asctime)s %(levelname)s: %(message)s")
-    handler.setFormatter(formatter)
+# Records go through the async writer, which rotates the file at midnight and keeps 7 days of logs.
+if not any(isinstance(h, AsyncLogHandler) for h in logger.handlers):
+    handler = _build_handler()
     logger.addHandler(handler)
 
-def log_job(job_key, description, file_type=None):
+
+def _current_handler():
+    for h in logger.handlers:
+        if isinstance(h, AsyncLogHandler):
+            return h
+    return None
+
+
+def configure_logging(path=LOG_FILE, json_lines=False, max_queue=LOG_QUEUE_SIZE, policy=LOG_POLICY_BLOCK):
+    """
+    Replace the job log handler, e.g. to switch on JSON lines output or the drop policy.
+    The old handler is drained and closed first.
+    """
+    global handler
+    old = _current_handler()
+    if old is not None:
+        logger.removeHandler(old)
+        old.close()
+    handler = _build_handler(path, json_lines, max_queue, policy)
+    logger.addHandler(handler)
+    return handler
+
+
+def get_logging_metrics():
+    """Return the async writer's lag and dropped-record metrics (empty once shut down)."""
+    current = _current_handler()
+    return current.metrics() if current is not None else {}
+
+
+def shutdown_logging(timeout=10.0):
+    """Drain buffered records to disk and stop the writer thread."""
+    current = _current_handler()
+    if current is not None:
+        logger.removeHandler(current)
+        current.close(timeout)
+
+
+atexit.register(shutdown_logging)
+
+#Every job key declared with log_job in an imported module, with its description
+JOB_KEYS = {}
+
+
+def registered_job_keys():
+    """Job keys of all log_job-decorated jobs imported so far, in declaration order."""
+    return list(JOB_KEYS)
+
+
+def log_job(job_key, description, file_type=None, profile=None):
     """
     Decorator to log job execution details.
 
-    Wraps a job function so when it's called, it logs:
+    Wraps a job function so when it's called, it logs (through the async writer):
     1. Job start with a timestamp.
     2. Job end with the execution duration.
     3. Any exceptions that occur along with an error message.
-    Also updates the statistics for that job using update_stat()
+    Also records the run (start time, duration, outcome) using update_stat(),
+    which appends it to the stats run journal.
 
     Args:
-        job_key (str): Key used to update the job stats (should match the key in stats.json).
+        job_key (str): Key used to update the job stats (should match the key in stats.json);
+            at most 48 bytes, the longest id the run journal stores.
         description (str): Brief description of the job.
         file_type (str, optional): File type info if applicable.
+        profile (bool, optional): Profile every run (True) or never (False); by default runs
+            are profiled only once configure_profiling() switches it on (see job_profiler.py).
     """
 
+    #Rejected here, when the job is defined, rather than on its first run
+    check_job_id(job_key)
+    JOB_KEYS.setdefault(job_key, description)
+    profiler = get_profiler()
+
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            probe = profiler.begin(job_key, profile)
+            failed = False
             start_time = time.time()
-            logger.info(f"Job Started: {job_key} - {description} - File type: {file_type or 'N/A'}")
+            logger.info(f"Job Started: {job_key} - {description} - File type: {file_type or 'N/A'}",
+                        extra={"job_key": job_key, "phase": "start", "file_type": file_type})
             try:
                 result = func(*args, **kwargs)
                 elapsed = time.time() - start_time
-                logger.info(f"Job Finished: {job_key} - Completed in {elapsed:.2f} seconds")
+                logger.info(f"Job Finished: {job_key} - Completed in {elapsed:.2f} seconds",
+                            extra={"job_key": job_key, "phase": "finish", "duration": elapsed})
                 #Update stats with the duration and mark as successful (error=False)
-                update_stat(job_key, duration=elapsed, error=False)
+                update_stat(job_key, duration=elapsed, error=False, start_time=start_time)
                 return result
             except Exception as e:
+                failed = True
                 elapsed = time.time() - start_time
-                logger.error(f"Job Error: {job_key} - Error: {e} - Took {elapsed:.2f} seconds")
+                logger.error(f"Job Error: {job_key} - Error: {e} - Took {elapsed:.2f} seconds",
+                             extra={"job_key": job_key, "phase": "error", "duration": elapsed})
                 #Update stats with the duration and mark as having an error (error=True)
-                update_stat(job_key, duration=elapsed, error=True)
+                update_stat(job_key, duration=elapsed, error=True, start_time=start_time)
                 raise
+            finally:
+                #Closed after update_stat so waiting on stats.lock is part of the profile
+                if probe is not None:
+                    profiler.end(probe, failed)
+        #Kept so the job can be re-wrapped elsewhere, e.g. to run it in a worker process
+        wrapper.job_key = job_key
+        wrapper.description = description
+        wrapper.file_type = file_type
         return wrapper
     return decorator
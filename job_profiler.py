@@ -0,0 +1,383 @@
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#Directory holding the profile store. Will be created in project root
+PROFILE_DIR = "job_profiles"
+PROFILE_FILE = "profiles.jsonl"
+
+#The store rotates once it reaches this size, keeping one older file, so it never
+#takes more than twice this much disk
+PROFILE_STORE_BYTES = 5 * 1024 * 1024
+
+#Runs taking at least this long (seconds) are "slow": they keep their cProfile output
+#and stack samples
+SLOW_RUN_SECONDS = 10.0
+
+#Share of profiled runs that also run under cProfile (one at a time per process)
+CPROFILE_SAMPLE_RATE = 0.1
+
+#Functions kept from a slow run's cProfile output
+PROFILE_TOP_FUNCTIONS = 15
+
+#How often the stack sampler looks at runs past the slow threshold, the most samples
+#kept per run, and the frames kept per sample
+STACK_SAMPLE_INTERVAL = 0.5
+MAX_STACK_SAMPLES = 40
+STACK_DEPTH = 12
+
+#Fields of a profile record that the report can rank jobs by
+REPORT_FIELDS = ("wall", "cpu", "wait", "lock_wait", "children_cpu")
+
+_lock_wait = threading.local()
+
+
+class TimedLock:
+    """
+    Drop-in for threading.Lock that adds the time each thread spends blocked on it
+    to a per-thread counter, which profiled runs read before and after.
+    """
+
+    def __init__(self, lock=None):
+        self._lock = lock if lock is not None else threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        _lock_wait.total = getattr(_lock_wait, "total", 0.0) + time.perf_counter() - started
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def thread_lock_wait():
+    """Seconds the calling thread has spent waiting on TimedLocks so far."""
+    return getattr(_lock_wait, "total", 0.0)
+
+
+def _thread_usage():
+    """(user, system, voluntary switches, involuntary switches) of the calling thread."""
+    if resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return usage.ru_utime, usage.ru_stime, usage.ru_nvcsw, usage.ru_nivcsw
+    return time.thread_time(), 0.0, 0, 0
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RunProbe:
+    """Measurements taken at the start of one profiled run."""
+    __slots__ = ("job_key", "thread_id", "start", "wall", "usage", "children", "lock_wait", "profile", "stacks")
+
+    def __init__(self, job_key):
+        self.job_key = job_key
+        self.thread_id = threading.get_ident()
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.usage = _thread_usage()
+        self.children = _children_cpu()
+        self.lock_wait = thread_lock_wait()
+        self.profile = None
+        self.stacks = None
+
+
+class JobProfiler:
+    """
+    Opt-in per-run instrumentation for log_job.
+
+    A profiled run records wall time against the thread's own CPU time
+    (user/system, from RUSAGE_THREAD), context switches, CPU used by child
+    processes it waited for, and time spent blocked on the stats locks; whatever
+    is left of the wall time is waiting (I/O, sleeps, other locks). A share
+    of runs also runs under cProfile, and while a run is past the slow
+    threshold a sampler thread records its stack; both are kept only for
+    slow runs. Child CPU comes from RUSAGE_CHILDREN, which is process-wide,
+    so runs spawning processes at the same time share the blame.
+
+    Each profiled run is appended as one JSON line to a size-capped store.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, max_bytes=PROFILE_STORE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self.jobs = None
+        self.slow_threshold = SLOW_RUN_SECONDS
+        self.cprofile_rate = CPROFILE_SAMPLE_RATE
+        self.sample_stacks = True
+        self._active = {}
+        self._active_lock = threading.Lock()
+        self._cprofile_slot = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, PROFILE_FILE)
+
+    def configure(self, enabled=True, jobs=None, slow_threshold=None, cprofile_rate=None, sample_stacks=None):
+        self.enabled = enabled
+        self.jobs = set(jobs) if jobs else None
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if cprofile_rate is not None:
+            self.cprofile_rate = cprofile_rate
+        if sample_stacks is not None:
+            self.sample_stacks = sample_stacks
+        if enabled:
+            install_lock_timing()
+
+    def begin(self, job_key, force=None):
+        """Start profiling a run of job_key on this thread. Returns a probe, or None if the
+        run is not profiled (force=True/False overrides the configuration for this job)."""
+        if force is False or (force is None and (not self.enabled or (self.jobs is not None and job_key not in self.jobs))):
+            return None
+        probe = RunProbe(job_key)
+        if self.cprofile_rate and random.random() < self.cprofile_rate and self._cprofile_slot.acquire(False):
+            probe.profile = cProfile.Profile()
+            try:
+                probe.profile.enable()
+            except ValueError:
+                #Another profiler (e.g. a debugger) is already active
+                probe.profile = None
+                self._cprofile_slot.release()
+        if self.sample_stacks:
+            probe.stacks = {}
+            with self._active_lock:
+                self._active[probe.thread_id] = probe
+            self._start_sampler()
+        return probe
+
+    def end(self, probe, error=False):
+        """Finish a probe from begin() and store its record. Returns the record."""
+        wall = time.perf_counter() - probe.wall
+        user, system, voluntary, involuntary = _thread_usage()
+        if probe.profile is not None:
+            probe.profile.disable()
+            self._cprofile_slot.release()
+        if probe.stacks is not None:
+            with self._active_lock:
+                self._active.pop(probe.thread_id, None)
+        cpu = (user - probe.usage[0]) + (system - probe.usage[1])
+        lock_wait = thread_lock_wait() - probe.lock_wait
+        record = {
+            "job": probe.job_key,
+            "start": probe.start,
+            "wall": wall,
+            "cpu": cpu,
+            "user": user - probe.usage[0],
+            "system": system - probe.usage[1],
+            "wait": max(wall - cpu - lock_wait, 0.0),
+            "lock_wait": lock_wait,
+            "children_cpu": _children_cpu() - probe.children,
+            "voluntary_switches": voluntary - probe.usage[2],
+            "involuntary_switches": involuntary - probe.usage[3],
+            "error": bool(error),
+            "slow": wall >= self.slow_threshold,
+        }
+        if record["slow"] and probe.profile is not None:
+            out = io.StringIO()
+            pstats.Stats(probe.profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            record["cprofile"] = out.getvalue()
+        if probe.stacks:
+            record["stacks"] = sorted(([count, stack] for stack, count in probe.stacks.items()), reverse=True)
+        self._write(record)
+        return record
+
+    def _write(self, record):
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            except FileNotFoundError:
+                pass
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def _start_sampler(self):
+        with self._active_lock:
+            if self._sampler is not None:
+                return
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="job-stack-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._stop.wait(STACK_SAMPLE_INTERVAL):
+            now = time.perf_counter()
+            with self._active_lock:
+                slow = [p for p in self._active.values()
+                        if now - p.wall >= self.slow_threshold and sum(p.stacks.values()) < MAX_STACK_SAMPLES]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for probe in slow:
+                frame = frames.get(probe.thread_id)
+                if frame is None:
+                    continue
+                stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+                with self._active_lock:
+                    #The run may have finished meanwhile; its stacks are then already stored
+                    if self._active.get(probe.thread_id) is probe:
+                        probe.stacks[stack] = probe.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        """Stop the stack sampler thread (it restarts with the next sampled run)."""
+        self._stop.set()
+        with self._active_lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            sampler.join()
+
+    def records(self):
+        """Every stored record, oldest first (the rotated file first)."""
+        found = []
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            found.append(json.loads(line))
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                continue
+        return found
+
+
+def summarize(records, by="wall", top=10):
+    """Per-job totals of the records, ranked by the total of one REPORT_FIELDS field."""
+    jobs = {}
+    for record in records:
+        entry = jobs.setdefault(record["job"], dict({"job": record["job"], "runs": 0, "slow": 0, "errors": 0,
+                                                     "max_wall": 0.0}, **{field: 0.0 for field in REPORT_FIELDS}))
+        entry["runs"] += 1
+        entry["slow"] += record.get("slow", False)
+        entry["errors"] += record.get("error", False)
+        entry["max_wall"] = max(entry["max_wall"], record["wall"])
+        for field in REPORT_FIELDS:
+            entry[field] += record.get(field, 0.0)
+    return sorted(jobs.values(), key=lambda e: e[by], reverse=True)[:top]
+
+
+_lock_timing_installed = False
+
+
+def install_lock_timing():
+    """Swap stats.lock, and the shard locks update_stat() takes on the hot path, for
+    TimedLocks so profiled runs can report how long they waited on the stats locks."""
+    global _lock_timing_installed
+    import stats
+    if not _lock_timing_installed:
+        stats.lock = TimedLock(stats.lock)
+        for shard in stats.aggregator._shards:
+            shard.lock = TimedLock(shard.lock)
+        _lock_timing_installed = True
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide job profiler (disabled until configure_profiling())."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = JobProfiler()
+        return _profiler
+
+
+def configure_profiling(enabled=True, jobs=None, slow_threshold=None, cprofile_rate=None, sample_stacks=None):
+    """
+    Switch per-run profiling on (for every log_job job, or only the job keys in jobs).
+
+    Args:
+        enabled (bool): Profile runs of jobs that don't decide for themselves (log_job(profile=...)).
+        jobs (iterable of str, optional): Only profile these job keys.
+        slow_threshold (float, optional): Seconds after which a run counts as slow.
+        cprofile_rate (float, optional): Share of profiled runs that also run under cProfile (0 disables).
+        sample_stacks (bool, optional): Sample the stacks of runs past the slow threshold.
+    """
+    profiler = get_profiler()
+    profiler.configure(enabled, jobs, slow_threshold, cprofile_rate, sample_stacks)
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the jobs that cost the most, from the job profile store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("report", help="Top jobs by total wall, cpu, wait, lock_wait or children_cpu time")
+    p.add_argument("--by", choices=REPORT_FIELDS, default="wall")
+    p.add_argument("--top", type=int, default=10)
+    p.add_argument("--dir", default=PROFILE_DIR)
+    p = sub.add_parser("show", help="The latest slow run of a job, with its cProfile output and stacks")
+    p.add_argument("job")
+    p.add_argument("--dir", default=PROFILE_DIR)
+    args = parser.parse_args(argv)
+
+    records = JobProfiler(args.dir).records()
+    if args.command == "report":
+        rows = summarize(records, args.by, args.top)
+        if not rows:
+            print("No profiled runs recorded.")
+            return 0
+        print(f"{'job':<40} {'runs':>6} {'slow':>5} {'wall':>10} {'cpu':>10} {'wait':>10} {'lock':>10} {'child':>10} {'max':>9}")
+        for e in rows:
+            print(f"{e['job'][:40]:<40} {e['runs']:>6} {e['slow']:>5} {e['wall']:>10.3f} {e['cpu']:>10.3f} "
+                  f"{e['wait']:>10.3f} {e['lock_wait']:>10.3f} {e['children_cpu']:>10.3f} {e['max_wall']:>9.3f}")
+    elif args.command == "show":
+        slow = [r for r in records if r["job"] == args.job and r.get("slow")]
+        if not slow:
+            print(f"No slow runs of {args.job} recorded.")
+            return 1
+        record = slow[-1]
+        details = {k: v for k, v in record.items() if k not in ("cprofile", "stacks")}
+        print(json.dumps(details, indent=4))
+        if record.get("cprofile"):
+            print(record["cprofile"])
+        for count, stack in record.get("stacks", [])[:5]:
+            print(f"--- {count} sample(s) ---\n{stack}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,224 @@
+import contextlib
+import datetime
+import threading
+from functools import wraps
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from apscheduler.schedulers.background import BackgroundScheduler
+from process_tier import process_job
+
+#Priority classes: each one gets its own executor (thread pool), so long jobs in
+#one class can never occupy the workers of another
+PRIORITY_MONITOR = "monitor"    # short, frequent health/resource checks
+PRIORITY_STANDARD = "standard"  # routine maintenance
+PRIORITY_HEAVY = "heavy"        # long-running scans, updates and backups
+EXECUTOR_WORKERS = {
+    PRIORITY_MONITOR: 4,
+    PRIORITY_STANDARD: 4,
+    PRIORITY_HEAVY: 2,
+}
+
+#Default execution policy per priority class
+DEFAULT_POLICIES = {
+    PRIORITY_MONITOR: {"max_instances": 1, "coalesce": True, "misfire_grace_time": 30, "jitter": None},
+    PRIORITY_STANDARD: {"max_instances": 1, "coalesce": True, "misfire_grace_time": 300, "jitter": None},
+    PRIORITY_HEAVY: {"max_instances": 1, "coalesce": True, "misfire_grace_time": 3600, "jitter": 300},
+}
+
+#Runs executing right now, and worker counts, per executor. Kept at module level so
+#jobs added by registries from earlier config reloads are still counted
+_busy = dict.fromkeys(EXECUTOR_WORKERS, 0)
+_workers = dict(EXECUTOR_WORKERS)
+_busy_lock = threading.Lock()
+
+
+def _count_busy(executor, func):
+    @wraps(func)
+    def run_counted(*args, **kwargs):
+        with _busy_lock:
+            _busy[executor] = _busy.get(executor, 0) + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with _busy_lock:
+                _busy[executor] -= 1
+    return run_counted
+
+
+_run_context = threading.local()
+
+
+def scheduled_run_time():
+    """Scheduled fire time (aware datetime) of the job run executing on this thread, or None
+    outside a scheduled run."""
+    return getattr(_run_context, "run_time", None)
+
+
+@contextlib.contextmanager
+def scheduled_run(run_time):
+    """Make run_time the scheduled fire time of the job run on this thread (see scheduled_run_time())."""
+    previous = scheduled_run_time()
+    _run_context.run_time = run_time
+    try:
+        yield
+    finally:
+        _run_context.run_time = previous
+
+
+class _ScheduledJob:
+    """
+    Stand-in for a job on its way to APScheduler's run_job. Its func runs the job's func
+    inside scheduled_run() of the run time being executed: run_job goes through run_times
+    in order and skips the ones already past misfire_grace_time, so each call belongs to
+    the next run time that is not. Everything else is read from the job itself.
+    """
+
+    def __init__(self, job, run_times):
+        self._job = job
+        self._run_times = list(run_times)
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def __str__(self):
+        return str(self._job)
+
+    def _next_run_time(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        grace = self._job.misfire_grace_time
+        while self._run_times:
+            run_time = self._run_times.pop(0)
+            if not self._run_times or grace is None or now - run_time <= datetime.timedelta(seconds=grace):
+                return run_time
+        return None
+
+    def func(self, *args, **kwargs):
+        with scheduled_run(self._next_run_time()):
+            return self._job.func(*args, **kwargs)
+
+
+class RunTimeExecutor(ThreadPoolExecutor):
+    """Thread pool executor that lets run wrappers see which scheduled fire time the run
+    they wrap belongs to (scheduled_run_time()); APScheduler doesn't pass it to the job."""
+
+    def _do_submit_job(self, job, run_times):
+        super()._do_submit_job(_ScheduledJob(job, run_times), run_times)
+
+
+def executor_metrics():
+    """Return {executor: {"workers", "busy"}}: how saturated each priority class's pool is."""
+    with _busy_lock:
+        return {name: {"workers": workers, "busy": _busy.get(name, 0)} for name, workers in _workers.items()}
+
+
+class JobPolicy:
+    """
+    How one job may execute.
+
+    Args:
+        priority (str): Priority class; selects the executor the job runs on.
+        max_instances (int): Most runs of the job allowed at the same time.
+        coalesce (bool): Run once, not once per missed time, after the scheduler falls behind.
+        misfire_grace_time (int): Seconds a run may start late before it is skipped (and reported).
+        jitter (int): Random delay of up to this many seconds added to each run time.
+        process (bool): Run the job body on the warm process tier (for CPU-bound jobs);
+            logging and stats for the run still happen in the scheduler process.
+    """
+
+    def __init__(self, priority=PRIORITY_STANDARD, max_instances=None, coalesce=None,
+                 misfire_grace_time=None, jitter=None, process=False):
+        if priority not in DEFAULT_POLICIES:
+            raise ValueError(f"Unknown priority class {priority!r}, expected one of {tuple(DEFAULT_POLICIES)}")
+        defaults = DEFAULT_POLICIES[priority]
+        self.priority = priority
+        self.max_instances = defaults["max_instances"] if max_instances is None else max_instances
+        self.coalesce = defaults["coalesce"] if coalesce is None else coalesce
+        self.misfire_grace_time = defaults["misfire_grace_time"] if misfire_grace_time is None else misfire_grace_time
+        self.jitter = defaults["jitter"] if jitter is None else jitter
+        self.process = process
+
+    def job_kwargs(self):
+        """Keyword arguments for scheduler.add_job()."""
+        kwargs = {
+            "executor": self.priority,
+            "max_instances": self.max_instances,
+            "coalesce": self.coalesce,
+            "misfire_grace_time": self.misfire_grace_time,
+        }
+        if self.jitter:
+            kwargs["jitter"] = self.jitter
+        return kwargs
+
+
+class JobSpec:
+    """A job to schedule: the function, its trigger and its execution policy."""
+
+    def __init__(self, job_id, func, trigger, trigger_args, policy, job_kwargs=None):
+        self.job_id = job_id
+        self.func = func
+        self.trigger = trigger
+        self.trigger_args = trigger_args
+        self.policy = policy
+        self.job_kwargs = job_kwargs or {}
+
+
+class JobRegistry:
+    """
+    Declarative table of scheduled jobs and their execution policies.
+
+    register() records a job; create_scheduler() builds a BackgroundScheduler
+    with one executor per priority class and adds every registered job with
+    its policy. Jobs registered with process=True keep a scheduler thread only
+    to wait on the process tier, which runs their body. Run wrappers
+    (wrapper(spec, func) -> func) are applied around every job as it is added,
+    outermost last. Skipped misfires and runs refused by max_instances are
+    reported instead of passing silently.
+    """
+
+    def __init__(self, executor_workers=None, run_wrappers=None):
+        self.executor_workers = dict(EXECUTOR_WORKERS, **(executor_workers or {}))
+        self.run_wrappers = list(run_wrappers or [])
+        self._specs = {}
+
+    def register(self, job_id, func, trigger, priority=PRIORITY_STANDARD, max_instances=None, coalesce=None,
+                 misfire_grace_time=None, jitter=None, process=False, job_kwargs=None, **trigger_args):
+        policy = JobPolicy(priority, max_instances, coalesce, misfire_grace_time, jitter, process)
+        self._specs[job_id] = JobSpec(job_id, func, trigger, trigger_args, policy, job_kwargs)
+        return self._specs[job_id]
+
+    def specs(self):
+        return list(self._specs.values())
+
+    def get(self, job_id):
+        return self._specs.get(job_id)
+
+    def __contains__(self, job_id):
+        return job_id in self._specs
+
+    def executors(self):
+        with _busy_lock:
+            _workers.update(self.executor_workers)
+        return {name: RunTimeExecutor(workers) for name, workers in self.executor_workers.items()}
+
+    def add_to(self, scheduler, spec):
+        func = process_job(spec.func) if spec.policy.process else spec.func
+        for wrapper in self.run_wrappers:
+            func = wrapper(spec, func)
+        func = _count_busy(spec.policy.priority, func)
+        return scheduler.add_job(func, spec.trigger, id=spec.job_id, replace_existing=True, kwargs=spec.job_kwargs,
+                                 **spec.policy.job_kwargs(), **spec.trigger_args)
+
+    def create_scheduler(self):
+        """Return a BackgroundScheduler (not started) with every registered job added."""
+        scheduler = BackgroundScheduler(executors=self.executors())
+        scheduler.add_listener(_report_skipped_run, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        for spec in self._specs.values():
+            self.add_to(scheduler, spec)
+        return scheduler
+
+
+def _report_skipped_run(event):
+    if event.code == EVENT_JOB_MISSED:
+        print(f"Job {event.job_id} missed its run at {event.scheduled_run_time} (past its misfire grace time).")
+    else:
+        print(f"Job {event.job_id} skipped at {event.scheduled_run_time}: previous run still in progress.")
@@ -0,0 +1,431 @@
+import datetime
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from functools import wraps
+from apscheduler.events import EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, EVENT_JOB_SUBMITTED, EVENT_JOB_REMOVED
+from job_registry import scheduled_run, scheduled_run_time
+
+#SQLite file holding next-run times, last outcomes and run leases. Will be created in project root
+JOB_STATE_DB = "job_state.db"
+
+#Seconds a run lease stays valid; a run lasting longer should renew it
+LEASE_TTL = 3600
+
+#Missed runs older than this are not caught up after a restart
+MAX_CATCHUP_AGE = 24 * 3600
+
+#Most missed runs replayed per job (jobs with coalesce on replay at most one)
+MAX_CATCHUP_RUNS = 3
+
+#A job's catch-up runs are replayed one after another by a single one-off job with id
+#"<job_id>#catchup"
+CATCHUP_SEPARATOR = "#catchup"
+
+#Seconds between attempts of a catch-up run to take a lease held by a regular run
+LEASE_RETRY_INTERVAL = 1.0
+
+#Claimed fire times are kept this long, longer than any catch-up reaches back
+CLAIM_RETENTION = 2 * MAX_CATCHUP_AGE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_state (
+    job_id TEXT PRIMARY KEY,
+    next_run REAL,
+    last_run REAL,
+    last_duration REAL,
+    last_outcome TEXT,
+    last_error TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    acquired REAL NOT NULL,
+    expires REAL NOT NULL,
+    token TEXT,
+    fire_time REAL
+);
+CREATE TABLE IF NOT EXISTS claims (
+    job_id TEXT NOT NULL,
+    fire_time REAL NOT NULL,
+    owner TEXT NOT NULL,
+    claimed REAL NOT NULL,
+    PRIMARY KEY (job_id, fire_time)
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+#Lease columns added after the first release: (name, type)
+LEASE_COLUMNS = (("token", "TEXT"), ("fire_time", "REAL"))
+
+
+def node_id():
+    """Identity of this scheduler process: host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner):
+    """False if the owner is a process on this host that no longer exists."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStateStore:
+    """
+    Persistent per-job state in SQLite (WAL mode).
+
+    Holds each job's next scheduled run, its last run's time, duration and
+    outcome, a lease row while a run is in progress, and the scheduled fire
+    times runs have claimed (so one scheduled time never runs twice). Connections are
+    opened per thread on first use and rows are only read when asked for,
+    so opening the store costs nothing at startup. WAL lets the dashboard
+    or other processes read while the scheduler writes; a store shared over
+    a network filesystem needs journal_mode="DELETE", as WAL relies on
+    shared memory. Several schedulers can share one store (see cluster.py),
+    which is why it also keeps a heartbeat row per scheduler node.
+    """
+
+    def __init__(self, path=JOB_STATE_DB, journal_mode="WAL"):
+        self.path = path
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    #Stores created by older versions lack the newer lease columns
+                    columns = [row[1] for row in conn.execute("PRAGMA table_info(leases)")]
+                    for name, kind in LEASE_COLUMNS:
+                        if name not in columns:
+                            conn.execute(f"ALTER TABLE leases ADD COLUMN {name} {kind}")
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def set_next_run(self, job_id, next_run):
+        self._conn().execute(
+            "INSERT INTO job_state (job_id, next_run, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET next_run = excluded.next_run, updated = excluded.updated",
+            (job_id, next_run, time.time()))
+
+    def record_outcome(self, job_id, run_time, duration, error=None):
+        self._conn().execute(
+            "INSERT INTO job_state (job_id, last_run, last_duration, last_outcome, last_error, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(job_id) DO UPDATE SET last_run = excluded.last_run, "
+            "last_duration = excluded.last_duration, last_outcome = excluded.last_outcome, "
+            "last_error = excluded.last_error, updated = excluded.updated",
+            (job_id, run_time, duration, "error" if error else "success", error, time.time()))
+
+    def forget(self, job_id):
+        self._conn().execute("DELETE FROM job_state WHERE job_id = ?", (job_id,))
+
+    def get(self, job_id):
+        """Return one job's state as a dict, or None."""
+        cursor = self._conn().execute("SELECT * FROM job_state WHERE job_id = ?", (job_id,))
+        row = cursor.fetchone()
+        return dict(zip([c[0] for c in cursor.description], row)) if row else None
+
+    def states(self):
+        cursor = self._conn().execute("SELECT * FROM job_state ORDER BY job_id")
+        names = [c[0] for c in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def acquire_lease(self, job_id, owner, ttl=LEASE_TTL, now=None):
+        """Take the run lease for one run of job_id, unless any run (of any owner, this one
+        included) holds an unexpired lease from a live process. Returns the run's lease
+        token, which release_lease() needs, or None."""
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires FROM leases WHERE job_id = ?", (job_id,)).fetchone()
+            if row is not None and row[1] > now and owner_alive(row[0]):
+                conn.execute("COMMIT")
+                return None
+            token = uuid.uuid4().hex
+            conn.execute("INSERT OR REPLACE INTO leases (job_id, owner, acquired, expires, token) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, owner, now, now + ttl, token))
+            conn.execute("COMMIT")
+            return token
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim_fire_time(self, job_id, fire_time, owner, token, same_run=None, now=None):
+        """Record that the run holding lease `token` is job_id's run scheduled at fire_time
+        (epoch seconds). Returns False, recording nothing, if a run of that scheduled time
+        was already claimed by any owner. same_run(earlier, later) tells whether two fire
+        times belong to the same scheduled run (default: only when equal)."""
+        now = time.time() if now is None else now
+        same_run = same_run or (lambda earlier, later: earlier == later)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.execute("SELECT MAX(fire_time) FROM claims WHERE job_id = ? AND fire_time <= ?",
+                                  (job_id, fire_time)).fetchone()[0]
+            after = conn.execute("SELECT MIN(fire_time) FROM claims WHERE job_id = ? AND fire_time > ?",
+                                 (job_id, fire_time)).fetchone()[0]
+            if (before is not None and same_run(before, fire_time)) or (after is not None and same_run(fire_time, after)):
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT INTO claims (job_id, fire_time, owner, claimed) VALUES (?, ?, ?, ?)",
+                         (job_id, fire_time, owner, now))
+            conn.execute("UPDATE leases SET fire_time = ? WHERE job_id = ? AND token = ?", (fire_time, job_id, token))
+            conn.execute("DELETE FROM claims WHERE job_id = ? AND claimed < ?", (job_id, now - CLAIM_RETENTION))
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release_claim(self, job_id, fire_time):
+        """Forget a claimed fire time, so an interrupted run of it can be replayed."""
+        self._conn().execute("DELETE FROM claims WHERE job_id = ? AND fire_time = ?", (job_id, fire_time))
+
+    def renew_leases(self, owner, ttl=LEASE_TTL, now=None):
+        """Extend every lease held by owner to now + ttl. Returns the number renewed."""
+        now = time.time() if now is None else now
+        return self._conn().execute("UPDATE leases SET expires = ? WHERE owner = ?", (now + ttl, owner)).rowcount
+
+    def release_lease(self, job_id, token):
+        """Release the lease of the run holding token (a lease taken over since is kept)."""
+        self._conn().execute("DELETE FROM leases WHERE job_id = ? AND token = ?", (job_id, token))
+
+    def leases(self):
+        cursor = self._conn().execute("SELECT job_id, owner, acquired, expires, fire_time FROM leases ORDER BY job_id")
+        return [dict(zip(("job_id", "owner", "acquired", "expires", "fire_time"), row)) for row in cursor.fetchall()]
+
+    def stale_leases(self, owner=None, now=None):
+        """Leases left behind by runs that can no longer finish: expired, or held by a
+        dead process on this host (ignoring `owner`'s own leases)."""
+        now = time.time() if now is None else now
+        return [lease for lease in self.leases()
+                if lease["owner"] != owner and (lease["expires"] <= now or not owner_alive(lease["owner"]))]
+
+    def drop_lease(self, job_id):
+        self._conn().execute("DELETE FROM leases WHERE job_id = ?", (job_id,))
+
+    def heartbeat(self, node_id, now=None):
+        now = time.time() if now is None else now
+        self._conn().execute(
+            "INSERT INTO nodes (node_id, started, heartbeat) VALUES (?, ?, ?) "
+            "ON CONFLICT(node_id) DO UPDATE SET heartbeat = excluded.heartbeat", (node_id, now, now))
+
+    def live_nodes(self, ttl, now=None):
+        """Ids of nodes whose last heartbeat is less than ttl seconds old."""
+        now = time.time() if now is None else now
+        rows = self._conn().execute("SELECT node_id FROM nodes WHERE heartbeat > ? ORDER BY node_id", (now - ttl,))
+        return [row[0] for row in rows.fetchall()]
+
+    def remove_node(self, node_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+        conn.execute("DELETE FROM leases WHERE owner = ?", (node_id,))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def missed_fire_times(trigger, first_missed, now, limit, max_age=MAX_CATCHUP_AGE):
+    """Fire times of `trigger` from first_missed up to now (datetimes), newest `limit` only,
+    ignoring those older than max_age seconds. Returns (times, skipped_count)."""
+    times = []
+    skipped = 0
+    fire_time = first_missed
+    cutoff = now - datetime.timedelta(seconds=max_age)
+    #Walk the trigger forward; cap the walk so a 1-second interval job can't spin for ages
+    for _ in range(10000):
+        if fire_time is None or fire_time > now:
+            break
+        if fire_time >= cutoff:
+            times.append(fire_time)
+        else:
+            skipped += 1
+        fire_time = trigger.get_next_fire_time(fire_time, now)
+    if len(times) > limit:
+        skipped += len(times) - limit
+        times = times[-limit:]
+    return times, skipped
+
+
+class JobStateTracker:
+    """
+    Connects a scheduler to a JobStateStore.
+
+    wrap() (a JobRegistry run wrapper) takes a lease for every run and
+    records its outcome; a scheduler listener records each job's next run
+    time whenever it is added, changed or fired. On startup, plan_catch_up()
+    compares the stored next-run times with now, and catch_up() (called once
+    the scheduler runs) replays a bounded number of the missed runs, plus
+    any run that was interrupted mid-way (its lease was left behind). A job
+    only ever has one run holding its lease; catch-up runs wait for it
+    instead of being skipped. Each run also claims its scheduled fire time,
+    and a run whose scheduled time was already claimed (say by another node
+    in a cluster, after that run finished) is skipped.
+    """
+
+    def __init__(self, store, owner=None, max_catchup_runs=MAX_CATCHUP_RUNS, max_catchup_age=MAX_CATCHUP_AGE,
+                 lease_ttl=LEASE_TTL):
+        self.store = store
+        self.owner = owner or node_id()
+        self.lease_ttl = lease_ttl
+        self.max_catchup_runs = max_catchup_runs
+        self.max_catchup_age = max_catchup_age
+        self.scheduler = None
+        self._plan = {}
+        self._local = threading.local()
+
+    def _acquire(self, job_id):
+        """Take job_id's lease. Catch-up runs wait up to lease_ttl for a run holding it."""
+        deadline = time.monotonic() + self.lease_ttl if getattr(self._local, "catching_up", False) else None
+        while True:
+            token = self.store.acquire_lease(job_id, self.owner, self.lease_ttl)
+            if token is not None or deadline is None or time.monotonic() >= deadline:
+                return token
+            time.sleep(LEASE_RETRY_INTERVAL)
+
+    def _same_run(self, job_id):
+        """same_run(earlier, later) for claim_fire_time(): two fire times are the same
+        scheduled run when the later one comes before the trigger's next fire time after
+        the earlier one. This also matches nodes whose interval grids or jitter differ."""
+        job = self.scheduler.get_job(job_id) if self.scheduler is not None else None
+        if job is None:
+            return None
+        tz = self.scheduler.timezone
+        jitter = getattr(job.trigger, "jitter", None) or 0
+
+        def same_run(earlier, later):
+            start = datetime.datetime.fromtimestamp(earlier, tz)
+            following = job.trigger.get_next_fire_time(start, start)
+            return following is None or later < following.timestamp() - jitter
+        return same_run
+
+    def wrap(self, spec, func):
+        store = self.store
+        job_id = spec.job_id
+
+        @wraps(func)
+        def run_with_lease(*args, **kwargs):
+            token = self._acquire(job_id)
+            if token is None:
+                print(f"Job {job_id} skipped: another run holds its lease.")
+                return None
+            fire_time = scheduled_run_time()
+            if fire_time is not None and not store.claim_fire_time(job_id, fire_time.timestamp(), self.owner, token,
+                                                                    self._same_run(job_id)):
+                store.release_lease(job_id, token)
+                print(f"Job {job_id} skipped: its run scheduled at {fire_time} already ran.")
+                return None
+            started = time.time()
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+                raise
+            finally:
+                store.record_outcome(job_id, started, time.time() - started, error)
+                store.release_lease(job_id, token)
+        return run_with_lease
+
+    def _on_job_event(self, event):
+        #Catch-up runs are one-off date jobs; their state is recorded under the real job id
+        if event.code == EVENT_JOB_REMOVED or CATCHUP_SEPARATOR in event.job_id:
+            return
+        job = self.scheduler.get_job(event.job_id)
+        if job is not None and job.next_run_time is not None:
+            self.store.set_next_run(event.job_id, job.next_run_time.timestamp())
+
+    def plan_catch_up(self, scheduler, registry, now=None):
+        """Read the stored state and work out which runs were missed while the scheduler was
+        down. Call before scheduler.start(), which overwrites the stored next-run times."""
+        self.scheduler = scheduler
+        now = datetime.datetime.now(scheduler.timezone) if now is None else now
+        plan = {}
+        for state in self.store.states():
+            spec = registry.get(state["job_id"])
+            if spec is None or state["next_run"] is None or state["next_run"] > now.timestamp():
+                continue
+            job = scheduler.get_job(spec.job_id)
+            if job is None:
+                continue
+            first_missed = datetime.datetime.fromtimestamp(state["next_run"], scheduler.timezone)
+            limit = 1 if spec.policy.coalesce else self.max_catchup_runs
+            times, skipped = missed_fire_times(job.trigger, first_missed, now, limit, self.max_catchup_age)
+            if skipped:
+                print(f"Job {spec.job_id}: {skipped} missed run(s) too old or over the catch-up limit, skipped.")
+            if times:
+                plan[spec.job_id] = times
+        for lease in self.store.stale_leases(self.owner):
+            if registry.get(lease["job_id"]) is not None:
+                print(f"Job {lease['job_id']}: run started {time.ctime(lease['acquired'])} by {lease['owner']} was interrupted.")
+                if not plan.get(lease["job_id"]):
+                    #Replay it under its own fire time, which it had claimed
+                    fire_time = lease["fire_time"]
+                    if fire_time is not None:
+                        self.store.release_claim(lease["job_id"], fire_time)
+                        fire_time = datetime.datetime.fromtimestamp(fire_time, scheduler.timezone)
+                    plan[lease["job_id"]] = [fire_time]
+            self.store.drop_lease(lease["job_id"])
+        self._plan = plan
+        scheduler.add_listener(self._on_job_event, EVENT_JOB_ADDED | EVENT_JOB_MODIFIED | EVENT_JOB_SUBMITTED | EVENT_JOB_REMOVED)
+        return plan
+
+    def _run_catch_up(self, job_id, fire_times):
+        """Body of a catch-up job: the job's current function, once per missed fire time
+        (claimed like a regular run of that time), each run starting after the previous
+        one finished."""
+        self._local.catching_up = True
+        try:
+            for fire_time in fire_times:
+                job = self.scheduler.get_job(job_id)
+                if job is None:
+                    return
+                try:
+                    with scheduled_run(fire_time):
+                        job.func(*job.args, **job.kwargs)
+                except Exception as e:
+                    print(f"Catch-up run of {job_id} failed: {e}")
+        finally:
+            self._local.catching_up = False
+
+    def catch_up(self):
+        """Run the planned catch-ups now on each job's own executor, one after another per job
+        and never alongside a regular run of the job."""
+        plan, self._plan = self._plan, {}
+        for job_id, fire_times in plan.items():
+            job = self.scheduler.get_job(job_id)
+            if job is None:
+                continue
+            print(f"Catching up {len(fire_times)} missed run(s) of {job_id}.")
+            self.scheduler.add_job(self._run_catch_up, "date", args=(job_id, fire_times),
+                                   id=f"{job_id}{CATCHUP_SEPARATOR}", executor=job.executor,
+                                   misfire_grace_time=None, replace_existing=True)
+        return plan
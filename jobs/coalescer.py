@@ -0,0 +1,116 @@
+import threading
+import time
+
+#Default debounce window in seconds: a path is dispatched once it has been quiet this long
+COALESCE_WINDOW = 0.5
+
+#A path that keeps changing is still dispatched at least this often (in windows)
+MAX_DELAY_WINDOWS = 10
+
+
+class EventCoalescer:
+    """
+    Coalesces bursts of raw file system events into one logical event per path.
+
+    Raw events are keyed by (event type, path). Repeats of a key that is
+    already pending are dropped; the newest raw event is kept. A key is
+    dispatched once no new event for it arrived for `window` seconds, or once
+    it has been pending for `max_delay` seconds so constantly changing files
+    still get reported. dispatch(event, merged_count) is called from the
+    coalescer's own thread, where merged_count is the number of raw events
+    folded into that logical event.
+    """
+
+    def __init__(self, dispatch, window=COALESCE_WINDOW, max_delay=None):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_delay = max_delay if max_delay is not None else window * MAX_DELAY_WINDOWS
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.raw_events = 0
+        self.dispatched_events = 0
+
+    def submit(self, event):
+        """Queue a raw event. Returns immediately."""
+        key = (event.event_type, event.src_path)
+        now = time.monotonic()
+        with self._cond:
+            self.raw_events += 1
+            entry = self._pending.get(key)
+            if entry is None:
+                #[first seen, last seen, newest event, raw count]
+                self._pending[key] = [now, now, event, 1]
+                self._cond.notify()
+            else:
+                entry[1] = now
+                entry[2] = event
+                entry[3] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-coalescer", daemon=True)
+                self._thread.start()
+
+    def _due(self, entry):
+        return min(entry[1] + self.window, entry[0] + self.max_delay)
+
+    def _take_ready(self, now, everything=False):
+        ready = []
+        for key, entry in list(self._pending.items()):
+            if everything or self._due(entry) <= now:
+                ready.append(self._pending.pop(key))
+        return ready
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+                now = time.monotonic()
+                ready = self._take_ready(now, everything=self._stopped)
+                if not ready:
+                    next_due = min(self._due(entry) for entry in self._pending.values())
+                    self._cond.wait(max(next_due - now, 0.001))
+                    continue
+                self.dispatched_events += len(ready)
+            self._dispatch(ready)
+
+    def _dispatch(self, ready):
+        for _, _, event, count in ready:
+            try:
+                self.dispatch(event, count)
+            except Exception as e:
+                print(f"Coalesced event dispatch failed for {event.src_path}: {e}")
+
+    def flush(self):
+        """Dispatch everything pending right now on the calling thread."""
+        with self._cond:
+            ready = self._take_ready(0, everything=True)
+            self.dispatched_events += len(ready)
+        self._dispatch(ready)
+
+    def stop(self):
+        """Dispatch what is pending and stop the coalescer thread. A later submit()
+        starts a new thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            if self._thread is thread:
+                self._thread = None
+                self._stopped = False
+
+    def counters(self):
+        """Return raw, dispatched, merged and pending event counts."""
+        with self._cond:
+            return {
+                "raw_events": self.raw_events,
+                "dispatched_events": self.dispatched_events,
+                "merged_events": self.raw_events - self.dispatched_events - sum(e[3] for e in self._pending.values()),
+                "pending_paths": len(self._pending),
+            }
@@ -1,149 +1,148 @@
 import datetime
-import time
 import os
-import gc
 import shutil
 import psutil
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from stats import update_stat
 from job_logger import log_job
+from jobs.coalescer import EventCoalescer, COALESCE_WINDOW
+from dispatch import get_dispatcher, DispatchRejected
+from poller import get_poller
+from dir_index import DirectorySnapshotIndex, MAX_ENTRIES
+from watchers import create_backend
+from log_tail import get_tailer
 
 # 1. Generic Event Trigger
-@log_job("Generic Event", "Handle a generic event", file_type="N/A")
+@log_job("event_based_generic", "Handle a generic event", file_type="N/A")
 def run_event_job(event):
     """
     Generic event handler that logs the occurrence of an event
     """
     print(f"[{datetime.datetime.now()}] Running event-based job for event: {event}")
-    update_stat("event_based_generic")
 
 # 2. Click Event
-@log_job("Click Event", "Handle a simulated click event", file_type="N/A")
+@log_job("event_based_click", "Handle a simulated click event", file_type="N/A")
 def run_click_event(click_info):
     """
     Handles click events triggered by manual input
     """
     print(f"[{datetime.datetime.now()}] Click event detected: {click_info}")
-    update_stat("event_based_click")
 
 # 3. File Created Event
-@log_job("File Created Event", "Handle file creation event", file_type="File")
+@log_job("file_created", "Handle file creation event", file_type="File")
 def file_created_event(event):
     """
     Logs when a file is created and updates the file creation stat
     """
     print(f"[{datetime.datetime.now()}] File created: {event.src_path}")
-    update_stat("file_created")
 
 # 4. File Modified Event
-@log_job("File Modified Event", "Handle file modification event", file_type="File")
+@log_job("file_modified", "Handle file modification event", file_type="File")
 def file_modified_event(event):
     """
     Logs when a file is modified and updates the file modified stat
     """
     print(f"[{datetime.datetime.now()}] File modified: {event.src_path}")
-    update_stat("file_modified")
 
 # 5. File Deleted Event
-@log_job("File Deleted Event", "Handle file deletion event", file_type="File")
+@log_job("file_deleted", "Handle file deletion event", file_type="File")
 def file_deleted_event(event):
     """
     Logs when a file is deleted and updates the file deletion stat
     """
     print(f"[{datetime.datetime.now()}] File deleted: {event.src_path}")
-    update_stat("file_deleted")
 
 # 6. File Moved Event
-@log_job("File Moved Event", "Handle file moved event", file_type="File")
+@log_job("file_moved", "Handle file moved event", file_type="File")
 def file_moved_event(event):
     """
     Logs when a file is moved from one location to another
     """
     print(f"[{datetime.datetime.now()}] File moved: from {event.src_path} to {event.dest_path}")
-    update_stat("file_moved")
 
 # 7. Configuration Change Alert
-@log_job("Config Change Alert", "Alert on critical configuration file change", file_type="Config")
 def config_change_alert(event):
     """
-    Checks if a critical configuration file has been modified
+    Checks if a critical configuration file has been modified; only a match runs
+    (and is counted as) the alert job
     """
     # Update the path as needed
     if event.src_path == '/etc/ssh/ssh_config':
-        print("SSH configuration file has changed!")
-        update_stat("event_based_config_change")
+        _config_change_alert(event)
+
+@log_job("event_based_config_change", "Alert on critical configuration file change", file_type="Config")
+def _config_change_alert(event):
+    print("SSH configuration file has changed!")
 
 # 8. Monitor USB Insertion
-@log_job("USB Insertion", "Handle USB device insertion event", file_type="USB")
+@log_job("event_based_usb_insertion", "Handle USB device insertion event", file_type="USB")
 def monitor_usb_insertion(event):
     """
     Logs USB insertion events
     """
     print(f"[{datetime.datetime.now()}] USB device inserted: {event.device}")
-    update_stat("event_based_usb_insertion")
 
 # 9. Monitor USB Removal
-@log_job("USB Removal", "Handle USB device removal event", file_type="USB")
+@log_job("event_based_usb_removal", "Handle USB device removal event", file_type="USB")
 def monitor_usb_removal(event):
     """
     Logs USB removal events
     """
     print(f"[{datetime.datetime.now()}] USB device removed: {event.device}")
-    update_stat("event_based_usb_removal")
 
 # 10. User Login/Logout Event
-@log_job("User Login/Logout", "Handle user login/logout event", file_type="User")
+@log_job("event_based_user_event", "Handle user login/logout event", file_type="User")
 def user_login_logout_event(event):
     """
     Logs user login or logout events
     """
     print(f"[{datetime.datetime.now()}] User login/logout event: {event.detail}")
-    update_stat("event_based_user_event")
 
 # 11. Trigger File Handler
-@log_job("Trigger File Handler", "Handle trigger file creation", file_type="File")
 def trigger_file_handler(event):
     """
-    If a file ending with 'trigger.txt' is created, it logs the event
+    If a file ending with 'trigger.txt' is created, it runs (and counts) the trigger job
     """
     if event.src_path.endswith("trigger.txt"):
-        print("Trigger file detected—executing maintenance job.")
-        update_stat("event_based_trigger_file")
+        _trigger_file_job(event)
+
+@log_job("event_based_trigger_file", "Handle trigger file creation", file_type="File")
+def _trigger_file_job(event):
+    print("Trigger file detected—executing maintenance job.")
 
 # 12. Log Keyword Alert
-@log_job("Keyword Alert", "Scan log file change for specific keyword", file_type="Log")
+@log_job("event_based_keyword_alert", "Scan log file change for specific keyword", file_type="Log")
 def log_keyword_alert(event, keyword="ERROR"):
-    """Scans an event for a specific keyword. Ex: A log file change"""
+    """Scans the lines appended to a changed file for a specific keyword. Ex: A log file change"""
     print(f"[{datetime.datetime.now()}] Log file change detected, checking for keyword: {keyword}")
-    update_stat("event_based_keyword_alert")
+    if getattr(event, "is_directory", False) or not os.path.isfile(event.src_path):
+        return
+    result = get_tailer().scan(event.src_path, (keyword,), consumer="log_keyword_alert")
+    if result.matching_lines:
+        print(f"[{datetime.datetime.now()}] {result.matching_lines} new line(s) with '{keyword}' in {event.src_path}")
 
 # 13. Network Interface Change Event
-@log_job("Network Interface Change", "Detect changes in network interface status", file_type="Network")
+@log_job("event_based_network_change", "Detect changes in network interface status", file_type="Network")
 def network_interface_change_event(event):
     """
     Logs network interface changes
     """
     print(f"[{datetime.datetime.now()}] Network interface change detected: {event.detail}")
-    update_stat("event_based_network_change")
 
 # 14. Temperature Threshold Exceeded Event
-@log_job("Temperature Threshold Exceeded", "Alert when sensor temperature exceeds threshold", file_type="Sensor")
+@log_job("event_based_temp_exceeded", "Alert when sensor temperature exceeds threshold", file_type="Sensor")
 def temperature_threshold_exceeded_event(event):
     """
     Logs an event when a sensor's temperature exceeds a preset threshold
     """
     print(f"[{datetime.datetime.now()}] Temperature threshold exceeded: {event.detail}")
-    update_stat("event_based_temp_exceeded")
 
 # 15. Low Disk Space Alert Event
-@log_job("Low Disk Space Alert", "Alert when available disk space is low", file_type="Disk")
+@log_job("event_based_disk_low", "Alert when available disk space is low", file_type="Disk")
 def low_disk_space_alert_event(event):
     """
     Logs an event when disk space falls below a certain threshold
     """
     print(f"[{datetime.datetime.now()}] Low disk space detected: {event.detail}")
-    update_stat("event_based_disk_low")
 
 #--------------------
 #Watchdog-Based File Event Handler
@@ -152,138 +151,202 @@ def low_disk_space_alert_event(event):
 class FileEventHandler(FileSystemEventHandler):
     """
     Custom event handler class using Watchdog.
-    When a file system event occurs, the corresponding functions are called.
-    """
+    When a file system event occurs, the corresponding functions are queued on
+    the shared dispatcher (see dispatch.py) instead of running on the observer
+    thread. Modify events are coalesced per path first (see jobs/coalescer.py),
+    so a burst of writes to one file runs the modify jobs once.
+    """
+    def __init__(self, coalesce_window=COALESCE_WINDOW, dispatcher=None):
+        super().__init__()
+        self.dispatcher = dispatcher
+        self.coalescer = EventCoalescer(self.dispatch_modified, window=coalesce_window)
+    def _submit(self, func, *args):
+        dispatcher = self.dispatcher or get_dispatcher()
+        try:
+            dispatcher.submit(func, *args)
+        except DispatchRejected as e:
+            print(f"Dropped {func.__name__} for {args[0].src_path}: {e}")
     def on_created(self, event):
-        file_created_event(event)
+        self._submit(file_created_event, event)
     def on_modified(self, event):
-        file_modified_event(event)
-        config_change_alert(event)
-        log_keyword_alert(event)
+        self.coalescer.submit(event)
+    def dispatch_modified(self, event, merged_count=1):
+        """Queues the modify jobs for one logical (coalesced) modify event."""
+        if merged_count > 1:
+            print(f"[{datetime.datetime.now()}] Coalesced {merged_count} modify events for {event.src_path}")
+        self._submit(run_modified_jobs, event)
     def on_deleted(self, event):
-        file_deleted_event(event)
+        self._submit(file_deleted_event, event)
     def on_moved(self, event):
-        file_moved_event(event)
+        self._submit(file_moved_event, event)
         #Backup config on change
-        backup_config_on_change(event)
+        self._submit(backup_config_on_change, event)
+
+def run_modified_jobs(event):
+    """Runs every job interested in a file modification"""
+    file_modified_event(event)
+    config_change_alert(event)
+    log_keyword_alert(event)
 
-def start_file_watcher(path_to_watch):
-    """Initializes and starts a Watchdog observer for a given directory.
-    It monitors the directory for file system events.
+def start_file_watcher(path_to_watch, backend="auto", **options):
+    """Starts a watcher backend (see watchers.py) on one directory or a list of them
+    and returns it. inotify is used where available; roots that exceed the watch
+    budget fall back to scan-based polling. Stop it with stop_file_watcher().
     """
+    roots = [path_to_watch] if isinstance(path_to_watch, str) else list(path_to_watch)
     event_handler = FileEventHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path='watched_directory', recursive=True)
-    observer.start()
-    print(f"Started file watcher on {path_to_watch}")
-    try:
-        while True:
-            time.sleep(1) #Keep loop running to catch events.
-    except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+    watcher = create_backend(event_handler, roots, backend, **options)
+    watcher.event_handler = event_handler
+    watcher.start()
+    print(f"Started {watcher.name} file watcher on {', '.join(roots)}")
+    return watcher
+
+def stop_file_watcher(watcher):
+    """Stops a watcher started by start_file_watcher() and flushes coalesced events."""
+    watcher.stop()
+    watcher.event_handler.coalescer.stop()
 
 #------------------
 #Helper Function for Configuration Files
 #------------------
 
-@log_job("Backup Config", "Backup configuration file on change", file_type="Config")
 def backup_config_on_change(event):
     """
     When a critical configuration file is changed (SSH config or fstab)
-    this function creates a backup of the specified file
+    this function runs (and counts) the job creating a backup of the specified file
     """
     critical_files = ['/etc/ssh/ssh_config', '/etc/fstab']
     if event.src_path in critical_files:
-        backup_path = event.src_path + ".backup"
-        try:
-            shutil.copy(event.src_path, backup_path)
-            print(f"Backup created for {event.src_path}")
-        except Exception as e:
-            print(f"Failed to backup {event.src_path}: {e}")
-        update_stat("event_based_config_backup")
+        _backup_config_file(event)
+
+@log_job("event_based_config_backup", "Backup configuration file on change", file_type="Config")
+def _backup_config_file(event):
+    backup_path = event.src_path + ".backup"
+    try:
+        shutil.copy(event.src_path, backup_path)
+        print(f"Backup created for {event.src_path}")
+    except Exception as e:
+        print(f"Failed to backup {event.src_path}: {e}")
 
 
 #----------------------------------------------
 #Polling Functions using Python's 'os' module
+#
+#Each poll_* function registers a watch target on the shared poller engine
+#(see poller.py): one thread checks every target on its own interval, and each
+#detected change runs the matching decorated job below as its own job run.
 #----------------------------------------------
 @log_job("os_directory_change", "Detect changes in directory listing", file_type="Directory")
-def poll_directory_changes(directory_path, interval=10):
-    # Only store one snapshot
-    previous_listing = set(os.listdir(directory_path))
-    while True:
-        time.sleep(interval)
-        current_listing = set(os.listdir(directory_path))
-        added = current_listing - previous_listing
-        removed = previous_listing - current_listing
-        if added or removed:
-            print(f"Changes: {added} / {removed}")
-            update_stat("os_directory_change")
-            # Release memory of old set
-            previous_listing = current_listing
-            # Force garbage collection periodically
-            gc.collect()
+def directory_change_event(change):
+    """
+    Logs entries added to, removed from or modified in a polled directory tree
+    """
+    directory_path, diff = change
+    print(f"Changes in {directory_path}: added {diff.added} / removed {diff.removed} / modified {diff.modified}")
 
 @log_job("os_file_attribute_change", "Monitor file attribute changes using os.stat", file_type="File")
-def poll_file_attribute_changes(file_path, interval=10):
+def file_attribute_change_event(change):
+    """
+    Logs a change in a polled file's attributes (or its appearance/disappearance)
+    """
+    print(change)
+
+@log_job("os_disk_space", "Monitor disk space using os.statvfs", file_type="Disk")
+def disk_space_low_event(change):
+    """
+    Logs a low disk space reading on a polled mount point
+    """
+    mount_point, free_percent = change
+    print(f"Low disk space alert on {mount_point}: {free_percent:.2f}% free")
+
+@log_job("os_env_change", "Monitor changes to an environment variable using os.environ", file_type="Env")
+def env_variable_change_event(change):
+    """
+    Logs the new value of a polled environment variable
+    """
+    var_name, previous_value, current_value = change
+    print(f"Environment variable {var_name} changed from {previous_value} to {current_value}")
+
+def poll_directory_changes(directory_path, interval=10, engine=None, recursive=True, max_entries=MAX_ENTRIES):
+    """
+    Watch a directory tree for added, removed or modified entries.
+    Uses a persistent inode/mtime/size index (see dir_index.py), so a restart
+    picks up where the last run left off instead of reporting everything again.
+    """
+    index = DirectorySnapshotIndex(directory_path, recursive=recursive, max_entries=max_entries)
+    if not index.load():
+        index.scan()
+        index.save()
+
+    def check():
+        diff = index.scan()
+        if diff.added or diff.removed or diff.modified:
+            index.save()
+            return directory_path, diff
+        return None
+
+    return (engine or get_poller()).register(f"dir:{directory_path}", interval, check, directory_change_event)
+
+def poll_file_attribute_changes(file_path, interval=10, engine=None):
     """
     Poll a file for attribute changes (e.g., modification time, size).
     """
     try:
-        previous_stat = os.stat(file_path)
+        previous = {"stat": os.stat(file_path)}
     except FileNotFoundError:
         print(f"File {file_path} not found.")
-        previous_stat = None
+        previous = {"stat": None}
 
-    while True:
-        time.sleep(interval)
+    def check():
+        previous_stat = previous["stat"]
         try:
             current_stat = os.stat(file_path)
         except FileNotFoundError:
             current_stat = None
+        previous["stat"] = current_stat
         if previous_stat and current_stat:
             if current_stat.st_mtime != previous_stat.st_mtime or current_stat.st_size != previous_stat.st_size:
-                print(f"File attributes changed for {file_path}.")
-                update_stat("os_file_attribute_change")
-                previous_stat = current_stat
+                return f"File attributes changed for {file_path}."
+            #Nothing relevant changed; keep comparing against the old reading
+            previous["stat"] = previous_stat
         elif previous_stat is None and current_stat is not None:
-            print(f"File {file_path} appeared.")
-            update_stat("os_file_attribute_change")
-            previous_stat = current_stat
+            return f"File {file_path} appeared."
         elif previous_stat is not None and current_stat is None:
-            print(f"File {file_path} is now missing.")
-            update_stat("os_file_attribute_change")
-            previous_stat = None
+            return f"File {file_path} is now missing."
+        return None
 
-@log_job("os_disk_space", "Monitor disk space using os.statvfs", file_type="Disk")
-def poll_disk_space(mount_point, threshold=10, interval=30):
+    return (engine or get_poller()).register(f"file:{file_path}", interval, check, file_attribute_change_event)
+
+def poll_disk_space(mount_point, threshold=10, interval=30, engine=None):
     """
     Poll disk space on a given mount point.
     If free space drops below the threshold (percentage), trigger an event.
     """
-    while True:
-        time.sleep(interval)
+    def check():
         stats = os.statvfs(mount_point)
         total_space = stats.f_frsize * stats.f_blocks
         free_space = stats.f_frsize * stats.f_bavail
         free_percent = (free_space / total_space) * 100
         if free_percent < threshold:
-            print(f"Low disk space alert on {mount_point}: {free_percent:.2f}% free")
-            update_stat("os_disk_space")
-        else:
-            print(f"Disk space OK on {mount_point}: {free_percent:.2f}% free")
+            return mount_point, free_percent
+        print(f"Disk space OK on {mount_point}: {free_percent:.2f}% free")
+        return None
 
-@log_job("os_env_change", "Monitor changes to an environment variable using os.environ", file_type="Env")
-def poll_env_variable_change(var_name, interval=10):
+    return (engine or get_poller()).register(f"disk:{mount_point}", interval, check, disk_space_low_event)
+
+def poll_env_variable_change(var_name, interval=10, engine=None):
     """
     Poll an environment variable for changes.
     When change is detected, log the new value.
     """
-    previous_value = os.environ.get(var_name)
-    while True:
-        time.sleep(interval)
+    previous = {"value": os.environ.get(var_name)}
+
+    def check():
         current_value = os.environ.get(var_name)
-        if current_value != previous_value:
-            print(f"Environment variable {var_name} changed from {previous_value} to {current_value}")
-            update_stat("os_env_change")
-            previous_value = current_value
+        if current_value != previous["value"]:
+            change = (var_name, previous["value"], current_value)
+            previous["value"] = current_value
+            return change
+        return None
+
+    return (engine or get_poller()).register(f"env:{var_name}", interval, check, env_variable_change_event)
@@ -0,0 +1,192 @@
+import os
+import re
+import struct
+import threading
+from collections import namedtuple
+
+#Directory holding the journal segments. Will be created in project root
+JOURNAL_DIR = "stats_journal"
+
+#Folded segments are kept around (newest first) up to this many bytes so the
+#per-run history survives compaction.
+JOURNAL_RETAIN_BYTES = 8 * 1024 * 1024
+
+SEGMENT_PATTERN = re.compile(r"^runs\.(\d{8})\.journal$")
+
+#Fixed-size run record: job id, start time, duration, outcome, thread ident (80 bytes)
+RECORD = struct.Struct("<48sddB7xQ")
+JOB_ID_BYTES = 48
+
+OUTCOME_OK = 0
+OUTCOME_ERROR = 1
+
+RunRecord = namedtuple("RunRecord", ["job_id", "start_time", "duration", "error", "thread_id"])
+
+
+def check_job_id(job_id):
+    """Raise ValueError if job_id doesn't fit a journal record. A truncated id would be
+    replayed as a different job than the one counted in memory."""
+    if len(job_id.encode("utf-8")) > JOB_ID_BYTES:
+        raise ValueError(f"Job id {job_id!r} is longer than {JOB_ID_BYTES} bytes (UTF-8)")
+    return job_id
+
+
+def encode_record(job_id, start_time, duration, error, thread_id):
+    """Pack one run into a fixed-size journal record. Raises ValueError for job ids longer than 48 bytes."""
+    check_job_id(job_id)
+    return RECORD.pack(
+        job_id.encode("utf-8"),
+        start_time,
+        duration,
+        OUTCOME_ERROR if error else OUTCOME_OK,
+        thread_id & 0xFFFFFFFFFFFFFFFF,
+    )
+
+
+def decode_record(data):
+    job_id, start_time, duration, outcome, thread_id = RECORD.unpack(data)
+    return RunRecord(
+        job_id.rstrip(b"\0").decode("utf-8", errors="replace"),
+        start_time,
+        duration,
+        outcome == OUTCOME_ERROR,
+        thread_id,
+    )
+
+
+class RunJournal:
+    """
+    Append-only journal of job runs, split into numbered segments.
+
+    Each run is one fixed-size record appended with a single write() to the
+    active segment. rotate() seals the active segment so it can be folded into
+    the stats snapshot; the next append opens a fresh segment.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._fd = None
+        self._active = None
+        self._min_generation = 0
+
+    def segment_path(self, generation):
+        return os.path.join(self.directory, f"runs.{generation:08d}.journal")
+
+    def generations(self):
+        """Return the generation numbers of all segments on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def reserve(self, generation):
+        """Never write to a segment numbered below generation (it was already folded)."""
+        with self._lock:
+            self._min_generation = max(self._min_generation, generation)
+
+    def _next_generation(self):
+        existing = self.generations()
+        return max([self._min_generation] + [g + 1 for g in existing])
+
+    def append(self, job_id, start_time, duration, error, thread_id=None):
+        """Append one run record to the active segment."""
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        data = encode_record(job_id, start_time, duration, error, thread_id)
+        with self._lock:
+            if self._fd is None:
+                os.makedirs(self.directory, exist_ok=True)
+                #Always start a new segment so we never append after a torn record
+                self._active = self._next_generation()
+                self._fd = os.open(self.segment_path(self._active),
+                                   os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, data)
+
+    @property
+    def is_open(self):
+        return self._fd is not None
+
+    def rotate(self):
+        """Seal the active segment. Returns the first generation that is still open
+        for writing: every segment below it is immutable from now on."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._min_generation = self._active + 1
+                self._active = None
+            return self._next_generation()
+
+    def read_segment(self, generation):
+        """Yield the records of one segment. A torn trailing record is ignored."""
+        try:
+            with open(self.segment_path(generation), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % RECORD.size
+        for offset in range(0, usable, RECORD.size):
+            yield decode_record(data[offset:offset + RECORD.size])
+
+    def read_from(self, generation, offset=0):
+        """Return (records, next_offset): the whole records of one segment from byte offset on.
+        Readers in other processes use this to pick up only the runs appended since their last read."""
+        try:
+            with open(self.segment_path(generation), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        usable = len(data) - len(data) % RECORD.size
+        records = [decode_record(data[i:i + RECORD.size]) for i in range(0, usable, RECORD.size)]
+        return records, offset + usable
+
+    def replay(self, start=0, stop=None):
+        """Yield records from every segment with start <= generation < stop."""
+        for generation in self.generations():
+            if generation < start or (stop is not None and generation >= stop):
+                continue
+            yield from self.read_segment(generation)
+
+    def prune(self, before, retain_bytes=JOURNAL_RETAIN_BYTES):
+        """Delete folded segments (generation < before), newest kept up to retain_bytes."""
+        kept = 0
+        for generation in reversed(self.generations()):
+            if generation >= before:
+                continue
+            path = self.segment_path(generation)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if kept + size <= retain_bytes:
+                kept += size
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove every segment, e.g. after a stats reset."""
+        self.close()
+        for generation in self.generations():
+            try:
+                os.remove(self.segment_path(generation))
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._min_generation = self._active + 1
+                self._active = None
@@ -0,0 +1,205 @@
+import threading
+import time
+import tracemalloc
+from collections import deque
+import psutil
+
+#Samples kept per process; with the 2 minute memory_leak_detector job this is one hour
+LEAK_WINDOW = 30
+
+#A process needs at least this many samples before its trend is judged
+MIN_SAMPLES = 10
+
+#Most processes tracked at once; beyond this the smallest (by RSS) are dropped
+MAX_TRACKED_PIDS = 2000
+
+#Fitted growth (bytes per hour) above which a process is a leak suspect
+MIN_GROWTH_PER_HOUR = 50 * 1024 * 1024
+
+#Share of sample-to-sample steps that must not shrink for growth to count as sustained
+MONOTONIC_FRACTION = 0.8
+
+#Frames recorded per allocation by the tracemalloc self-check
+TRACEMALLOC_FRAMES = 5
+
+
+def fit_slope(points):
+    """Least-squares slope of [(t, value)] (value units per second)."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if var == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var
+
+
+class ProcessHistory:
+    """Bounded memory history of one process (keyed by pid + create time, so a reused PID starts fresh)."""
+    __slots__ = ("pid", "name", "samples", "last_seen")
+
+    def __init__(self, pid, name, window):
+        self.pid = pid
+        self.name = name
+        self.samples = deque(maxlen=window)
+        self.last_seen = 0.0
+
+    def trend(self):
+        """Return (slope in bytes/hour, share of non-shrinking steps, growth over the window)."""
+        points = list(self.samples)
+        if len(points) < 2:
+            return 0.0, 0.0, 0
+        steps = [b - a for (_, a), (_, b) in zip(points, points[1:])]
+        rising = sum(1 for step in steps if step >= 0) / len(steps)
+        return fit_slope(points) * 3600, rising, points[-1][1] - points[0][1]
+
+
+class LeakDetector:
+    """
+    Per-process memory growth tracker.
+
+    Every observe() records the RSS (or USS, with use_uss) of each process
+    into a fixed-size sliding window. suspects() fits a least-squares growth
+    slope over each window and flags processes whose memory grows fast
+    enough and nearly monotonically, which a high but steady load does not.
+    Memory stays bounded: windows have a fixed length, exited processes are
+    dropped, and at most max_pids processes are tracked.
+    """
+
+    def __init__(self, window=LEAK_WINDOW, max_pids=MAX_TRACKED_PIDS, use_uss=False):
+        self.window = window
+        self.max_pids = max_pids
+        self.use_uss = use_uss
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def _memory(self, proc):
+        if self.use_uss:
+            return proc.memory_full_info().uss
+        return proc.memory_info().rss
+
+    def observe(self, now=None):
+        """Record one memory sample for every running process. Returns the number tracked."""
+        now = time.time() if now is None else now
+        readings = {}
+        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+            try:
+                key = (proc.info["pid"], proc.info["create_time"])
+                readings[key] = (proc.info["name"], self._memory(proc))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        with self._lock:
+            for key in [key for key in self._histories if key not in readings]:
+                del self._histories[key]
+            if len(readings) > self.max_pids:
+                keep = sorted(readings, key=lambda k: readings[k][1], reverse=True)[:self.max_pids]
+                readings = {key: readings[key] for key in keep}
+                for key in [key for key in self._histories if key not in readings]:
+                    del self._histories[key]
+            for key, (name, memory) in readings.items():
+                history = self._histories.get(key)
+                if history is None:
+                    history = self._histories[key] = ProcessHistory(key[0], name, self.window)
+                history.samples.append((now, memory))
+                history.last_seen = now
+            return len(self._histories)
+
+    def suspects(self, min_growth_per_hour=MIN_GROWTH_PER_HOUR, min_samples=MIN_SAMPLES,
+                 monotonic_fraction=MONOTONIC_FRACTION):
+        """Processes with sustained memory growth, fastest first."""
+        with self._lock:
+            histories = list(self._histories.values())
+        found = []
+        for history in histories:
+            if len(history.samples) < min_samples:
+                continue
+            slope, rising, growth = history.trend()
+            if slope >= min_growth_per_hour and rising >= monotonic_fraction and growth > 0:
+                found.append({
+                    "pid": history.pid,
+                    "name": history.name,
+                    "memory": history.samples[-1][1],
+                    "growth": growth,
+                    "growth_per_hour": slope,
+                    "rising_fraction": rising,
+                    "samples": len(history.samples),
+                })
+        found.sort(key=lambda s: s["growth_per_hour"], reverse=True)
+        return found
+
+    def tracked(self):
+        with self._lock:
+            return len(self._histories)
+
+
+class SelfLeakCheck:
+    """
+    tracemalloc check of this (scheduler) process: each check() diffs a new
+    snapshot against the previous one and returns the source lines whose
+    allocations grew the most. Only the last snapshot is kept.
+    """
+
+    def __init__(self, frames=TRACEMALLOC_FRAMES):
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        with self._lock:
+            self._previous = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def check(self, top=10):
+        """Return [(location, size_diff, count_diff)] for the biggest growth since the
+        last check ([] on the first check, or when tracemalloc is off)."""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return []
+        growth = []
+        for stat in snapshot.compare_to(previous, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            growth.append((f"{frame.filename}:{frame.lineno}", stat.size_diff, stat.count_diff))
+            if len(growth) >= top:
+                break
+        return growth
+
+
+_detector = None
+_self_check = None
+_detector_lock = threading.Lock()
+
+
+def get_leak_detector():
+    """Return the process-wide leak detector, creating it on first use."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = LeakDetector()
+        return _detector
+
+
+def get_self_check():
+    """Return the process-wide tracemalloc self-check (tracing starts only via its start(),
+    which scheduler.py calls with --trace-leaks)."""
+    global _self_check
+    with _detector_lock:
+        if _self_check is None:
+            _self_check = SelfLeakCheck()
+        return _self_check
@@ -0,0 +1,249 @@
+import contextlib
+import errno
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#Where per-file read offsets are kept between runs. Will be created in project root
+OFFSETS_FILE = "log_offsets.json"
+
+#Bytes read per chunk; only newly appended bytes are ever read
+CHUNK_SIZE = 1024 * 1024
+
+#Most (consumer, file) offsets remembered; the least recently scanned are dropped first
+MAX_TRACKED_FILES = 1024
+
+#Byte-range locks on OFFSETS_FILE + this suffix keep processes sharing the offsets
+#(scheduler and worker processes) in step: byte 0 guards the file, one byte per
+#(consumer, file) key guards its scan
+LOCK_SUFFIX = ".lock"
+KEY_LOCK_SLOTS = 1 << 20
+
+#Retry delay when the kernel reports a lock deadlock. Its check treats each process as one
+#lock owner, so threads waiting on different slots can look like a cycle when there is none
+LOCK_RETRY_INTERVAL = 0.01
+
+
+class ScanResult:
+    """Outcome of one incremental scan of a log file."""
+    __slots__ = ("path", "bytes_read", "lines", "matching_lines", "keyword_counts", "rotated", "truncated")
+
+    def __init__(self, path, keywords):
+        self.path = path
+        self.bytes_read = 0
+        self.lines = 0
+        self.matching_lines = 0
+        self.keyword_counts = {keyword: 0 for keyword in keywords}
+        self.rotated = False
+        self.truncated = False
+
+    def __repr__(self):
+        return (f"ScanResult({self.path!r}, bytes_read={self.bytes_read}, lines={self.lines}, "
+                f"matching_lines={self.matching_lines}, keyword_counts={self.keyword_counts})")
+
+
+def compile_keywords(keywords):
+    """One alternation regex for all keywords, so each chunk is matched in a single pass."""
+    return re.compile(b"|".join(re.escape(k.encode("utf-8")) for k in sorted(keywords, key=len, reverse=True)))
+
+
+class LogTailer:
+    """
+    Shared incremental log scanner.
+
+    For every (consumer, file) it remembers the inode and the byte offset of
+    the last complete line it read, persisted in OFFSETS_FILE. A scan reads
+    only the bytes appended since then, in large chunks, and matches all
+    keywords in one pass. If the file was rotated (new inode) the rest of the
+    old file is finished from its ".1" sibling when present, and the new file
+    is read from the start; if it was truncated, reading restarts at 0.
+
+    Several processes may share one offsets file: each scan re-reads its
+    key's offset from disk under a per-key lock (a byte of the lock file,
+    KEY_LOCK_SLOTS of them, shared by keys with the same crc32 slot), and
+    each save merges into what is on disk under a file-wide one, so no
+    process or thread overwrites another's progress or scans the same lines
+    twice.
+    """
+
+    def __init__(self, offsets_file=OFFSETS_FILE, chunk_size=CHUNK_SIZE, max_tracked=MAX_TRACKED_FILES):
+        self.offsets_file = offsets_file
+        self.chunk_size = chunk_size
+        self.max_tracked = max_tracked
+        self._offsets = None
+        self._lock_fd = None
+        self._lock = threading.Lock()
+        self._slot_locks = {}
+        self._patterns = {}
+
+    def _load(self):
+        """Re-read the offsets file, which other processes may have updated."""
+        try:
+            with open(self.offsets_file, "r") as f:
+                self._offsets = OrderedDict(json.load(f))
+        except Exception:
+            if self._offsets is None:
+                self._offsets = OrderedDict()
+        return self._offsets
+
+    @contextlib.contextmanager
+    def _process_lock(self, slot):
+        """Hold byte `slot` of the lock file against other processes. fcntl locks belong
+        to the process, so a thread lock per slot is held around the fcntl one: another
+        thread of this process can neither share it nor release it early. Slot thread
+        locks only live while in use; the lock file stays open for the tailer's lifetime,
+        since closing it would drop every lock this process holds."""
+        with self._lock:
+            entry = self._slot_locks.get(slot)
+            if entry is None:
+                #[thread lock, holders and waiters]
+                entry = self._slot_locks[slot] = [threading.Lock(), 0]
+            entry[1] += 1
+            if fcntl is not None and self._lock_fd is None:
+                self._lock_fd = os.open(self.offsets_file + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+            fd = self._lock_fd
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                while True:
+                    try:
+                        fcntl.lockf(fd, fcntl.LOCK_EX, 1, slot)
+                        break
+                    except OSError as e:
+                        if e.errno != errno.EDEADLK:
+                            raise
+                        time.sleep(LOCK_RETRY_INTERVAL)
+                try:
+                    yield
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._slot_locks[slot]
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.offsets_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=".offsets-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._offsets, f)
+            os.replace(tmp_path, self.offsets_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _pattern(self, keywords):
+        keywords = tuple(keywords)
+        with self._lock:
+            pattern = self._patterns.get(keywords)
+            if pattern is None:
+                pattern = self._patterns[keywords] = compile_keywords(keywords)
+            return pattern
+
+    def _read_from(self, path, offset, pattern, result):
+        """Scan complete lines of path starting at offset. Returns the offset just
+        after the last complete line."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            carry = b""
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                data = carry + chunk
+                end = data.rfind(b"\n") + 1
+                if end == 0:
+                    carry = data
+                    continue
+                self._match(data[:end], pattern, result)
+                result.bytes_read += end
+                offset += end
+                carry = data[end:]
+        return offset
+
+    def _match(self, block, pattern, result):
+        result.lines += block.count(b"\n")
+        counted_until = -1
+        for match in pattern.finditer(block):
+            keyword = match.group().decode("utf-8")
+            result.keyword_counts[keyword] += 1
+            if match.start() >= counted_until:
+                result.matching_lines += 1
+                counted_until = block.find(b"\n", match.start()) + 1
+
+    def scan(self, path, keywords, consumer="default"):
+        """
+        Scan the bytes appended to path since this consumer's last scan.
+
+        Args:
+            path (str): Log file to read.
+            keywords (iterable of str): Keywords to count.
+            consumer (str): Name of the job scanning the file; each consumer has its own offset.
+
+        Returns:
+            ScanResult: line/keyword counts for the new bytes only.
+        """
+        keywords = list(keywords)
+        result = ScanResult(path, keywords)
+        pattern = self._pattern(keywords)
+        key = f"{consumer}:{os.path.abspath(path)}"
+        with self._process_lock(zlib.crc32(key.encode("utf-8")) % KEY_LOCK_SLOTS + 1):
+            with self._lock:
+                state = dict(self._load().get(key) or {})
+            st = os.stat(path)
+            offset = state.get("offset", 0)
+            if state and (state.get("inode") != st.st_ino or state.get("device") != st.st_dev):
+                result.rotated = True
+                rotated_path = path + ".1"
+                try:
+                    old = os.stat(rotated_path)
+                    if old.st_ino == state.get("inode") and old.st_dev == state.get("device") and old.st_size > offset:
+                        self._read_from(rotated_path, offset, pattern, result)
+                except FileNotFoundError:
+                    pass
+                offset = 0
+            elif st.st_size < offset:
+                result.truncated = True
+                offset = 0
+            offset = self._read_from(path, offset, pattern, result)
+            new_state = {"inode": st.st_ino, "device": st.st_dev, "offset": offset}
+            if new_state == state:
+                #Nothing moved; keep the file as it is (the key's recency is not refreshed)
+                return result
+            with self._process_lock(0), self._lock:
+                offsets = self._load()
+                offsets[key] = new_state
+                offsets.move_to_end(key)
+                while len(offsets) > self.max_tracked:
+                    offsets.popitem(last=False)
+                self._save()
+        return result
+
+
+_tailer = None
+_tailer_lock = threading.Lock()
+
+
+def get_tailer():
+    """Return the process-wide log tailer, creating it on first use."""
+    global _tailer
+    with _tailer_lock:
+        if _tailer is None:
+            _tailer = LogTailer()
+        return _tailer
@@ -0,0 +1,234 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import stats
+from dispatch import get_dispatcher
+from histogram import BUCKET_COUNT, bucket_upper_bound
+from job_logger import get_logging_metrics
+from job_registry import executor_metrics
+from poller import get_poller
+
+#Address the metrics endpoint listens on; localhost only
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+
+#Bucket bounds (seconds) of the exported job duration histograms. The stats histograms have
+#320 fine buckets; each is counted under the first bound at or above its upper edge
+EXPORT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#For each fine histogram bucket, the index of the export bucket it falls into
+#(len(EXPORT_BUCKETS) means only +Inf)
+_EXPORT_SLOT = []
+for _index in range(BUCKET_COUNT):
+    _bound = bucket_upper_bound(_index)
+    _EXPORT_SLOT.append(next((i for i, le in enumerate(EXPORT_BUCKETS) if _bound <= le), len(EXPORT_BUCKETS)))
+
+JOB_FAMILIES = (
+    ("cron_job_runs_total", "counter", "Completed runs per job."),
+    ("cron_job_errors_total", "counter", "Runs per job that raised an error."),
+    ("cron_job_duration_seconds", "histogram", "Run duration per job."),
+)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class MetricsCollector:
+    """
+    Builds the metrics payloads.
+
+    Job counters and duration histograms come straight from the in-process
+    stats aggregator: a scrape folds the runs recorded since the previous
+    one into its totals (update_stat itself is untouched). Any object with
+    the same refresh()/add_listener()/totals() interface works too, e.g. a
+    dashboard_data.DashboardData view in another process. The rendered
+    Prometheus lines and JSON entry of each job are cached and only rebuilt
+    for the jobs that changed since the last scrape, so a scrape costs
+    O(changed jobs) plus joining the cached text.
+    Queue depths, executor saturation, poll lag and watcher counters are
+    read live from the in-process components.
+    """
+
+    def __init__(self, data=None, config=None):
+        self.data = data if data is not None else stats.aggregator
+        self.config = config
+        self._lock = threading.Lock()
+        self._lines = {}
+        self._json = {}
+        self._job_text = ""
+        self._dirty = True
+        self.data.add_listener(self._on_change)
+
+    def _on_change(self, changed, reloaded):
+        totals = self.data.totals()
+        with self._lock:
+            if reloaded:
+                self._lines = {}
+                self._json = {}
+                changed = set(totals.counters) | set(changed)
+            for job_type in changed:
+                self._render_job(job_type, totals)
+            self._dirty = True
+
+    def _render_job(self, job_type, totals):
+        entry = totals.counters.get(job_type, {})
+        hist = totals.histograms.get(job_type)
+        job = _label(job_type)
+        runs = entry.get("runs", 0)
+        total_duration = entry.get("total_duration", 0.0)
+        buckets = [0] * (len(EXPORT_BUCKETS) + 1)
+        count = 0
+        if hist is not None:
+            for index, n in enumerate(hist.counts):
+                if n:
+                    buckets[_EXPORT_SLOT[index]] += n
+            count = hist.count
+        histogram_lines = []
+        cumulative = 0
+        for le, n in zip(EXPORT_BUCKETS, buckets):
+            cumulative += n
+            histogram_lines.append(f'cron_job_duration_seconds_bucket{{job="{job}",le="{le}"}} {cumulative}')
+        histogram_lines.append(f'cron_job_duration_seconds_bucket{{job="{job}",le="+Inf"}} {count}')
+        histogram_lines.append(f'cron_job_duration_seconds_sum{{job="{job}"}} {_number(float(total_duration))}')
+        histogram_lines.append(f'cron_job_duration_seconds_count{{job="{job}"}} {count}')
+        self._lines[job_type] = (
+            f'cron_job_runs_total{{job="{job}"}} {runs}',
+            f'cron_job_errors_total{{job="{job}"}} {entry.get("errors", 0)}',
+            "\n".join(histogram_lines),
+        )
+        summary = hist.summary() if hist is not None else {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        self._json[job_type] = dict(runs=runs, errors=entry.get("errors", 0), total_duration=total_duration, **summary)
+
+    def _job_section(self):
+        self.data.refresh()
+        with self._lock:
+            if self._dirty:
+                #Families must be contiguous in the text format, so the cached lines are joined per family
+                parts = []
+                for position, (name, kind, help_text) in enumerate(JOB_FAMILIES):
+                    parts.append(f"# HELP {name} {help_text}\n# TYPE {name} {kind}")
+                    parts.extend(lines[position] for lines in self._lines.values())
+                self._job_text = "\n".join(parts) + "\n"
+                self._dirty = False
+            return self._job_text
+
+    def components(self):
+        """Live metrics of the in-process components (each empty if it isn't running)."""
+        poller = get_poller().metrics()
+        return {
+            "dispatcher": get_dispatcher().metrics(),
+            "logging": get_logging_metrics(),
+            "executors": executor_metrics(),
+            "poller": poller,
+            "watchers": self.config.watcher_metrics() if self.config is not None else {},
+        }
+
+    def prometheus(self):
+        text = [self._job_section()]
+        c = self.components()
+
+        def family(name, kind, help_text, samples):
+            text.append(f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n")
+            text.extend(f"{name}{labels} {_number(value)}\n" for labels, value in samples)
+
+        dispatcher = c["dispatcher"]
+        family("cron_dispatch_queue_depth", "gauge", "Event jobs waiting in the dispatcher queue.",
+               [("", dispatcher["queue_depth"])])
+        family("cron_dispatch_busy_workers", "gauge", "Dispatcher workers running an event job.",
+               [("", dispatcher["busy_workers"])])
+        family("cron_dispatch_dropped_total", "counter", "Event jobs dropped or rejected by the dispatcher.",
+               [("", dispatcher["dropped"] + dispatcher["rejected"])])
+        family("cron_dispatch_wait_seconds", "gauge", "Dispatcher queue wait percentiles.",
+               [(f'{{quantile="{q}"}}', dispatcher[f"wait_p{q}"]) for q in (50, 95, 99)])
+        family("cron_executor_workers", "gauge", "Worker threads per scheduler executor.",
+               [(f'{{executor="{_label(name)}"}}', e["workers"]) for name, e in c["executors"].items()])
+        family("cron_executor_busy", "gauge", "Job runs executing per scheduler executor.",
+               [(f'{{executor="{_label(name)}"}}', e["busy"]) for name, e in c["executors"].items()])
+        logging_metrics = c["logging"]
+        if logging_metrics:
+            family("cron_log_queue_depth", "gauge", "Log records waiting for the writer thread.",
+                   [("", logging_metrics["queue_depth"])])
+            family("cron_log_dropped_total", "counter", "Log records dropped because the buffer was full.",
+                   [("", logging_metrics["dropped"])])
+            family("cron_log_lag_seconds", "gauge", "Delay between logging a record and writing it.",
+                   [("", logging_metrics["last_lag"])])
+        poller = c["poller"]
+        family("cron_poll_max_lag_seconds", "gauge", "Worst delay of a poll behind its schedule.",
+               [("", poller["max_lag"])])
+        family("cron_poll_lag_seconds", "gauge", "Last poll delay per polled target (watchers and monitors).",
+               [(f'{{target="{_label(name)}"}}', t["last_lag"]) for name, t in poller["per_target"].items()])
+        family("cron_watcher_events_total", "counter", "Raw file events seen per file watcher.",
+               [(f'{{source="{_label(name)}"}}', w.get("events", 0)) for name, w in c["watchers"].items()])
+        family("cron_watcher_pending_paths", "gauge", "Paths with modify events waiting to be coalesced.",
+               [(f'{{source="{_label(name)}"}}', w["pending_paths"]) for name, w in c["watchers"].items()])
+        return "".join(text)
+
+    def json(self):
+        self._job_section()
+        with self._lock:
+            jobs = dict(self._json)
+        return dict(jobs=jobs, **self.components())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    collector = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, content_type = self.collector.prometheus(), PROMETHEUS_CONTENT_TYPE
+        elif path == "/metrics.json":
+            body, content_type = json.dumps(self.collector.json()), "application/json"
+        else:
+            self.send_error(404, "Try /metrics or /metrics.json")
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    HTTP endpoint inside the scheduler process: /metrics (Prometheus text)
+    and /metrics.json. Requests are served on their own threads, so a slow
+    scraper never holds up the jobs.
+    """
+
+    def __init__(self, collector=None, host=METRICS_HOST, port=METRICS_PORT):
+        self.collector = collector if collector is not None else MetricsCollector()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server is not None:
+            return
+        handler = type("MetricsHandler", (_Handler,), {"collector": self.collector})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        print(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            self._thread.join()
+            self._thread = None
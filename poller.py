@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import threading
+import time
+from dispatch import get_dispatcher, DispatchRejected
+
+
+class PollTarget:
+    """One registered watch: check() is called every `interval` seconds and
+    returns None when nothing changed, or a change to pass to on_change."""
+    __slots__ = ("name", "interval", "check", "on_change", "next_due", "polls", "changes", "last_lag", "removed")
+
+    def __init__(self, name, interval, check, on_change):
+        self.name = name
+        self.interval = interval
+        self.check = check
+        self.on_change = on_change
+        self.next_due = 0.0
+        self.polls = 0
+        self.changes = 0
+        self.last_lag = 0.0
+        self.removed = False
+
+
+class PollerEngine:
+    """
+    Single-thread poller for every os-polling monitor.
+
+    Targets sit in a timer heap ordered by their next due time, each with its
+    own interval. The engine thread sleeps until the earliest target is due,
+    runs its (cheap) check, and hands any detected change to on_change via the
+    shared dispatcher, so every change is recorded as its own job run and a
+    slow handler never delays the other polls. Watching hundreds of files or
+    mounts costs heap entries, not threads.
+    """
+
+    def __init__(self, name="poller", dispatcher=None):
+        self.name = name
+        self.dispatcher = dispatcher
+        self._heap = []
+        self._targets = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.max_lag = 0.0
+
+    def register(self, name, interval, check, on_change, first_delay=None):
+        """Add (or replace) a watch target. The first check runs after first_delay
+        seconds, which defaults to interval."""
+        target = PollTarget(name, interval, check, on_change)
+        target.next_due = time.monotonic() + (interval if first_delay is None else first_delay)
+        with self._cond:
+            old = self._targets.get(name)
+            if old is not None:
+                old.removed = True
+            self._targets[name] = target
+            heapq.heappush(self._heap, (target.next_due, next(self._seq), target))
+            self._cond.notify()
+        return target
+
+    def unregister(self, name):
+        with self._cond:
+            target = self._targets.pop(name, None)
+            if target is not None:
+                target.removed = True
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _next_target(self):
+        """Wait for and pop the next due target; None once stopped."""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, target = self._heap[0]
+                if target.removed:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return target
+            return None
+
+    def _reschedule(self, target, now):
+        #Keep the cadence, but don't fire a backlog of polls after a stall
+        target.next_due = max(target.next_due + target.interval, now)
+        with self._cond:
+            if not target.removed:
+                heapq.heappush(self._heap, (target.next_due, next(self._seq), target))
+
+    def _run(self):
+        while True:
+            target = self._next_target()
+            if target is None:
+                return
+            now = time.monotonic()
+            target.last_lag = now - target.next_due
+            if target.last_lag > self.max_lag:
+                self.max_lag = target.last_lag
+            target.polls += 1
+            try:
+                change = target.check()
+            except Exception as e:
+                print(f"Poll of {target.name} failed: {e}")
+                change = None
+            if change is not None:
+                target.changes += 1
+                self._dispatch(target, change)
+            self._reschedule(target, time.monotonic())
+
+    def _dispatch(self, target, change):
+        dispatcher = self.dispatcher or get_dispatcher()
+        try:
+            dispatcher.submit(target.on_change, change)
+        except DispatchRejected as e:
+            print(f"Change on {target.name} dropped: {e}")
+
+    def metrics(self):
+        """Return target count, heap size, worst and per-target poll lag (seconds)."""
+        with self._cond:
+            targets = list(self._targets.values())
+            heap_size = len(self._heap)
+        return {
+            "targets": len(targets),
+            "heap_size": heap_size,
+            "max_lag": self.max_lag,
+            "per_target": {
+                t.name: {"interval": t.interval, "polls": t.polls, "changes": t.changes, "last_lag": t.last_lag}
+                for t in targets
+            },
+        }
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    """Return the process-wide poller engine, creating it on first use."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = PollerEngine()
+        return _poller
@@ -0,0 +1,197 @@
+import asyncio
+import ssl
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+#Default per-probe timeout (seconds)
+PROBE_TIMEOUT = 5.0
+
+#Probes in flight at once
+PROBE_CONCURRENCY = 200
+
+#ping/systemctl subprocesses running at once
+SUBPROCESS_LIMIT = 16
+
+#Seconds a result is reused before the target is probed again
+CACHE_TTL = 30.0
+
+KIND_TCP = "tcp"          # target "host:port"
+KIND_UNIX = "unix"        # target is a unix socket path
+KIND_HTTP = "http"        # target is an http:// or https:// URL
+KIND_ICMP = "icmp"        # target is a host, checked with ping
+KIND_SERVICE = "service"  # target is a systemd unit, checked with systemctl is-active
+KINDS = (KIND_TCP, KIND_UNIX, KIND_HTTP, KIND_ICMP, KIND_SERVICE)
+
+ProbeResult = namedtuple("ProbeResult", ["kind", "target", "ok", "latency", "detail", "checked_at", "cached"])
+
+
+class Probe:
+    """One check to run: a kind, a target and a timeout."""
+    __slots__ = ("kind", "target", "timeout")
+
+    def __init__(self, kind, target, timeout=PROBE_TIMEOUT):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown probe kind {kind!r}, expected one of {KINDS}")
+        self.kind = kind
+        self.target = target
+        self.timeout = timeout
+
+    @property
+    def key(self):
+        return self.kind, self.target
+
+    def __repr__(self):
+        return f"Probe({self.kind!r}, {self.target!r})"
+
+
+def _split_host_port(target):
+    host, _, port = target.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+class ProbeEngine:
+    """
+    Runs many network/service checks concurrently on one asyncio loop.
+
+    TCP, unix-socket and HTTP probes are plain asyncio connections, bounded
+    by `concurrency`; ICMP and systemd probes shell out to ping/systemctl,
+    bounded by `subprocess_limit`. Every probe has its own timeout, and
+    results are cached for `cache_ttl` seconds so overlapping jobs don't
+    probe the same target twice. run() is synchronous and safe to call from
+    scheduler worker threads.
+    """
+
+    def __init__(self, concurrency=PROBE_CONCURRENCY, subprocess_limit=SUBPROCESS_LIMIT, cache_ttl=CACHE_TTL):
+        self.concurrency = concurrency
+        self.subprocess_limit = subprocess_limit
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    async def _tcp(self, probe):
+        host, port = _split_host_port(probe.target)
+        _, writer = await asyncio.open_connection(host, port)
+        await _close(writer)
+        return True, "connected"
+
+    async def _unix(self, probe):
+        _, writer = await asyncio.open_unix_connection(probe.target)
+        await _close(writer)
+        return True, "connected"
+
+    async def _http(self, probe):
+        url = urlsplit(probe.target)
+        secure = url.scheme == "https"
+        port = url.port or (443 if secure else 80)
+        reader, writer = await asyncio.open_connection(
+            url.hostname, port, ssl=ssl.create_default_context() if secure else None)
+        try:
+            path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: close\r\n"
+                         f"User-Agent: cron_project-probe\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            status_line = (await reader.readline()).decode("latin-1").strip()
+        finally:
+            await _close(writer)
+        parts = status_line.split(" ", 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            return False, f"bad response {status_line!r}"
+        status = int(parts[1])
+        return status < 400, f"HTTP {status}"
+
+    async def _command(self, args):
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            out, _ = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+        return proc.returncode, out.decode("utf-8", "replace").strip()
+
+    async def _icmp(self, probe):
+        wait = max(int(probe.timeout), 1)
+        code, _ = await self._command(["ping", "-c", "1", "-W", str(wait), probe.target])
+        return code == 0, "reply" if code == 0 else "no reply"
+
+    async def _service(self, probe):
+        _, out = await self._command(["systemctl", "is-active", probe.target])
+        return out == "active", out or "unknown"
+
+    async def _timed(self, probe):
+        checks = {KIND_TCP: self._tcp, KIND_UNIX: self._unix, KIND_HTTP: self._http,
+                  KIND_ICMP: self._icmp, KIND_SERVICE: self._service}
+        started = time.monotonic()
+        try:
+            ok, detail = await asyncio.wait_for(checks[probe.kind](probe), probe.timeout)
+        except asyncio.TimeoutError:
+            ok, detail = False, f"timed out after {probe.timeout}s"
+        except (OSError, ValueError, ssl.SSLError) as e:
+            ok, detail = False, str(e) or e.__class__.__name__
+        return ProbeResult(probe.kind, probe.target, ok, time.monotonic() - started, detail, time.time(), False)
+
+    async def _check(self, probe, semaphore, subprocess_semaphore):
+        async with semaphore:
+            if probe.kind in (KIND_ICMP, KIND_SERVICE):
+                #The timeout only starts once a subprocess slot is free
+                async with subprocess_semaphore:
+                    result = await self._timed(probe)
+            else:
+                result = await self._timed(probe)
+        with self._lock:
+            self._cache[probe.key] = result
+        return result
+
+    async def _run_all(self, probes):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        subprocess_semaphore = asyncio.Semaphore(self.subprocess_limit)
+        return await asyncio.gather(*(self._check(p, semaphore, subprocess_semaphore) for p in probes))
+
+    def run(self, probes, use_cache=True):
+        """
+        Check every probe concurrently and return their ProbeResults in the same order.
+
+        Args:
+            probes (list of Probe): Checks to run.
+            use_cache (bool): Reuse results younger than cache_ttl instead of probing again.
+        """
+        probes = list(probes)
+        results = [None] * len(probes)
+        pending = []
+        now = time.time()
+        with self._lock:
+            for i, probe in enumerate(probes):
+                cached = self._cache.get(probe.key) if use_cache else None
+                if cached is not None and now - cached.checked_at < self.cache_ttl:
+                    results[i] = cached._replace(cached=True)
+                else:
+                    pending.append(i)
+        if pending:
+            fresh = asyncio.run(self._run_all([probes[i] for i in pending]))
+            for i, result in zip(pending, fresh):
+                results[i] = result
+        return results
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_probe_engine():
+    """Return the process-wide probe engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ProbeEngine()
+        return _engine
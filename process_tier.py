@@ -0,0 +1,84 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+from job_logger import log_job
+
+#Worker processes kept warm for CPU-heavy jobs
+PROCESS_WORKERS = 2
+
+#Workers are started fresh (not forked from the threaded scheduler) and reused across runs
+START_METHOD = "spawn"
+
+
+def _run_unwrapped(func, args, kwargs):
+    """Worker side: run the job body without its log_job wrapper, so logging and
+    stats stay with the parent process."""
+    return getattr(func, "__wrapped__", func)(*args, **kwargs)
+
+
+class ProcessTier:
+    """
+    Warm process pool for CPU-bound jobs.
+
+    The worker processes are created on first use and reused for every run,
+    so they don't fight the scheduler's monitor threads for the GIL. Only
+    the job body crosses the process boundary: the job function is sent by
+    reference, its return value (or exception) comes back to the parent.
+    """
+
+    def __init__(self, workers=PROCESS_WORKERS, start_method=START_METHOD):
+        self.workers = workers
+        self.start_method = start_method
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(self.start_method))
+            return self._pool
+
+    def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in a worker process and return its result (raising its exception)."""
+        return self._get_pool().submit(_run_unwrapped, func, args, kwargs).result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_tier = None
+_tier_lock = threading.Lock()
+
+
+def get_process_tier():
+    """Return the process-wide process tier, creating it on first use."""
+    global _tier
+    with _tier_lock:
+        if _tier is None:
+            _tier = ProcessTier()
+        return _tier
+
+
+def process_job(func, tier=None):
+    """
+    Wrap a log_job-decorated job so its body runs on the process tier.
+
+    The returned callable runs in the parent (on a scheduler thread) under the
+    same log_job key, so start/finish logging, timing, error accounting and
+    stats all happen in the parent; an exception raised in the worker is
+    re-raised here and counted as a failed run.
+    """
+    job_key = getattr(func, "job_key", None)
+    if job_key is None:
+        raise ValueError(f"{func!r} is not a log_job job; it can't be moved to the process tier")
+
+    @log_job(job_key, func.description, func.file_type)
+    @wraps(func.__wrapped__)
+    def run_in_process(*args, **kwargs):
+        return (tier or get_process_tier()).run(func, *args, **kwargs)
+    return run_in_process
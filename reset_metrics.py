@@ -1,4 +1,5 @@
 import json
+from journal import RunJournal
 
 #Load the current stats (from stats.json)
 with open("stats.json", "r") as f:
@@ -13,9 +14,15 @@ for job, data in stats.items():
             data["total_duration"] = 0
         if "errors" in data:
             data["errors"] = 0
+        #Latency histograms and per-minute windows restart empty
+        data.pop("histogram", None)
+        data.pop("window", None)
 
 #Save the updated stats
 with open("stats.json", "w") as f:
     json.dump(stats, f, indent=4)
 
+#Drop the run journal too, otherwise its tail would be replayed on top of the reset totals
+RunJournal().clear()
+
 print("Stats reset: run counts, durations, and errors set to 0.")
\ No newline at end of file
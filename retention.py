@@ -0,0 +1,307 @@
+import fnmatch
+import gzip
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+#Directory listings run in parallel on this many walker threads
+WALK_WORKERS = 4
+
+#Delete/archive operations per second, so a big cleanup doesn't cause an I/O storm
+MAX_OPS_PER_SECOND = 200
+
+#Errors kept verbatim in a report (the rest are only counted)
+MAX_REPORTED_ERRORS = 20
+
+ACTION_DELETE = "delete"
+ACTION_ARCHIVE = "archive"
+ACTIONS = (ACTION_DELETE, ACTION_ARCHIVE)
+
+#What a rule measures a file's age from: its modification time, or the latest of its
+#access, modification and change times (nothing has used the file since)
+AGE_MTIME = "mtime"
+AGE_TOUCHED = "touched"
+AGE_SOURCES = (AGE_MTIME, AGE_TOUCHED)
+
+
+class RetentionRule:
+    """
+    One declarative cleanup rule. A file matches when its name matches
+    `pattern` and it is older than `min_age` seconds and larger than
+    `min_size` bytes; the newest `keep` matching files of each directory are
+    always kept. Matched files are deleted, or moved to `archive_dir`
+    (gzip-compressed when `compress` is set). With `prune_empty_dirs`,
+    directories the run itself emptied, and older than min_age, are removed
+    as well. Age is taken from `age_from` (AGE_MTIME or AGE_TOUCHED).
+    Only regular files are ever matched.
+    """
+
+    def __init__(self, pattern="*", min_age=0, min_size=0, keep=0, action=ACTION_DELETE,
+                 archive_dir=None, compress=False, prune_empty_dirs=False, age_from=AGE_MTIME):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown retention action {action!r}, expected one of {ACTIONS}")
+        if action == ACTION_ARCHIVE and not archive_dir:
+            raise ValueError("The archive action needs an archive_dir")
+        if age_from not in AGE_SOURCES:
+            raise ValueError(f"Unknown retention age source {age_from!r}, expected one of {AGE_SOURCES}")
+        self.pattern = pattern
+        self.min_age = min_age
+        self.min_size = min_size
+        self.keep = keep
+        self.action = action
+        self.archive_dir = archive_dir
+        self.compress = compress
+        self.prune_empty_dirs = prune_empty_dirs
+        self.age_from = age_from
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def age_time(self, mtime, touched):
+        return touched if self.age_from == AGE_TOUCHED else mtime
+
+    def matches(self, name, size, mtime, touched, now):
+        return (fnmatch.fnmatch(name, self.pattern)
+                and now - self.age_time(mtime, touched) >= self.min_age
+                and size >= self.min_size)
+
+
+class RetentionReport:
+    """What one retention run did (or, in dry-run mode, would have done)."""
+
+    def __init__(self, root, dry_run):
+        self.root = root
+        self.dry_run = dry_run
+        self.files_scanned = 0
+        self.dirs_scanned = 0
+        self.files_matched = 0
+        self.files_kept = 0
+        self.files_deleted = 0
+        self.files_archived = 0
+        self.dirs_removed = 0
+        self.bytes_reclaimed = 0
+        self.bytes_archived = 0
+        self.error_count = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def error(self, path, exc):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"{path}: {exc}")
+
+    def to_dict(self):
+        return {key: value for key, value in self.__dict__.items()}
+
+    def __str__(self):
+        verb = "would reclaim" if self.dry_run else "reclaimed"
+        return (f"{self.root}: {verb} {self.bytes_reclaimed} bytes "
+                f"({self.files_deleted} deleted, {self.files_archived} archived, {self.dirs_removed} dirs removed, "
+                f"{self.files_kept} kept, {self.error_count} errors) in {self.seconds:.2f}s")
+
+
+class _RateLimiter:
+    """Spaces operations at least 1/ops_per_second apart (shared by all callers)."""
+
+    def __init__(self, ops_per_second):
+        self.interval = 1.0 / ops_per_second if ops_per_second else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _scan_dir(path):
+    """List one directory: ([(path, name, size, mtime, touched)] regular files,
+    [(path, name, mtime, st)] dirs, error). Symlinks, sockets, FIFOs and device
+    nodes are left out."""
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        dirs.append((entry.path, entry.name, st.st_mtime, st))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, entry.name, st.st_size, st.st_mtime,
+                                      max(st.st_atime, st.st_mtime, st.st_ctime)))
+                except FileNotFoundError:
+                    continue
+    except OSError as e:
+        return files, dirs, e
+    return files, dirs, None
+
+
+class RetentionEngine:
+    """
+    Applies retention rules to a directory tree.
+
+    Directories are listed with os.scandir on a pool of walker threads. Each
+    file is checked against the rules in order and the first matching rule
+    decides; keep-N is applied per directory once the walk is done. The
+    resulting deletes/moves go through a rate limiter, failures are counted
+    and reported instead of being silently ignored, and dry_run only reports.
+    With skip_hidden_dirs, dot-directories are not entered; with
+    skip_system_dirs, neither are root-owned sticky directories (such as
+    the socket directories under /tmp).
+    """
+
+    def __init__(self, rules, dry_run=False, recursive=True, workers=WALK_WORKERS,
+                 max_ops_per_second=MAX_OPS_PER_SECOND, skip_hidden_dirs=False, skip_system_dirs=False):
+        self.rules = [r if isinstance(r, RetentionRule) else RetentionRule.from_dict(r) for r in rules]
+        self.dry_run = dry_run
+        self.recursive = recursive
+        self.skip_hidden_dirs = skip_hidden_dirs
+        self.skip_system_dirs = skip_system_dirs
+        self.workers = workers
+        self.limiter = _RateLimiter(max_ops_per_second)
+
+    def _walk(self, root, report):
+        #Never descend into an archive directory that lives inside the tree
+        skip = {os.path.abspath(r.archive_dir) for r in self.rules if r.archive_dir}
+        files = []
+        dirs = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="retention-walk") as pool:
+            pending = {pool.submit(_scan_dir, root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_files, subdirs, error = future.result()
+                    report.dirs_scanned += 1
+                    if error is not None:
+                        report.error(error.filename or root, error.strerror or error)
+                        continue
+                    files.extend(dir_files)
+                    for path, name, mtime, st in subdirs:
+                        if os.path.abspath(path) in skip or self._skipped_dir(name, st):
+                            continue
+                        dirs.append((path, name, mtime, st))
+                        if self.recursive:
+                            pending.add(pool.submit(_scan_dir, path))
+        report.files_scanned = len(files)
+        return files, dirs
+
+    def _skipped_dir(self, name, st):
+        if self.skip_hidden_dirs and name.startswith("."):
+            return True
+        return self.skip_system_dirs and bool(st.st_mode & stat.S_ISVTX) and st.st_uid == 0
+
+    def _select(self, files, now, report):
+        """Return [(rule, path, size)] to act on, after keep-N per directory."""
+        by_group = {}
+        for path, name, size, mtime, touched in files:
+            for index, rule in enumerate(self.rules):
+                if rule.matches(name, size, mtime, touched, now):
+                    by_group.setdefault((index, os.path.dirname(path)), []).append(
+                        (rule.age_time(mtime, touched), path, size))
+                    break
+        selected = []
+        for (index, _), matched in by_group.items():
+            rule = self.rules[index]
+            report.files_matched += len(matched)
+            if rule.keep:
+                matched.sort(reverse=True)
+                report.files_kept += min(rule.keep, len(matched))
+                matched = matched[rule.keep:]
+            selected.extend((rule, path, size) for _, path, size in matched)
+        return selected
+
+    def _archive_target(self, rule, root, path):
+        rel = os.path.relpath(path, root)
+        target = os.path.join(rule.archive_dir, rel + (".gz" if rule.compress else ""))
+        if os.path.exists(target):
+            stem, ext = (target[:-3], ".gz") if rule.compress else os.path.splitext(target)
+            target = f"{stem}.{time.strftime('%Y%m%d%H%M%S')}{ext}"
+        return target
+
+    def _apply(self, rule, root, path, size, report):
+        if rule.action == ACTION_DELETE:
+            if not self.dry_run:
+                self.limiter.wait()
+                os.remove(path)
+            report.files_deleted += 1
+            report.bytes_reclaimed += size
+            return
+        target = self._archive_target(rule, root, path)
+        if self.dry_run:
+            report.files_archived += 1
+            report.bytes_archived += size
+            return
+        self.limiter.wait()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if rule.compress:
+            with open(path, "rb") as src, gzip.open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            shutil.copystat(path, target)
+            os.remove(path)
+            written = os.path.getsize(target)
+        else:
+            shutil.move(path, target)
+            written = size
+        report.files_archived += 1
+        report.bytes_archived += written
+        #An archive on the same filesystem only frees what compression saved
+        if os.stat(os.path.dirname(target)).st_dev != os.stat(root).st_dev:
+            report.bytes_reclaimed += size
+        else:
+            report.bytes_reclaimed += max(size - written, 0)
+
+    def _prune_dirs(self, dirs, removed, now, report):
+        """Remove the directories this run emptied. `removed` holds the paths the run
+        deleted or moved (or, in dry-run mode, would have); pruned dirs are added to it."""
+        emptied = {os.path.dirname(path) for path in removed}
+        #Deepest first, so a parent emptied by removing its children goes too
+        for path, name, mtime, st in sorted(dirs, key=lambda d: d[0].count(os.sep), reverse=True):
+            if path not in emptied:
+                continue
+            for rule in self.rules:
+                if rule.prune_empty_dirs and fnmatch.fnmatch(name, rule.pattern) and now - mtime >= rule.min_age:
+                    try:
+                        if self.dry_run:
+                            if any(os.path.join(path, n) not in removed for n in os.listdir(path)):
+                                break
+                        else:
+                            self.limiter.wait()
+                            os.rmdir(path)
+                        report.dirs_removed += 1
+                        removed.add(path)
+                        emptied.add(os.path.dirname(path))
+                    except OSError:
+                        pass  # not empty (or already gone)
+                    break
+
+    def run(self, root):
+        """Apply the rules under root and return a RetentionReport."""
+        started = time.time()
+        report = RetentionReport(root, self.dry_run)
+        files, dirs = self._walk(root, report)
+        removed = set()
+        for rule, path, size in self._select(files, started, report):
+            try:
+                self._apply(rule, root, path, size, report)
+                removed.add(path)
+            except OSError as e:
+                report.error(path, e)
+        self._prune_dirs(dirs, removed, started, report)
+        report.seconds = time.time() - started
+        return report
+
+
+def apply_retention(root, rules, dry_run=False, recursive=True, **options):
+    """Run a RetentionEngine over root and return its report."""
+    return RetentionEngine(rules, dry_run=dry_run, recursive=recursive, **options).run(root)
@@ -1,20 +1,41 @@
-def monitor_and_rollback():
+import time
+from job_state import JobStateStore, JOB_STATE_DB
+
+#A job whose stored next run is this many seconds in the past is reported as overdue
+OVERDUE_AFTER = 300
+
+
+def monitor_and_rollback(path=JOB_STATE_DB, now=None):
     """
-    Placeholder function to monitor scheduler performance.
-    In full implementation, function would check for job errors
-    or performance issues/signals to decide if a rollback is necessary.
+    Check the persistent job state for signs the scheduler is unhealthy:
+    jobs overdue for their next run, runs interrupted mid-way (their lease
+    was left behind by a process that died or ran past its lease) and jobs
+    whose last run failed. Nothing is changed: stale leases are left for the
+    scheduler, which replays those runs on its next start (see
+    JobStateTracker.plan_catch_up).
+    Returns a dict of the findings.
     """
     print("Monitoring scheduler performance...")
-    # Example: if an anomaly is detected, call the rollback function.
-    anomaly_detected = False
-    if anomaly_detected:
-        rollback()
+    now = time.time() if now is None else now
+    store = JobStateStore(path)
+    try:
+        states = store.states()
+        findings = {
+            "overdue": [s["job_id"] for s in states if s["next_run"] is not None and now - s["next_run"] > OVERDUE_AFTER],
+            "failing": [s["job_id"] for s in states if s["last_outcome"] == "error"],
+            "interrupted": [lease["job_id"] for lease in store.stale_leases(now=now)],
+        }
+        for job_id in findings["overdue"]:
+            print(f"Job {job_id} is overdue: the scheduler may not be running.")
+        for state in states:
+            if state["last_outcome"] == "error":
+                print(f"Job {state['job_id']} failed on its last run ({time.ctime(state['last_run'])}): {state['last_error']}")
+        for job_id in findings["interrupted"]:
+            print(f"Run of {job_id} was interrupted; the scheduler replays it on its next start.")
+        return findings
+    finally:
+        store.close()
 
-def rollback():
-    """
-    Perform rollback of scheduler configuration to a previous stable state.
-    """
-    print("Anomaly detected! Rolling back scheduler configuration to a previous stable state.")
 
 if __name__ == "__main__":
     monitor_and_rollback()
@@ -0,0 +1,99 @@
+#Width of one bucket in seconds
+BUCKET_SECONDS = 60
+
+#Default number of per-minute buckets kept per job (one hour)
+RETENTION_MINUTES = 60
+
+
+class RollingWindow:
+    """
+    Fixed-size ring buffer of per-minute buckets for one job.
+
+    Each bucket holds runs, errors, the duration sum and the duration maximum
+    for one wall-clock minute. A slot is reused once its minute falls out of
+    the retention period, so memory is fixed by the retention, not by the
+    number of runs. Two windows merge bucket by bucket.
+    """
+    __slots__ = ("size", "minutes", "runs", "errors", "duration_sum", "duration_max")
+
+    def __init__(self, size=RETENTION_MINUTES):
+        self.size = size
+        self.minutes = [-1] * size
+        self.runs = [0] * size
+        self.errors = [0] * size
+        self.duration_sum = [0.0] * size
+        self.duration_max = [0.0] * size
+
+    def add(self, minute, runs=1, errors=0, duration_sum=0.0, duration_max=0.0):
+        """Add counts to the bucket for an epoch minute. Minutes older than the
+        slot's current contents are outside the retention and ignored."""
+        slot = minute % self.size
+        current = self.minutes[slot]
+        if current != minute:
+            if current > minute:
+                return
+            self.minutes[slot] = minute
+            self.runs[slot] = 0
+            self.errors[slot] = 0
+            self.duration_sum[slot] = 0.0
+            self.duration_max[slot] = 0.0
+        self.runs[slot] += runs
+        self.errors[slot] += errors
+        self.duration_sum[slot] += duration_sum
+        if duration_max > self.duration_max[slot]:
+            self.duration_max[slot] = duration_max
+
+    def record(self, timestamp, duration, error=False):
+        """Count one run that started at timestamp (epoch seconds)."""
+        self.add(int(timestamp // BUCKET_SECONDS), 1, 1 if error else 0, duration, duration)
+
+    def buckets(self):
+        """Return the non-empty buckets as (minute, runs, errors, duration_sum, duration_max), oldest first."""
+        return sorted(
+            (self.minutes[i], self.runs[i], self.errors[i], self.duration_sum[i], self.duration_max[i])
+            for i in range(self.size) if self.minutes[i] >= 0
+        )
+
+    def merge(self, other):
+        """Add every bucket of another window into this one."""
+        for bucket in other.buckets():
+            self.add(*bucket)
+        return self
+
+    def resized(self, size):
+        """Return a copy with a different retention, keeping the newest buckets."""
+        return RollingWindow(size).merge(self)
+
+    def series(self, now, minutes=None):
+        """Return a dense, oldest-first time series for the last minutes buckets
+        ending at epoch time now. Minutes without runs are filled with zeros."""
+        minutes = min(minutes or self.size, self.size)
+        last = int(now // BUCKET_SECONDS)
+        points = []
+        for minute in range(last - minutes + 1, last + 1):
+            slot = minute % self.size
+            if self.minutes[slot] == minute:
+                runs, errors = self.runs[slot], self.errors[slot]
+                duration_sum, duration_max = self.duration_sum[slot], self.duration_max[slot]
+            else:
+                runs = errors = 0
+                duration_sum = duration_max = 0.0
+            points.append({
+                "time": minute * BUCKET_SECONDS,
+                "runs": runs,
+                "errors": errors,
+                "duration_sum": duration_sum,
+                "duration_max": duration_max,
+            })
+        return points
+
+    def to_list(self):
+        """Serialize the non-empty buckets as a JSON-friendly list."""
+        return [list(bucket) for bucket in self.buckets()]
+
+    @classmethod
+    def from_list(cls, data, size=RETENTION_MINUTES):
+        window = cls(size)
+        for bucket in data:
+            window.add(*bucket)
+        return window
@@ -0,0 +1,215 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+import psutil
+
+#Seconds between samples
+SAMPLE_INTERVAL = 5.0
+
+#Samples kept in memory (1 hour at the default interval)
+BUFFER_SAMPLES = 720
+
+#Filesystem whose usage is sampled
+DISK_PATH = "/"
+
+#Processes listed in each sample when the per-process breakdown is on
+TOP_PROCESSES = 10
+
+#Latest samples written here for other processes (e.g. the dashboard). Will be created in project root
+SAMPLES_FILE = "resource_samples.json"
+
+#Samples written to SAMPLES_FILE
+FILE_SAMPLES = 60
+
+
+def _read_temperatures():
+    if not hasattr(psutil, "sensors_temperatures"):
+        return {}
+    try:
+        temps = psutil.sensors_temperatures()
+    except Exception:
+        return {}
+    return {name: [[entry.label, entry.current] for entry in entries] for name, entries in temps.items()}
+
+
+class ResourceSampler:
+    """
+    Background sampler for host resources.
+
+    One thread reads CPU, memory, disk, temperatures and network counters
+    every `interval` seconds (optionally with the top processes by memory)
+    into a bounded in-memory ring of samples. CPU is measured as the delta
+    since the previous sample, so nothing ever sleeps inside psutil. Jobs and
+    the dashboard read the buffer instead of taking their own blocking
+    readings; when samples_file is set the latest samples are also written
+    there for other processes.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, size=BUFFER_SAMPLES, disk_path=DISK_PATH,
+                 per_process=False, top_processes=TOP_PROCESSES, samples_file=None):
+        self.interval = interval
+        self.disk_path = disk_path
+        self.per_process = per_process
+        self.top_processes = top_processes
+        self.samples_file = samples_file
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_net = None
+        self._procs = {}
+        #Prime the CPU counters so the first sample has a delta to measure
+        psutil.cpu_percent(interval=None)
+
+    def _process_breakdown(self):
+        seen = {}
+        for fresh in psutil.process_iter(["pid", "name"]):
+            pid = fresh.info["pid"]
+            #Reuse Process objects so cpu_percent() measures since the previous sample
+            proc = self._procs.get(pid, fresh)
+            try:
+                with proc.oneshot():
+                    mem = proc.memory_info()
+                    seen[pid] = proc
+                    yield {
+                        "pid": pid,
+                        "name": fresh.info["name"],
+                        "cpu": proc.cpu_percent(interval=None),
+                        "rss": mem.rss,
+                    }
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        self._procs = seen
+
+    def sample(self):
+        """Take one sample now (non-blocking), add it to the buffer and return it."""
+        now = time.time()
+        memory = psutil.virtual_memory()
+        try:
+            disk = psutil.disk_usage(self.disk_path).percent
+        except OSError:
+            disk = None
+        net = psutil.net_io_counters()
+        sent_rate = recv_rate = 0.0
+        if net is not None and self._last_net is not None:
+            elapsed = now - self._last_net[0]
+            if elapsed > 0:
+                sent_rate = max(net.bytes_sent - self._last_net[1], 0) / elapsed
+                recv_rate = max(net.bytes_recv - self._last_net[2], 0) / elapsed
+        if net is not None:
+            self._last_net = (now, net.bytes_sent, net.bytes_recv)
+        sample = {
+            "time": now,
+            "cpu": psutil.cpu_percent(interval=None),
+            "memory": memory.percent,
+            "memory_used": memory.used,
+            "disk": disk,
+            "temperatures": _read_temperatures(),
+            "net_bytes_sent": net.bytes_sent if net is not None else None,
+            "net_bytes_recv": net.bytes_recv if net is not None else None,
+            "net_sent_rate": sent_rate,
+            "net_recv_rate": recv_rate,
+        }
+        if self.per_process:
+            procs = sorted(self._process_breakdown(), key=lambda p: p["rss"], reverse=True)
+            sample["processes"] = procs[:self.top_processes]
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def _write_file(self):
+        with self._lock:
+            samples = list(self._samples)[-FILE_SAMPLES:]
+        directory = os.path.dirname(os.path.abspath(self.samples_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=".samples-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(samples, f)
+            os.replace(tmp_path, self.samples_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+                if self.samples_file:
+                    self._write_file()
+            except Exception as e:
+                print(f"Resource sample failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def latest(self):
+        """Most recent sample; takes one immediately if the buffer is still empty."""
+        with self._lock:
+            if self._samples:
+                return self._samples[-1]
+        return self.sample()
+
+    def samples(self, seconds=None):
+        """Buffered samples, oldest first, optionally only those from the last `seconds`."""
+        with self._lock:
+            samples = list(self._samples)
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            samples = [s for s in samples if s["time"] >= cutoff]
+        return samples
+
+    def average(self, field, seconds=None):
+        """Mean of a numeric field over the buffered samples (the latest value if none are in range)."""
+        values = [s[field] for s in self.samples(seconds) if s.get(field) is not None]
+        if not values:
+            return self.latest().get(field)
+        return sum(values) / len(values)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Return the process-wide resource sampler, creating it on first use."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = ResourceSampler()
+        return _sampler
+
+
+def configure_sampler(interval=SAMPLE_INTERVAL, size=BUFFER_SAMPLES, disk_path=DISK_PATH,
+                      per_process=False, top_processes=TOP_PROCESSES, samples_file=None):
+    """Replace the process-wide sampler. Call before it is started."""
+    global _sampler
+    with _sampler_lock:
+        old, _sampler = _sampler, ResourceSampler(interval, size, disk_path, per_process, top_processes, samples_file)
+    if old is not None:
+        old.stop()
+    return _sampler
+
+
+def read_samples_file(path=SAMPLES_FILE):
+    """Samples written by a sampler in another process ([] if there are none)."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
@@ -1,109 +1,132 @@
 import time
 import os
+import argparse
+import signal
 import streamlit as st
 import threading
-from apscheduler.schedulers.background import BackgroundScheduler
-from jobs import time_based, event_based
+from jobs import event_based
+import stats
+from dispatch import get_dispatcher, DispatchRejected
+from poller import get_poller
+from job_logger import shutdown_logging
+from job_profiler import configure_profiling, get_profiler
+from sampler import configure_sampler, get_sampler, SAMPLES_FILE
+from job_config import JobConfigManager, CONFIG_FILE
+from process_tier import get_process_tier
+from job_state import JobStateStore, JobStateTracker
+from cluster import join_cluster
+from metrics_server import MetricsServer, MetricsCollector, METRICS_PORT
+from leak_detector import get_self_check
 
 #Function to listen for manual event input from the terminal
 def event_listener():
     """Continuously listens for user input on the terminal.
-    If user types an event command, it triggers an event-based job in a new thread.
+    If user types an event command, it queues an event-based job on the shared dispatcher.
     Type 'quit' to stop the listener """
+    dispatcher = get_dispatcher()
     while True:
         event = input("Enter event (or 'quit' to exit event listener): ")
         if event.lower() == 'quit':
             break
         # If the event starts with "click", treat it as a click event.
-        if event.lower().startswith("click"):
-            threading.Thread(target=event_based.run_click_event, args=(event,), daemon=True).start()
-        else:
-            threading.Thread(target=event_based.run_event_job, args=(event,), daemon=True).start()
+        job = event_based.run_click_event if event.lower().startswith("click") else event_based.run_event_job
+        try:
+            dispatcher.submit(job, event)
+        except DispatchRejected as e:
+            print(f"Event '{event}' dropped: {e}")
+
+def wait_for_signal():
+    """Block until SIGINT or SIGTERM (used instead of the event listener with --headless)."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
 
 def main():
-    #Create an instance of the BackgroundScheduler.
-    scheduler = BackgroundScheduler()
+    parser = argparse.ArgumentParser(description="Run the job scheduler.")
+    parser.add_argument("--cluster", metavar="DB", help="Shared job state file; scheduler processes using the same file split the jobs between them")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help=f"Port of the localhost metrics endpoint (default {METRICS_PORT}, 0 disables it)")
+    parser.add_argument("--headless", action="store_true", help="Don't read events from the terminal; run until SIGINT/SIGTERM")
+    parser.add_argument("--profile", nargs="*", metavar="JOB", help="Profile job runs (all jobs, or only the given job keys) into job_profiles/; see job_profiler.py")
+    parser.add_argument("--trace-leaks", action="store_true", help="Trace the scheduler's own allocations with tracemalloc, so the memory leak job reports where they grow (slows allocation down)")
+    args = parser.parse_args()
+    if args.profile is not None:
+        configure_profiling(jobs=args.profile)
+    if args.trace_leaks:
+        get_self_check().start()
 
-    """Schedule time-based jobs with various triggers. 
-    Interval trigger for jobs that you want to run every x minutes, hours, etc. 
-    Cron trigger for jobs that you want to run at a specified date/time interval ex: Run every Monday at 2AM or run everyday at 4:30AM"""
-    scheduler.add_job(time_based.run_system_monitor, 'interval', minutes=5, id='run_system_monitor')
-    scheduler.add_job(time_based.daily_log_rotation, 'cron', hour=0, minute=0, id='daily_log_rotation')
-    scheduler.add_job(time_based.automated_backup, 'cron', hour=1, id='automated_backup')
-    scheduler.add_job(time_based.update_check, 'cron', day_of_week='mon', hour=2, minute=0, id='update_check')
-    scheduler.add_job(time_based.security_scan, 'cron', day_of_week='sun', hour=3, minute=0, id='security_scan')
-    scheduler.add_job(time_based.clean_temp, 'interval', hours=1, id='clean_temp')
-    scheduler.add_job(time_based.send_status_report, 'interval', minutes=30, id='send_status_report')
-    scheduler.add_job(time_based.db_cleanup, 'cron', hour=4, minute=30, id='db_cleanup')
-    scheduler.add_job(time_based.ping_test, 'interval', minutes=5, id='ping_test')
-    scheduler.add_job(time_based.log_disk_usage, 'interval', hours=1, id='log_disk_usage')
-    scheduler.add_job(time_based.resource_usage_trend_logger, 'interval', minutes=10, id='resource_usage_trend_logger')
-    scheduler.add_job(time_based.memory_leak_detector, 'interval', minutes=2, id='memory_leak_detector')
-    scheduler.add_job(time_based.log_file_analysis, 'cron', hour=5, minute=15, id='log_file_analysis')
-    scheduler.add_job(time_based.service_health_check, 'interval', minutes=4, id='service_health_check')
-    scheduler.add_job(time_based.temperature_monitoring, 'interval', minutes=15, id='temperature_monitoring')
-    scheduler.add_job(time_based.force_error, trigger='interval', seconds=30, id='force_error_job')
+    #Start the shared resource sampler first so the monitoring jobs always have a reading
+    configure_sampler(samples_file=SAMPLES_FILE).start()
+
+    """Jobs, their triggers and execution policies, and the event sources (file watcher and
+    os-polling monitors) are declared in jobs_config.json; see job_config for the format.
+    Interval trigger for jobs that you want to run every x minutes, hours, etc.
+    Cron trigger for jobs that you want to run at a specified date/time interval ex: Run every Monday at 2AM or run everyday at 4:30AM
+    The config is validated and compiled once, and edits to the file are hot-reloaded:
+    only jobs and sources that changed are added, removed or rescheduled."""
+    #Every run takes a lease and records its outcome in job_state.db. In a cluster the
+    #state is shared, and a run only goes ahead on the node owning the job on the hash ring
+    if args.cluster:
+        node = join_cluster(args.cluster)
+        tracker = JobStateTracker(node.store, owner=node.node_id, lease_ttl=node.lease_ttl)
+        run_wrappers = [tracker.wrap, node.wrap]
+        node.start()
+    else:
+        node = None
+        tracker = JobStateTracker(JobStateStore())
+        run_wrappers = [tracker.wrap]
+    config = JobConfigManager(CONFIG_FILE, run_wrappers=run_wrappers)
+    scheduler = config.start()
+    stats.initialize_stats(config.config.stats_keys())
+
+    #Work out which runs were missed while the scheduler was down, before start() reschedules everything
+    tracker.plan_catch_up(scheduler, config.config.registry)
 
     #Start scheduler so jobs can begin executing.
     scheduler.start()
+    tracker.catch_up() #Replay a bounded number of the missed/interrupted runs
     print("Scheduler started with time-based jobs.")
 
-    # -------------------------------
-    # Start Event-Based Threads (only once)
-    # -------------------------------
-
-    # 1. Start file watcher thread that monitors file system events
-    if not hasattr(main, "threads_started"):
-        #File watcher
-        watcher_thread = threading.Thread(
-            target = event_based.start_file_watcher,
-            args = ("watched_directory",),
-            daemon = True
-        )
-        watcher_thread.start()
-
-    # 2. Start a thread to poll directory changes using os.listdir
-    dir_poll_thread = threading.Thread(
-        target=event_based.poll_directory_changes,
-        args=("watched_directory", 10),  # (directory, polling interval in seconds)
-        daemon=True
-    )
-    dir_poll_thread.start()
+    #Serve /metrics (Prometheus text) and /metrics.json on localhost
+    metrics = None
+    if args.metrics_port:
+        metrics = MetricsServer(MetricsCollector(config=config), port=args.metrics_port)
+        try:
+            metrics.start()
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {args.metrics_port}: {e}")
+            metrics = None
 
-    # 3. Start a thread to poll file attribute changes for a specific file using os.stat
-    file_poll_thread = threading.Thread(
-        target=event_based.poll_file_attribute_changes,
-        args=("/home/mozelle/cron_project/watched_directory/permanent.txt", 10),  # (file path, polling interval)
-        daemon=True
-    )
-    file_poll_thread.start()
-
-    # 4. Start a thread to poll disk space on the root mount using os.statvfs
-    disk_poll_thread = threading.Thread(
-        target=event_based.poll_disk_space,
-        args=("/", 10, 30),  # (mount point, threshold percentage, polling interval)
-        daemon=True
-    )
-    disk_poll_thread.start()
-
-    # 5. Start a thread to poll environment variable changes
-    env_poll_thread = threading.Thread(
-        target=event_based.poll_env_variable_change,
-        args=("MY_VAR", 10),  # (environment variable name, polling interval)
-        daemon=True
-    )
-    env_poll_thread.start()
+    # Start the os-polling monitors on the shared poller engine (one thread for all of them),
+    # which also watches the config file for changes
+    config.watch()
+    get_poller().start()
     print("All event-based threads have been started.")
 
     # -------------------------------
     # Start Manual Event Listener
     # -------------------------------
     try:
-        event_listener() #Runs manual event input listener
+        if args.headless:
+            wait_for_signal()
+        else:
+            event_listener() #Runs manual event input listener
     except (KeyboardInterrupt, SystemExit):
         pass
     finally:
+        if metrics is not None:
+            metrics.stop()
         scheduler.shutdown() #Cleanly shutdown the scheduler on exit
+        get_poller().stop()
+        config.stop() #Stop the file watchers and polling monitors
+        if node is not None:
+            node.stop() #Leave the cluster so the other nodes take over our jobs straight away
+        get_sampler().stop()
+        get_profiler().stop()
+        get_dispatcher().shutdown() #Let queued event jobs finish
+        get_process_tier().shutdown() #Stop the warm worker processes
+        stats.shutdown() #Write out any stats still held in memory
+        shutdown_logging() #Drain buffered job log records to disk
         print("Scheduler shutdown.")
 
 
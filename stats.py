@@ -1,6 +1,13 @@
+import itertools
 import json
 import threading
 import os
+import re
+import tempfile
+import time
+from journal import RunJournal
+from histogram import LatencyHistogram
+from rolling import RollingWindow, RETENTION_MINUTES
 
 #The file where stats are stored. Will be created in project root
 STATS_FILE = "stats.json"
@@ -8,101 +15,517 @@ STATS_FILE = "stats.json"
 #A lock to make sure file operations are thread-safe
 lock = threading.Lock()
 
+#Reserved key in stats.json recording which journal segments the snapshot already includes
+JOURNAL_KEY = "_journal"
 
-def initialize_stats():
+#Bytes read from the end of stats.json to find the journal generation without parsing the
+#whole file (compaction writes JOURNAL_KEY last)
+SNAPSHOT_TAIL_BYTES = 256
+_GENERATION_TAIL = re.compile(rb'"' + re.escape(JOURNAL_KEY.encode("utf-8"))
+                              + rb'":\s*\{\s*"generation":\s*(\d+)\s*\}\s*\}\s*$')
+
+#Per-job keys holding the serialized latency histogram and rolling per-minute window
+HISTOGRAM_KEY = "histogram"
+WINDOW_KEY = "window"
+
+#Compact the run journal into stats.json every FLUSH_INTERVAL seconds, or sooner
+#once FLUSH_DIRTY_COUNT runs have been appended since the last compaction.
+FLUSH_INTERVAL = 30.0
+FLUSH_DIRTY_COUNT = 5000
+
+#Number of counter shards. Each thread is pinned to one shard, so job threads
+#rarely contend with each other when recording a run.
+SHARD_COUNT = 16
+
+#How many per-minute buckets of history each job keeps for the dashboard
+WINDOW_MINUTES = RETENTION_MINUTES
+
+
+def _empty_entry():
+    return {"runs": 0, "total_duration": 0.0, "errors": 0}
+
+
+def _atomic_write_json(path, data):
+    """Write data as JSON to a temp file next to path, then rename it into place.
+    Readers (e.g. the dashboard) never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".stats-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class _Totals:
+    """
+    Everything the stats layer knows about a set of jobs: run/duration/error
+    counters, a latency histogram and a rolling per-minute window per job.
+    All three parts merge, so shards, journal replays and snapshots combine
+    the same way.
+    """
+    __slots__ = ("counters", "histograms", "windows", "window_size")
+
+    def __init__(self, window_size=WINDOW_MINUTES):
+        self.counters = {}
+        self.histograms = {}
+        self.windows = {}
+        self.window_size = window_size
+
+    def _entry(self, job_type):
+        entry = self.counters.get(job_type)
+        if entry is None:
+            entry = self.counters[job_type] = _empty_entry()
+        return entry
+
+    def _histogram(self, job_type):
+        hist = self.histograms.get(job_type)
+        if hist is None:
+            hist = self.histograms[job_type] = LatencyHistogram()
+        return hist
+
+    def _window(self, job_type):
+        window = self.windows.get(job_type)
+        if window is None:
+            window = self.windows[job_type] = RollingWindow(self.window_size)
+        return window
+
+    def add(self, job_type, duration, error, start_time):
+        """Count one run."""
+        entry = self._entry(job_type)
+        entry["runs"] = entry.get("runs", 0) + 1
+        entry["total_duration"] = entry.get("total_duration", 0.0) + duration
+        if error:
+            entry["errors"] = entry.get("errors", 0) + 1
+        self._histogram(job_type).record(duration)
+        self._window(job_type).record(start_time, duration, error)
+
+    def apply_record(self, record):
+        """Count one journal record."""
+        self.add(record.job_id, record.duration, record.error, record.start_time)
+
+    def merge(self, other):
+        """Add every counter, histogram and window of other into this one."""
+        for job_type, other_entry in other.counters.items():
+            entry = self._entry(job_type)
+            entry["runs"] = entry.get("runs", 0) + other_entry.get("runs", 0)
+            entry["total_duration"] = entry.get("total_duration", 0.0) + other_entry.get("total_duration", 0.0)
+            entry["errors"] = entry.get("errors", 0) + other_entry.get("errors", 0)
+        for job_type, hist in other.histograms.items():
+            self._histogram(job_type).merge(hist)
+        for job_type, window in other.windows.items():
+            self._window(job_type).merge(window)
+        return self
+
+    def copy(self):
+        totals = _Totals(self.window_size)
+        #Keep every counter field, including ones this module does not manage
+        totals.counters = {k: dict(v) for k, v in self.counters.items()}
+        for job_type, hist in self.histograms.items():
+            totals.histograms[job_type] = LatencyHistogram().merge(hist)
+        for job_type, window in self.windows.items():
+            totals.windows[job_type] = RollingWindow(self.window_size).merge(window)
+        return totals
+
+    def resize_windows(self, size):
+        self.window_size = size
+        self.windows = {k: w.resized(size) for k, w in self.windows.items()}
+
+    def to_json(self, summary=False):
+        """Return the stats.json form. With summary, jobs also get p50/p95/p99 and
+        the rolling windows are left out (they are read via get_timeseries())."""
+        result = {}
+        for job_type, entry in self.counters.items():
+            entry = dict(entry)
+            hist = self.histograms.get(job_type)
+            if hist is not None:
+                entry[HISTOGRAM_KEY] = hist.to_dict()
+                if summary:
+                    entry.update(hist.summary())
+            window = self.windows.get(job_type)
+            if window is not None and not summary:
+                entry[WINDOW_KEY] = window.to_list()
+            result[job_type] = entry
+        return result
+
+    @classmethod
+    def from_json(cls, data, window_size=WINDOW_MINUTES):
+        """Build totals from a stats.json dict (reserved keys already removed)."""
+        totals = cls(window_size)
+        for job_type, entry in data.items():
+            if not isinstance(entry, dict):
+                continue
+            entry = dict(entry)
+            hist_data = entry.pop(HISTOGRAM_KEY, None)
+            window_data = entry.pop(WINDOW_KEY, None)
+            totals.counters[job_type] = entry
+            try:
+                if hist_data is not None:
+                    totals.histograms[job_type] = LatencyHistogram.from_dict(hist_data)
+                if window_data is not None:
+                    totals.windows[job_type] = RollingWindow.from_list(window_data, window_size)
+            except (ValueError, TypeError, IndexError) as e:
+                print(f"Discarding unreadable latency data for {job_type}: {e}")
+        return totals
+
+
+def read_snapshot(path, window_size=WINDOW_MINUTES):
+    """Load stats.json and split off the journal generation it covers."""
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+    except Exception:
+        snapshot = {}
+    generation = snapshot.pop(JOURNAL_KEY, {}).get("generation", 0)
+    return _Totals.from_json(snapshot, window_size), generation
+
+
+def snapshot_generation(path):
+    """The journal generation stats.json covers, read from the end of the file. Falls back
+    to read_snapshot() for a file laid out differently (e.g. without JOURNAL_KEY)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - SNAPSHOT_TAIL_BYTES, 0))
+            match = _GENERATION_TAIL.search(f.read())
+    except OSError:
+        return 0
+    if match is not None:
+        return int(match.group(1))
+    return read_snapshot(path)[1]
+
+
+class _Shard:
+    """A slice of the pending totals plus the lock that guards it."""
+    __slots__ = ("lock", "pending")
+
+    def __init__(self, window_size):
+        self.lock = threading.Lock()
+        self.pending = _Totals(window_size)
+
+
+class StatsAggregator:
+    """
+    Resident in-process stats aggregator backed by an append-only run journal.
+
+    Every run is appended to the journal as one fixed-size record, then added
+    to a per-thread shard (counters, latency histogram and rolling window) for
+    in-memory reads. A background thread periodically compacts the journal:
+    it seals the active segment and folds the sealed records into the
+    stats.json snapshot (written with an atomic rename). On restart only the
+    segments the snapshot does not cover yet are replayed.
+    """
+
+    def __init__(self, path=STATS_FILE, journal=None, flush_interval=FLUSH_INTERVAL,
+                 flush_dirty_count=FLUSH_DIRTY_COUNT, shard_count=SHARD_COUNT,
+                 window_minutes=WINDOW_MINUTES):
+        self.path = path
+        self.journal = journal if journal is not None else RunJournal()
+        self.flush_interval = flush_interval
+        self.flush_dirty_count = flush_dirty_count
+        self.window_minutes = window_minutes
+        self._shards = [_Shard(window_minutes) for _ in range(shard_count)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+        self._updates = itertools.count(1)
+        self._flushed_mark = 0
+        self._snapshot = None
+        self._generation = 0
+        self._totals = None
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._listeners = []
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._shards[next(self._next_shard) % len(self._shards)]
+            self._local.shard = shard
+        return shard
+
+    def _read_from_disk(self):
+        """Return (snapshot, totals, generation): the stats.json snapshot, and the
+        snapshot plus every journal record it does not cover yet."""
+        snapshot, generation = read_snapshot(self.path, self.window_minutes)
+        totals = snapshot.copy()
+        for record in self.journal.replay(generation):
+            totals.apply_record(record)
+        return snapshot, totals, generation
+
+    def _ensure_loaded(self):
+        """Load the snapshot and replay the journal tail once. Afterwards the
+        in-memory totals are authoritative for this process."""
+        with lock:
+            if self._totals is None:
+                snapshot, totals, generation = self._read_from_disk()
+                self.journal.reserve(generation)
+                self._snapshot = snapshot
+                self._generation = generation
+                self._totals = totals
+                for listener in self._listeners:
+                    listener(set(), True)
+            return self._totals
+
+    def record(self, job_type, duration=0.0, error=False, start_time=None):
+        """Append one run of job_type to the journal and this thread's shard."""
+        if self._totals is None:
+            self._ensure_loaded()
+        if start_time is None:
+            start_time = time.time() - duration
+        self.journal.append(job_type, start_time, duration, error)
+        shard = self._shard()
+        with shard.lock:
+            shard.pending.add(job_type, duration, error, start_time)
+        if self._thread is None:
+            self.start()
+        if next(self._updates) - self._flushed_mark >= self.flush_dirty_count:
+            self._wake.set()
+
+    def _take_pending(self, shard):
+        with shard.lock:
+            pending, shard.pending = shard.pending, _Totals(self.window_minutes)
+        return pending
+
+    def _drain_shards(self):
+        """Swap out every shard's pending totals, fold them into the totals and tell the
+        listeners which jobs changed. A reload() meanwhile drops them (the journal has them)."""
+        changed = set()
+        for shard in self._shards:
+            pending = self._take_pending(shard)
+            if pending.counters:
+                with lock:
+                    if self._totals is None:
+                        return
+                    self._totals.merge(pending)
+                changed.update(pending.counters)
+        if changed and self._listeners:
+            with lock:
+                if self._totals is not None:
+                    for listener in self._listeners:
+                        listener(changed, False)
+
+    def refresh(self):
+        """Fold the runs recorded since the last drain into the totals, so the listeners
+        hear about them now rather than at the next compaction. Costs O(changed jobs)."""
+        self._ensure_loaded()
+        self._drain_shards()
+
+    def add_listener(self, listener):
+        """Call listener(changed_jobs, reloaded) whenever runs are folded into the totals;
+        reloaded means the totals were (re)loaded from disk, so every job may have changed.
+        Runs under the stats lock, where totals() may be used. A listener added after the
+        totals were loaded is called with reloaded=True straight away."""
+        with lock:
+            self._listeners.append(listener)
+            if self._totals is not None:
+                listener(set(), True)
+
+    def totals(self):
+        """The in-memory totals, without the runs still in the shards. Read-only, and only
+        consistent under the stats lock (e.g. from a listener)."""
+        return self._totals
+
+    def flush(self):
+        """Compact the journal: fold every sealed segment into the stats.json snapshot."""
+        with self._flush_lock:
+            self._flushed_mark = next(self._updates)
+            self._ensure_loaded()
+            self._drain_shards()
+            boundary = self.journal.rotate()
+            if boundary <= self._generation:
+                return
+            for record in self.journal.replay(self._generation, boundary):
+                self._snapshot.apply_record(record)
+            data = self._snapshot.to_json()
+            data[JOURNAL_KEY] = {"generation": boundary}
+            with lock:
+                _atomic_write_json(self.path, data)
+            self._generation = boundary
+            self.journal.prune(boundary)
+
+    def current(self):
+        """Return a private copy of the current totals.
+
+        In the process that records runs this is the in-memory view, including
+        runs that have not been compacted yet. Other processes (e.g. the
+        dashboard) read the stats.json snapshot and replay the journal tail."""
+        if not self.journal.is_open and self._thread is None:
+            return self._read_from_disk()[1]
+        self._ensure_loaded()
+        with lock:
+            merged = self._totals.copy()
+        for shard in self._shards:
+            with shard.lock:
+                pending = shard.pending.copy()
+            merged.merge(pending)
+        return merged
+
+    def snapshot(self):
+        """Return the current totals, with p50/p95/p99 latencies and the
+        mergeable histogram for every job that has recorded runs."""
+        return self.current().to_json(summary=True)
+
+    def timeseries(self, job_type=None, minutes=None, now=None):
+        """Return per-minute runs/errors/duration series for one job or all jobs."""
+        totals = self.current()
+        now = time.time() if now is None else now
+        if job_type is not None:
+            window = totals.windows.get(job_type)
+            return window.series(now, minutes) if window is not None else []
+        return {k: w.series(now, minutes) for k, w in totals.windows.items()}
+
+    def set_window_minutes(self, minutes):
+        """Change the rolling window retention, keeping the newest buckets."""
+        with self._flush_lock:
+            self.window_minutes = minutes
+            with lock:
+                for totals in (self._totals, self._snapshot):
+                    if totals is not None:
+                        totals.resize_windows(minutes)
+            for shard in self._shards:
+                with shard.lock:
+                    shard.pending.resize_windows(minutes)
+
+    def history(self, job_type=None, limit=100):
+        """Return up to limit of the most recent runs still in the journal, newest first."""
+        runs = []
+        for generation in reversed(self.journal.generations()):
+            records = [r for r in self.journal.read_segment(generation)
+                       if job_type is None or r.job_id == job_type]
+            runs.extend(reversed(records))
+            if len(runs) >= limit:
+                break
+        return runs[:limit]
+
+    def reload(self):
+        """Forget the in-memory totals so the next read goes back to disk.
+        Pending shard counts are dropped too, since the journal replay covers them."""
+        with self._flush_lock:
+            for shard in self._shards:
+                self._take_pending(shard)
+            with lock:
+                self._totals = None
+
+    def start(self):
+        """Start the background compaction thread if it is not already running."""
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stats-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to compact stats journal: {e}")
+
+    def stop(self):
+        """Stop the compaction thread, compact one last time and close the journal."""
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+        self.flush()
+        self.journal.close()
+
+
+#Process-wide aggregator used by update_stat() and get_stats()
+aggregator = StatsAggregator()
+
+
+def configure(flush_interval=None, flush_dirty_count=None, window_minutes=None):
+    """Change how often the aggregator flushes to disk and how many minutes of
+    per-minute history each job keeps."""
+    if flush_interval is not None:
+        aggregator.flush_interval = flush_interval
+    if flush_dirty_count is not None:
+        aggregator.flush_dirty_count = flush_dirty_count
+    if window_minutes is not None:
+        aggregator.set_window_minutes(window_minutes)
+    aggregator._wake.set()
+
+
+def initialize_stats(job_keys=()):
     """Initialize the stats file if it does not exist.
-    Function creates a baseline for all job metrics."""
-    if not os.path.exists("stats.json"):
-        stats = {
-            # Time-based jobs
-            "time_based_system_monitor": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_log_rotation": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_backup": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_update_check": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_security_scan": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_clean_temp": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_status_report": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_db_cleanup": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_ping_test": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_log_disk_usage": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_resource_trend": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_memory_leak_detector": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_log_file_analysis": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_service_health_check": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "time_based_temperature_monitoring": {"runs": 0, "total_duration": 0.0, "errors": 0},
-
-            # Event-based jobs
-            "event_based_generic": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_click": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "file_created": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "file_modified": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "file_deleted": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "file_moved": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_config_change": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_usb_insertion": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_usb_removal": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_user_event": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_trigger_file": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_keyword_alert": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_config_backup": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_network_change": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_temp_exceeded": {"runs": 0, "total_duration": 0.0, "errors": 0},
-            "event_based_disk_low": {"runs": 0, "total_duration": 0.0, "errors": 0}
-        }
-        with open(STATS_FILE, "w") as f:
-            json.dump(stats, f)
-
-
-def update_stat(job_type, duration=0.0, error=False):
+    Function creates a baseline for all job metrics: one entry per job key, which
+    normally comes from the job config (see job_config.configured_stats_keys)."""
+    if not os.path.exists(STATS_FILE):
+        stats = {job_key: _empty_entry() for job_key in job_keys}
+        with lock:
+            _atomic_write_json(STATS_FILE, stats)
+        aggregator.reload()
+
+
+def update_stat(job_type, duration=0.0, error=False, start_time=None):
     """
     Update statistics for a given job.
-    This function opens the stats.json file, updates the run count, duration,
-    and increments the error count if error is True.
+    The run is appended to the run journal and added to the in-memory
+    aggregator; the background compaction folds it into stats.json later.
 
     Args:
         job_type (str): The key for the job in the stats structure.
         duration (float): The execution duration in seconds.
         error (bool): True if the job encountered an error.
+        start_time (float, optional): Epoch time the run started. Defaults to now - duration.
     """
-    with lock:
-        try:
-            with open(STATS_FILE, "r") as f:
-                stats = json.load(f)
-        except Exception as e:
-            stats = {}
-        #Update or create the key for the given job_type
-        if job_type in stats:
-            stats[job_type]["runs"] += 1
-            stats[job_type]["total_duration"] += duration
-            if error:
-                stats[job_type]["errors"] += 1
-        else:
-            stats[job_type] = {"runs": 1, "total_duration": duration, "errors": 1 if error else 0}
-        with open(STATS_FILE, "w") as f:
-            json.dump(stats, f)
-
-    def prune_stats(max_entries=500): #prevent infinite growth
-        """ Keep only the most recent max_entries keys or timestamps """
-        with lock:
-            stats = json.load(open(STATS_FILE))
-            if len(stats) > max_entries:
-                # example: sort by timestamp key if you stored timestamps
-                keys_to_keep = sorted(stats, key=lambda k: stats[k]['last_run_ts'], reverse=True)[:max_entries]
-                stats = {k: stats[k] for k in keys_to_keep}
-                with open(STATS_FILE, 'w') as f:
-                    json.dump(stats, f)
+    aggregator.record(job_type, duration=duration, error=error, start_time=start_time)
+
+
+def flush_stats():
+    """Compact the run journal into stats.json right away."""
+    aggregator.flush()
+
+
+def get_run_history(job_type=None, limit=100):
+    """Return the most recent individual runs (newest first) kept in the run journal."""
+    return aggregator.history(job_type, limit)
+
+
+def get_timeseries(job_type=None, minutes=None):
+    """
+    Return per-minute metrics from the rolling window, oldest first.
+
+    Each point is {"time", "runs", "errors", "duration_sum", "duration_max"}.
+    With job_type, returns that job's list; otherwise a dict of lists per job.
+
+    Args:
+        job_type (str, optional): The key for the job in the stats structure.
+        minutes (int, optional): How many recent minutes to return. Defaults to the full retention.
+    """
+    return aggregator.timeseries(job_type, minutes)
+
+
+def shutdown():
+    """Stop the background compaction and do a final one. Called on scheduler exit."""
+    aggregator.stop()
 
 
 def get_stats():
-    """Return the current statistics from the stats.json file.
-    If the file doesn't exist, it initializes it first"""
-    with lock:
-        if not os.path.exists(STATS_FILE):
-            initialize_stats()
-        with open(STATS_FILE, "r") as f:
-            stats = json.load(f)
-    return stats
+    """Return the current statistics: the stats.json snapshot plus the journal tail.
+    Jobs with recorded runs also carry p50/p95/p99 latencies (seconds) and their
+    serialized histogram. If the file doesn't exist, it initializes it first"""
+    if not os.path.exists(STATS_FILE):
+        initialize_stats()
+    return aggregator.snapshot()
 
 if __name__ == "__main__":
-    initialize_stats()
+    from job_config import configured_stats_keys
+    initialize_stats(configured_stats_keys())
     print("Stats initialized.")
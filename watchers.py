@@ -0,0 +1,477 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, DirModifiedEvent, DirMovedEvent,
+    FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent,
+)
+from dir_index import DirectorySnapshotIndex
+from poller import get_poller
+
+#Default cap on inotify watches (one per directory) across all roots. The kernel
+#limit (fs.inotify.max_user_watches) also applies; hitting either one makes the
+#affected root fall back to the polling backend.
+MAX_WATCHES = 8192
+
+#Polling interval (seconds) for roots served by the polling backend
+POLL_INTERVAL = 10
+
+#inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify_libc():
+    """Return libc with the inotify functions, or None if they are not available."""
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith("linux"):
+            return None
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return None
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def inotify_available():
+    return _inotify_libc() is not None
+
+
+class WatchBudgetExceeded(Exception):
+    """Raised when a root needs more inotify watches than are available."""
+
+
+def _created(path, is_dir):
+    return DirCreatedEvent(path) if is_dir else FileCreatedEvent(path)
+
+
+def _diff_events(root, diff):
+    """Turn a DirectorySnapshotIndex diff into watchdog events."""
+    events = []
+    for rel in diff.added:
+        path = os.path.join(root, rel)
+        events.append(_created(path, os.path.isdir(path)))
+    for rel in diff.removed:
+        events.append(FileDeletedEvent(os.path.join(root, rel)))
+    for rel in diff.modified:
+        path = os.path.join(root, rel)
+        events.append(DirModifiedEvent(path) if rel.endswith(os.sep) else FileModifiedEvent(path))
+    return events
+
+
+class PollingBackend:
+    """
+    Scan-based watcher: each root gets a DirectorySnapshotIndex target on the
+    shared poller engine, and every diff is turned into watchdog-style events.
+    Works everywhere and needs no kernel resources.
+    """
+    name = "polling"
+
+    def __init__(self, handler, roots, interval=POLL_INTERVAL, engine=None):
+        self.handler = handler
+        self.roots = list(roots)
+        self.interval = interval
+        self.engine = engine
+        self.events = 0
+
+    def start(self):
+        for root in self.roots:
+            self.add_root(root)
+
+    def add_root(self, root, index=None):
+        if index is None:
+            index = DirectorySnapshotIndex(root, state_path=os.devnull)
+            index.scan()
+        if root not in self.roots:
+            self.roots.append(root)
+
+        def check():
+            events = _diff_events(root, index.scan())
+            return events or None
+
+        (self.engine or get_poller()).register(f"watch:{root}", self.interval, check, self._emit)
+
+    def _emit(self, events):
+        for event in events:
+            self.events += 1
+            self.handler.dispatch(event)
+
+    def stop(self):
+        for root in self.roots:
+            (self.engine or get_poller()).unregister(f"watch:{root}")
+
+    def metrics(self):
+        return {"backend": self.name, "roots": len(self.roots), "events": self.events}
+
+
+class _InotifyRoot:
+    """One inotify instance watching every directory under one root."""
+
+    def __init__(self, libc, root):
+        self.libc = libc
+        self.root = root
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}
+        self.wds = {}
+        self.index = DirectorySnapshotIndex(root, state_path=os.devnull)
+
+    def add_watch(self, path, backend):
+        if path in self.wds:
+            return self.wds[path]
+        if not backend.reserve_watch():
+            raise WatchBudgetExceeded(f"watch budget of {backend.max_watches} reached")
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            backend.release_watch()
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchBudgetExceeded("kernel inotify watch limit reached")
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return None
+            raise OSError(err, os.strerror(err), path)
+        if wd in self.paths:
+            #Already watched under another name (inotify returns the existing descriptor)
+            backend.release_watch()
+            self.wds.pop(self.paths[wd], None)
+        self.paths[wd] = path
+        self.wds[path] = wd
+        return wd
+
+    def forget(self, wd):
+        path = self.paths.pop(wd, None)
+        if path is not None and self.wds.get(path) == wd:
+            del self.wds[path]
+        return path is not None
+
+    def add_tree(self, path, backend):
+        """Watch path and every directory below it. Returns the entries found
+        inside, so a freshly created directory's contents are not missed."""
+        found = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            self.add_watch(current, backend)
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        found.append((entry.path, is_dir))
+                        if is_dir:
+                            stack.append(entry.path)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                pass
+        return found
+
+    def rename_prefix(self, old, new):
+        prefix = os.path.join(old, "")
+        for wd, path in list(self.paths.items()):
+            if path == old:
+                renamed = new
+            elif path.startswith(prefix):
+                renamed = os.path.join(new, path[len(prefix):])
+            else:
+                continue
+            self.wds.pop(path, None)
+            self.paths[wd] = renamed
+            self.wds[renamed] = wd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class InotifyBackend:
+    """
+    Linux inotify watcher for one or more roots.
+
+    Each root has its own inotify instance, so an IN_Q_OVERFLOW tells us which
+    root lost events; that root is then rescanned against its snapshot index
+    and the differences are emitted, so nothing is silently lost (events around
+    an overflow may be reported twice). The index is kept current by
+    re-reading the directories each batch of events touched, so the overflow
+    diff, and a hand-over to polling, only report what was actually missed.
+    Watches are capped by max_watches and by the kernel limit; a root that
+    does not fit falls back to polling.
+    """
+    name = "inotify"
+
+    def __init__(self, handler, roots, max_watches=MAX_WATCHES, poll_interval=POLL_INTERVAL, engine=None):
+        self.libc = _inotify_libc()
+        if self.libc is None:
+            raise OSError("inotify is not available on this platform")
+        self.handler = handler
+        self.roots = list(roots)
+        self.max_watches = max_watches
+        self.fallback = PollingBackend(handler, [], interval=poll_interval, engine=engine)
+        self._instances = {}
+        self._watch_count = 0
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = None
+        self._stopped = False
+        self.events = 0
+        self.overflows = 0
+        self.rescans = 0
+
+    def reserve_watch(self):
+        with self._lock:
+            if self._watch_count >= self.max_watches:
+                return False
+            self._watch_count += 1
+            return True
+
+    def release_watch(self, count=1):
+        with self._lock:
+            self._watch_count -= count
+
+    def start(self):
+        for root in self.roots:
+            self._add_root(root)
+        self._thread = threading.Thread(target=self._run, name="inotify-watcher", daemon=True)
+        self._thread.start()
+
+    def _add_root(self, root):
+        instance = _InotifyRoot(self.libc, root)
+        instance.index.scan()
+        try:
+            instance.add_tree(root, self)
+        except WatchBudgetExceeded as e:
+            print(f"inotify budget exhausted on {root} ({e}); falling back to polling")
+            self._drop(instance)
+            self.fallback.add_root(root, instance.index)
+            return
+        with self._lock:
+            self._instances[instance.fd] = instance
+        os.write(self._wake_w, b"x")
+
+    def _drop(self, instance):
+        self.release_watch(len(instance.paths))
+        instance.close()
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._wake_r, select.POLLIN)
+        registered = set()
+        while not self._stopped:
+            with self._lock:
+                fds = set(self._instances)
+            for fd in fds - registered:
+                poller.register(fd, select.POLLIN)
+            for fd in registered - fds:
+                poller.unregister(fd)
+            registered = fds
+            for fd, _ in poller.poll():
+                if fd == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                with self._lock:
+                    instance = self._instances.get(fd)
+                if instance is not None:
+                    self._read(instance)
+
+    def _read(self, instance):
+        data = b""
+        while True:
+            try:
+                chunk = os.read(instance.fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        events = []
+        moves = {}
+        touched = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.overflows += 1
+                self._rescan(instance)
+                continue
+            directory = instance.paths.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                if instance.forget(wd):
+                    self.release_watch()
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            is_dir = bool(mask & IN_ISDIR)
+            touched.add(directory)
+            if mask & IN_CREATE:
+                events.append(_created(path, is_dir))
+                if is_dir:
+                    events.extend(self._watch_new_dir(instance, path))
+            elif mask & IN_DELETE:
+                events.append(DirDeletedEvent(path) if is_dir else FileDeletedEvent(path))
+            elif mask & (IN_MODIFY | IN_ATTRIB):
+                events.append(DirModifiedEvent(path) if is_dir else FileModifiedEvent(path))
+            elif mask & IN_MOVED_FROM:
+                moves[cookie] = (len(events), path, is_dir)
+                events.append(None)
+            elif mask & IN_MOVED_TO:
+                source = moves.pop(cookie, None)
+                if source is None:
+                    #Moved in from outside the watched tree
+                    events.append(_created(path, is_dir))
+                    if is_dir:
+                        events.extend(self._watch_new_dir(instance, path))
+                else:
+                    position, src_path, _ = source
+                    events[position] = DirMovedEvent(src_path, path) if is_dir else FileMovedEvent(src_path, path)
+                    if is_dir:
+                        instance.rename_prefix(src_path, path)
+        #Moved out of the watched tree: report as deleted
+        for position, src_path, is_dir in moves.values():
+            events[position] = DirDeletedEvent(src_path) if is_dir else FileDeletedEvent(src_path)
+        if touched:
+            instance.index.update(self._relative(instance.root, path) for path in touched)
+        self._emit([event for event in events if event is not None])
+
+    @staticmethod
+    def _relative(root, path):
+        rel = os.path.relpath(path, root)
+        return "" if rel == os.curdir else rel
+
+    def _watch_new_dir(self, instance, path):
+        try:
+            found = instance.add_tree(path, self)
+        except WatchBudgetExceeded as e:
+            print(f"inotify budget exhausted under {instance.root} ({e}); falling back to polling")
+            with self._lock:
+                self._instances.pop(instance.fd, None)
+            self._drop(instance)
+            self.fallback.add_root(instance.root, instance.index)
+            return []
+        return [_created(entry_path, is_dir) for entry_path, is_dir in found]
+
+    def _rescan(self, instance):
+        """After a queue overflow: diff the root against its index, re-add any
+        missing watches and emit what changed."""
+        self.rescans += 1
+        events = _diff_events(instance.root, instance.index.scan())
+        try:
+            instance.add_tree(instance.root, self)
+        except WatchBudgetExceeded:
+            with self._lock:
+                self._instances.pop(instance.fd, None)
+            self._drop(instance)
+            self.fallback.add_root(instance.root, instance.index)
+        self._emit(events)
+
+    def _emit(self, events):
+        for event in events:
+            self.events += 1
+            try:
+                self.handler.dispatch(event)
+            except Exception as e:
+                print(f"File event handler failed for {event.src_path}: {e}")
+
+    def stop(self):
+        self._stopped = True
+        os.write(self._wake_w, b"x")
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            instances, self._instances = list(self._instances.values()), {}
+        for instance in instances:
+            instance.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self.fallback.stop()
+
+    def metrics(self):
+        with self._lock:
+            watches = self._watch_count
+            roots = len(self._instances)
+        return {
+            "backend": self.name,
+            "roots": roots,
+            "watches": watches,
+            "max_watches": self.max_watches,
+            "events": self.events,
+            "overflows": self.overflows,
+            "rescans": self.rescans,
+            "fallback_roots": len(self.fallback.roots),
+        }
+
+
+class WatchdogBackend:
+    """The Watchdog Observer, for platforms without inotify."""
+    name = "watchdog"
+
+    def __init__(self, handler, roots):
+        from watchdog.observers import Observer
+        self.handler = handler
+        self.roots = list(roots)
+        self.observer = Observer()
+        self.events = 0
+
+    def start(self):
+        for root in self.roots:
+            self.observer.schedule(self.handler, path=root, recursive=True)
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+    def metrics(self):
+        return {"backend": self.name, "roots": len(self.roots)}
+
+
+BACKENDS = {
+    "inotify": InotifyBackend,
+    "polling": PollingBackend,
+    "watchdog": WatchdogBackend,
+}
+
+
+def create_backend(handler, roots, backend="auto", **options):
+    """Build a watcher backend by name. "auto" uses inotify where available,
+    otherwise the Watchdog observer."""
+    if backend == "auto":
+        backend = "inotify" if inotify_available() else "watchdog"
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown watcher backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return cls(handler, roots, **options)